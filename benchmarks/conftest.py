@@ -0,0 +1,72 @@
+import os
+import sys
+from pathlib import Path
+from shutil import copytree
+from typing import Callable, Dict, Iterator
+
+import pytest
+from loguru import logger
+
+from synthetic_tree import SyntheticTree, generate_app
+
+# number of libraries in generated apps, e.g. BENCHMARK_SIZES=100,1000
+BENCHMARK_SIZES = [
+    int(size) for size in os.environ.get("BENCHMARK_SIZES", "100,1000,3000").split(",")
+]
+
+
+def pytest_generate_tests(metafunc: pytest.Metafunc) -> None:
+    if "tree_size" in metafunc.fixturenames:
+        metafunc.parametrize("tree_size", BENCHMARK_SIZES, scope="session")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def quiet_logger() -> Iterator[None]:
+    # logging of every file dominates time of small operations
+    logger.remove()
+    yield
+    logger.add(sys.stderr)
+
+
+@pytest.fixture(scope="session")
+def synthetic_trees() -> Dict[int, SyntheticTree]:
+    # trees are generated on first use and shared by all benchmarks of the same size
+    return {}
+
+
+@pytest.fixture
+def synthetic_tree(
+    tree_size: int,
+    synthetic_trees: Dict[int, SyntheticTree],
+    tmp_path_factory: pytest.TempPathFactory,
+) -> SyntheticTree:
+    """Generated tree, that must not be modified by the benchmark."""
+    if tree_size not in synthetic_trees:
+        synthetic_trees[tree_size] = generate_app(
+            tmp_path_factory.mktemp(f"tree{tree_size}"), tree_size
+        )
+    return synthetic_trees[tree_size]
+
+
+@pytest.fixture
+def tree_copy(
+    synthetic_tree: SyntheticTree, tmp_path_factory: pytest.TempPathFactory
+) -> Callable[[], SyntheticTree]:
+    """Factory of fresh copies of the tree for benchmarks, that modify it."""
+
+    def copy_tree() -> SyntheticTree:
+        root = tmp_path_factory.mktemp("copy")
+        copytree(synthetic_tree.app_path, root / "app", symlinks=True)
+
+        def relocated(path: Path) -> Path:
+            return root / "app" / path.relative_to(synthetic_tree.app_path)
+
+        return SyntheticTree(
+            root / "app",
+            synthetic_tree.qt_path,
+            root / "app" / "qml",
+            [relocated(path) for path in synthetic_tree.executables],
+            [relocated(path) for path in synthetic_tree.libraries],
+        )
+
+    return copy_tree
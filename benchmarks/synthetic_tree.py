@@ -0,0 +1,336 @@
+"""Generator of synthetic application trees for benchmarks.
+
+ELF files are written directly, without compiler: they contain only what dynamic
+linking tools read (program headers, dynamic section, dynamic string table and
+section headers), so that thousands of them are generated in a second.
+"""
+import os
+import random
+import struct
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+EM_X86_64 = 62
+ET_DYN = 3
+PT_LOAD = 1
+PT_DYNAMIC = 2
+PT_INTERP = 3
+SHT_PROGBITS = 1
+SHT_STRTAB = 3
+SHT_DYNAMIC = 6
+SHF_ALLOC = 2
+DT_NULL = 0
+DT_NEEDED = 1
+DT_STRTAB = 5
+DT_STRSZ = 10
+DT_SONAME = 14
+DT_RUNPATH = 29
+DT_FLAGS_1 = 0x6FFFFFFB
+DF_1_PIE = 0x08000000
+
+_EHDR = struct.Struct("<16sHHIQQQIHHHHHH")
+_PHDR = struct.Struct("<IIQQQQQQ")
+_SHDR = struct.Struct("<IIQQQQIIQQ")
+_DYN = struct.Struct("<qQ")
+INTERPRETER = "/lib64/ld-linux-x86-64.so.2"
+QT_MODULES = ["Core", "Gui", "Network", "Qml", "Quick", "Sql", "Svg", "XcbQpa"]
+
+
+def _align(value: int, alignment: int = 8) -> int:
+    return (value + alignment - 1) & ~(alignment - 1)
+
+
+def write_elf(
+    path: Path,
+    needed: Sequence[str] = (),
+    soname: Optional[str] = None,
+    runpath: Optional[str] = None,
+    executable: bool = False,
+    payload_size: int = 4096,
+) -> None:
+    """Write minimal dynamically linked ELF64 x86-64 file."""
+    # dynamic string table: NEEDED, SONAME and RUNPATH strings
+    dynstr = b"\0"
+    string_offsets = {}
+    for string in list(needed) + [s for s in (soname, runpath) if s is not None]:
+        if string not in string_offsets:
+            string_offsets[string] = len(dynstr)
+            dynstr += string.encode() + b"\0"
+
+    interp = INTERPRETER.encode() + b"\0" if executable else b""
+    phnum = 3 if executable else 2
+    phdrs_offset = _EHDR.size
+    interp_offset = phdrs_offset + phnum * _PHDR.size
+    dynstr_offset = interp_offset + len(interp)
+    payload_offset = _align(dynstr_offset + len(dynstr))
+    dynamic_offset = _align(payload_offset + payload_size)
+
+    dynamic = [(DT_NEEDED, string_offsets[name]) for name in needed]
+    if soname is not None:
+        dynamic.append((DT_SONAME, string_offsets[soname]))
+    if runpath is not None:
+        dynamic.append((DT_RUNPATH, string_offsets[runpath]))
+    dynamic += [(DT_STRTAB, dynstr_offset), (DT_STRSZ, len(dynstr))]
+    if executable:
+        dynamic.append((DT_FLAGS_1, DF_1_PIE))
+    dynamic.append((DT_NULL, 0))
+    dynamic_data = b"".join(_DYN.pack(tag, value) for tag, value in dynamic)
+
+    shstrtab = b"\0.interp\0.dynstr\0.text\0.dynamic\0.shstrtab\0"
+    shstrtab_offset = dynamic_offset + len(dynamic_data)
+    shdrs_offset = _align(shstrtab_offset + len(shstrtab))
+    file_size = shdrs_offset + 6 * _SHDR.size
+
+    def name_offset(name: str) -> int:
+        return shstrtab.index(name.encode() + b"\0")
+
+    sections = [
+        _SHDR.pack(0, 0, 0, 0, 0, 0, 0, 0, 0, 0),
+        _SHDR.pack(
+            name_offset(".interp"),
+            SHT_PROGBITS,
+            SHF_ALLOC,
+            interp_offset,
+            interp_offset,
+            len(interp),
+            0,
+            0,
+            1,
+            0,
+        ),
+        _SHDR.pack(
+            name_offset(".dynstr"),
+            SHT_STRTAB,
+            SHF_ALLOC,
+            dynstr_offset,
+            dynstr_offset,
+            len(dynstr),
+            0,
+            0,
+            1,
+            0,
+        ),
+        _SHDR.pack(
+            name_offset(".text"),
+            SHT_PROGBITS,
+            SHF_ALLOC,
+            payload_offset,
+            payload_offset,
+            payload_size,
+            0,
+            0,
+            16,
+            0,
+        ),
+        _SHDR.pack(
+            name_offset(".dynamic"),
+            SHT_DYNAMIC,
+            SHF_ALLOC,
+            dynamic_offset,
+            dynamic_offset,
+            len(dynamic_data),
+            2,
+            0,
+            8,
+            _DYN.size,
+        ),
+        _SHDR.pack(
+            name_offset(".shstrtab"), SHT_STRTAB, 0, 0, shstrtab_offset, len(shstrtab), 0, 0, 1, 0
+        ),
+    ]
+
+    program_headers = []
+    if executable:
+        program_headers.append(
+            _PHDR.pack(PT_INTERP, 4, *[interp_offset] * 3, *[len(interp)] * 2, 1)
+        )
+    program_headers += [
+        _PHDR.pack(PT_LOAD, 5, 0, 0, 0, shstrtab_offset, shstrtab_offset, 0x1000),
+        _PHDR.pack(PT_DYNAMIC, 6, *[dynamic_offset] * 3, *[len(dynamic_data)] * 2, 8),
+    ]
+    header = _EHDR.pack(
+        b"\x7fELF\x02\x01\x01" + b"\0" * 9,
+        ET_DYN,
+        EM_X86_64,
+        1,
+        payload_offset,
+        phdrs_offset,
+        shdrs_offset,
+        0,
+        _EHDR.size,
+        _PHDR.size,
+        phnum,
+        _SHDR.size,
+        len(sections),
+        len(sections) - 1,
+    )
+
+    data = bytearray(file_size)
+    data[0:len(header)] = header
+    data[phdrs_offset:phdrs_offset + phnum * _PHDR.size] = b"".join(program_headers)
+    data[interp_offset:interp_offset + len(interp)] = interp
+    data[dynstr_offset:dynstr_offset + len(dynstr)] = dynstr
+    data[payload_offset:payload_offset + payload_size] = os.urandom(payload_size)
+    data[dynamic_offset:dynamic_offset + len(dynamic_data)] = dynamic_data
+    data[shstrtab_offset:shstrtab_offset + len(shstrtab)] = shstrtab
+    data[shdrs_offset:] = b"".join(sections)
+    path.write_bytes(bytes(data))
+    if executable:
+        path.chmod(0o755)
+
+
+def write_library(
+    directory: Path,
+    name: str,
+    version: str,
+    needed: Sequence[str] = (),
+    runpath: Optional[str] = None,
+    payload_size: int = 4096,
+) -> Path:
+    """Write versioned library with symlinks: libname.so.1.2.3 <- libname.so.1 <- libname.so."""
+    major = version.split(".")[0]
+    soname = f"{name}.so.{major}"
+    library = directory / f"{name}.so.{version}"
+    write_elf(library, needed, soname=soname, runpath=runpath, payload_size=payload_size)
+    for link_name in (soname, f"{name}.so"):
+        link = directory / link_name
+        if not link.exists():
+            os.symlink(library.name, link)
+    return library
+
+
+@dataclass
+class SyntheticTree:
+    app_path: Path
+    qt_path: Path
+    qml_dir: Path
+    executables: List[Path] = field(default_factory=list)
+    libraries: List[Path] = field(default_factory=list)
+
+
+def generate_qt_prefix(qt_path: Path) -> None:
+    lib_path = qt_path / "lib"
+    lib_path.mkdir(parents=True)
+    for module in QT_MODULES:
+        needed = [] if module == "Core" else ["libQt5Core.so.5"]
+        write_library(lib_path, f"libQt5{module}", "5.15.2", needed, runpath="$ORIGIN")
+
+    plugins = {
+        "platforms": ["libqxcb.so", "libqoffscreen.so", "libqeglfs.so"],
+        "imageformats": ["libqjpeg.so", "libqpng.so", "libqsvg.so", "libqgif.so"],
+        "iconengines": ["libqsvgicon.so"],
+        "platformthemes": ["libqgtk3.so"],
+        "xcbglintegrations": ["libqxcb-glx-integration.so"],
+        "sqldrivers": ["libqsqlite.so", "libqsqlpsql.so"],
+        "bearer": ["libqgenericbearer.so"],
+    }
+    for category, names in plugins.items():
+        (qt_path / "plugins" / category).mkdir(parents=True)
+        for name in names:
+            needed = ["libQt5Gui.so.5", "libQt5Core.so.5"]
+            if name == "libqxcb.so":
+                needed.append("libQt5XcbQpa.so.5")
+            write_elf(
+                qt_path / "plugins" / category / name, needed, runpath="$ORIGIN/../../lib"
+            )
+
+    for module_dir, module_name, plugin in (
+        ("QtQuick.2", "QtQuick", "qtquick2plugin"),
+        ("QtQuick/Window.2", "QtQuick.Window", "windowplugin"),
+        ("QtQuick/Controls.2", "QtQuick.Controls", "qtquickcontrols2plugin"),
+        ("QtQuick/Templates.2", "QtQuick.Templates", "qtquicktemplates2plugin"),
+        ("QtMultimedia", "QtMultimedia", "declarative_multimedia"),
+        ("QtWebEngine", "QtWebEngine", "qtwebengineplugin"),
+    ):
+        directory = qt_path / "qml" / module_dir
+        directory.mkdir(parents=True)
+        depends = "depends QtQuick.Templates 2.5\n" if module_name == "QtQuick.Controls" else ""
+        (directory / "qmldir").write_text(
+            f"module {module_name}\nplugin {plugin}\n{depends}"
+        )
+        write_elf(
+            directory / f"lib{plugin}.so",
+            ["libQt5Quick.so.5", "libQt5Qml.so.5", "libQt5Core.so.5"],
+            runpath="$ORIGIN/../../lib",
+        )
+        for index in range(5):
+            (directory / f"Item{index}.qml").write_text("import QtQuick 2.12\nItem {}\n")
+
+
+def generate_app(
+    root: Path,
+    libraries_count: int,
+    executables_count: int = 3,
+    resources_count: Optional[int] = None,
+    seed: int = 0,
+) -> SyntheticTree:
+    """Generate application with chains of libraries and fake Qt prefix.
+
+    Libraries depend on 1-3 libraries generated earlier and on Qt modules, that are not
+    in the app yet: they are found by check-linking --fix and deploy-qt in Qt prefix.
+
+    Args:
+        root (Path): directory for the app and Qt prefix
+        libraries_count (int): number of libraries in the app
+        executables_count (int): number of executables in the app
+        resources_count (Optional[int]): number of non-binary files, the same as number of
+                                         libraries by default
+        seed (int): seed of random dependencies
+
+    Returns:
+        SyntheticTree: generated tree
+    """
+    rng = random.Random(seed)
+    tree = SyntheticTree(root / "app", root / "qt", root / "app" / "qml")
+    generate_qt_prefix(tree.qt_path)
+
+    lib_path = tree.app_path / "lib"
+    lib_path.mkdir(parents=True)
+    sonames: List[str] = []
+    for index in range(libraries_count):
+        needed = rng.sample(sonames, min(len(sonames), rng.randint(1, 3)))
+        if rng.random() < 0.1:
+            needed.append(f"libQt5{rng.choice(QT_MODULES)}.so.5")
+        # part of libraries is in subdirectories, like python extension modules
+        directory = lib_path if index % 10 else lib_path / f"package{index // 100}"
+        directory.mkdir(exist_ok=True)
+        runpath: Optional[str] = "$ORIGIN" if directory == lib_path else "$ORIGIN/.."
+        if rng.random() < 0.05:
+            # broken library, that check-linking --fix repairs
+            runpath = None
+        library = write_library(
+            directory,
+            f"libmod{index}",
+            f"1.{index % 7}.0",
+            needed,
+            runpath=runpath,
+            payload_size=rng.randint(1, 16) * 1024,
+        )
+        if directory == lib_path:
+            sonames.append(f"libmod{index}.so.1")
+        tree.libraries.append(library)
+
+    bin_path = tree.app_path / "bin"
+    bin_path.mkdir()
+    for index in range(executables_count):
+        executable = bin_path / f"app{index}"
+        needed = rng.sample(sonames, min(len(sonames), 5)) + [
+            "libQt5Gui.so.5",
+            "libQt5Quick.so.5",
+            "libQt5Core.so.5",
+        ]
+        write_elf(executable, needed, runpath="$ORIGIN/../lib", executable=True)
+        tree.executables.append(executable)
+
+    share_path = tree.app_path / "share"
+    for index in range(libraries_count if resources_count is None else resources_count):
+        resource = share_path / f"dir{index // 50}" / f"resource{index}.txt"
+        resource.parent.mkdir(parents=True, exist_ok=True)
+        resource.write_text(f"resource {index}\n" * rng.randint(1, 50))
+
+    tree.qml_dir.mkdir()
+    (tree.qml_dir / "main.qml").write_text(
+        "import QtQuick 2.15\nimport QtQuick.Window 2.15\nimport QtQuick.Controls 2.15\n"
+    )
+    return tree
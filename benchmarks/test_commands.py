@@ -0,0 +1,64 @@
+from pathlib import Path
+from typing import Any, Callable
+
+from modapp_buildtools.check_linking import check_linking
+from modapp_buildtools.deploy_qt import deploy_qt
+from modapp_buildtools.predeploy import predeploy_app
+
+from synthetic_tree import SyntheticTree
+
+
+def _ignore_exit(function: Callable[..., Any], *args: Any, **kwargs: Any) -> None:
+    # commands exit with error if linking is not correct, the tree is intentionally broken
+    try:
+        function(*args, **kwargs)
+    except SystemExit:
+        pass
+
+
+def test__check_linking(benchmark, synthetic_tree: SyntheticTree, monkeypatch):
+    # Qt libraries are found outside of the app, only libraries without rpath are broken
+    monkeypatch.setenv("LD_LIBRARY_PATH", str(synthetic_tree.qt_path / "lib"))
+
+    benchmark(_ignore_exit, check_linking, synthetic_tree.app_path, use_cache=False)
+
+
+def test__check_linking__cached(benchmark, synthetic_tree: SyntheticTree, monkeypatch):
+    monkeypatch.setenv("LD_LIBRARY_PATH", str(synthetic_tree.qt_path / "lib"))
+    _ignore_exit(check_linking, synthetic_tree.app_path, use_cache=True)
+
+    benchmark(_ignore_exit, check_linking, synthetic_tree.app_path, use_cache=True)
+
+
+def test__check_linking__fix(benchmark, tree_copy: Callable[[], SyntheticTree]):
+    def setup():
+        return (check_linking, tree_copy().app_path), {"fix": True, "use_cache": False}
+
+    benchmark.pedantic(_ignore_exit, setup=setup, rounds=3)
+
+
+def test__deploy_qt(benchmark, tree_copy: Callable[[], SyntheticTree]):
+    def setup():
+        tree = tree_copy()
+        return (deploy_qt, tree.app_path, tree.qt_path), {
+            "fix": True,
+            "qml_dir": tree.qml_dir,
+            "use_cache": False,
+        }
+
+    benchmark.pedantic(_ignore_exit, setup=setup, rounds=3)
+
+
+def test__predeploy(benchmark, synthetic_tree: SyntheticTree, tmp_path_factory):
+    def setup():
+        return (synthetic_tree.app_path, tmp_path_factory.mktemp("predeploy")), {}
+
+    benchmark.pedantic(predeploy_app, setup=setup, rounds=3)
+
+
+def test__predeploy__incremental_unchanged(
+    benchmark, synthetic_tree: SyntheticTree, tmp_path: Path
+):
+    predeploy_app(synthetic_tree.app_path, tmp_path, incremental=True)
+
+    benchmark(predeploy_app, synthetic_tree.app_path, tmp_path, incremental=True)
@@ -0,0 +1,368 @@
+import os
+import shutil
+import stat
+from dataclasses import dataclass
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import List, Optional, Set
+
+from loguru import logger
+
+from modapp_buildtools import profiling
+from modapp_buildtools.command_engine import CommandError, default_jobs, run_command
+from modapp_buildtools.dependency_resolver import DependencyResolver
+from modapp_buildtools.options import Compressor
+
+MKSQUASHFS_TOOL = "mksquashfs"
+# packing of a big app with high compression level takes minutes
+MKSQUASHFS_TIMEOUT = 3600.0
+LAUNCH_TIMEOUT = 60.0
+# ranges of -Xcompression-level, xz has no levels
+COMPRESSION_LEVELS = {Compressor.ZSTD: (1, 22), Compressor.GZIP: (1, 9)}
+# block sizes supported by mksquashfs and squashfuse of the AppImage runtime
+MIN_BLOCK_SIZE = 4 * 1024
+MAX_BLOCK_SIZE = 1024 * 1024
+_SIZE_SUFFIXES = {"K": 1024, "M": 1024 * 1024}
+# priorities of mksquashfs sort file are from -32768 to 32767, files with higher priority
+# are placed first in the image
+MAX_SORT_PRIORITY = 32767
+# state and caches of buildtools, that are stored next to app directory. With
+# `--app-dir-name usr` they are in the root of AppDir, but they are not a part of the app
+BUILD_FILE_PATTERNS = [".*.predeploy.json", ".*.linking-cache.json", ".*.qml-imports.json"]
+
+
+class AppImageError(Exception):
+    pass
+
+
+@dataclass
+class AppImageResult:
+    image_path: Path
+    app_dir_size: int
+    image_size: int
+    packing_time: float
+    # None if the image was not launched or the launch failed
+    launch_time: Optional[float] = None
+
+    def log(self) -> None:
+        logger.info(
+            f"Packed {self.image_path} in {self.packing_time:.1f}s:"
+            f" {self.app_dir_size / 1024 / 1024:.1f} MiB ->"
+            f" {self.image_size / 1024 / 1024:.1f} MiB"
+        )
+        if self.launch_time is not None:
+            logger.info(f"First launch of the image took {self.launch_time:.2f}s")
+
+
+def parse_size(size: str) -> int:
+    """Parse size in the format of mksquashfs, e.g. '128K', '1M' or '4096'.
+
+    Args:
+        size (str): size with optional suffix
+
+    Returns:
+        int: size in bytes
+
+    Raises:
+        AppImageError: size has wrong format
+    """
+    multiplier = _SIZE_SUFFIXES.get(size[-1:].upper(), 1)
+    number = size[:-1] if size[-1:].upper() in _SIZE_SUFFIXES else size
+    try:
+        return int(number) * multiplier
+    except ValueError:
+        raise AppImageError(f"Invalid size: {size}") from None
+
+
+def mksquashfs_command(
+    app_dir: Path,
+    image_path: Path,
+    compressor: Compressor = Compressor.ZSTD,
+    level: Optional[int] = None,
+    block_size: int = 128 * 1024,
+    processors: Optional[int] = None,
+    sort_file: Optional[Path] = None,
+    excluded: Optional[List[str]] = None,
+) -> List[str]:
+    """Build mksquashfs command for the AppImage filesystem.
+
+    Args:
+        app_dir (Path): AppDir to pack
+        image_path (Path): output squashfs image
+        compressor (Compressor): compression algorithm
+        level (Optional[int]): compression level, default of mksquashfs if not set
+        block_size (int): block size in bytes, power of two from 4 KiB to 1 MiB
+        processors (Optional[int]): number of compressing threads, number of CPUs by default
+        sort_file (Optional[Path]): priorities of files, see `write_sort_file`
+        excluded (Optional[List[str]]): paths relative to AppDir, that are not packed
+
+    Returns:
+        List[str]: command
+
+    Raises:
+        AppImageError: invalid compression level or block size
+    """
+    if (
+        block_size < MIN_BLOCK_SIZE
+        or block_size > MAX_BLOCK_SIZE
+        or block_size & (block_size - 1) != 0
+    ):
+        raise AppImageError(
+            f"Block size must be a power of two from {MIN_BLOCK_SIZE} to {MAX_BLOCK_SIZE}"
+        )
+    command = [
+        MKSQUASHFS_TOOL,
+        str(app_dir),
+        str(image_path),
+        "-noappend",
+        "-root-owned",
+        "-no-progress",
+        "-comp",
+        compressor.value,
+        "-b",
+        str(block_size),
+        "-processors",
+        str(processors or default_jobs()),
+    ]
+    if level is not None:
+        if compressor not in COMPRESSION_LEVELS:
+            raise AppImageError(f"{compressor.value} compressor has no compression levels")
+        min_level, max_level = COMPRESSION_LEVELS[compressor]
+        if not min_level <= level <= max_level:
+            raise AppImageError(
+                f"Compression level of {compressor.value} must be from {min_level}"
+                f" to {max_level}"
+            )
+        command += ["-Xcompression-level", str(level)]
+    if sort_file is not None:
+        command += ["-sort", str(sort_file)]
+    if excluded:
+        # -e takes all remaining arguments, it must be the last option
+        command += ["-e"] + excluded
+    return command
+
+
+def _desktop_entry_value(desktop_file: Path, key: str) -> Optional[str]:
+    with open(desktop_file) as desktop:
+        for line in desktop:
+            if line.startswith(f"{key}="):
+                return line[len(key) + 1:].strip()
+    return None
+
+
+def _link(link_path: Path, target: Path) -> None:
+    os.symlink(os.path.relpath(target, link_path.parent), link_path)
+
+
+def prepare_app_dir(app_dir: Path) -> Path:
+    """Add AppRun, .desktop file and .DirIcon to the root of predeployed AppDir if missing.
+
+    They are symlinks to the executable from 'Exec' of the desktop file, the desktop file
+    in share/applications and the icon.
+
+    Args:
+        app_dir (Path): predeployed AppDir, e.g. with `--app-dir-name usr`
+
+    Returns:
+        Path: executable, that AppRun starts
+
+    Raises:
+        AppImageError: desktop file or executable not found
+    """
+    desktop_files = sorted(app_dir.glob("*.desktop")) or sorted(
+        app_dir.glob("**/share/applications/*.desktop")
+    )
+    if len(desktop_files) == 0:
+        raise AppImageError(f"No desktop file found in {app_dir}")
+    desktop_file = desktop_files[0]
+    if desktop_file.parent != app_dir:
+        _link(app_dir / desktop_file.name, desktop_file)
+
+    app_run = app_dir / "AppRun"
+    if not os.path.lexists(app_run):
+        exec_value = _desktop_entry_value(desktop_file, "Exec") or ""
+        exec_name = exec_value.split(" ")[0]
+        executables = [
+            executable
+            for executable in sorted(app_dir.glob(f"**/bin/{exec_name}"))
+            if executable.is_file()
+        ]
+        if not exec_name or len(executables) == 0:
+            raise AppImageError(f"Executable '{exec_name}' of {desktop_file} not found")
+        _link(app_run, executables[0])
+
+    icon_name = _desktop_entry_value(desktop_file, "Icon")
+    dir_icon = app_dir / ".DirIcon"
+    if icon_name and not os.path.lexists(dir_icon) and (app_dir / f"{icon_name}.png").exists():
+        _link(dir_icon, app_dir / f"{icon_name}.png")
+    return Path(os.path.realpath(app_run))
+
+
+def startup_files(
+    app_dir: Path, executable: Path, resolver: Optional[DependencyResolver] = None
+) -> List[Path]:
+    """Files of the AppDir, that are read when the app starts, in the order of reading.
+
+    These are the executable, qt.conf, libraries it is linked to and platform plugins of
+    Qt with their libraries.
+
+    Args:
+        app_dir (Path): AppDir
+        executable (Path): executable started by AppRun
+        resolver (Optional[DependencyResolver]): resolver to share parsed files with
+
+    Returns:
+        List[Path]: paths relative to AppDir
+    """
+    if resolver is None:
+        resolver = DependencyResolver()
+    app_dir_path = os.path.realpath(app_dir)
+    roots = [executable] + sorted(app_dir.glob("**/plugins/platforms/*.so"))
+    files: List[str] = []
+    for root in roots:
+        files.append(os.path.realpath(root))
+        if root == executable and (executable.parent / "qt.conf").is_file():
+            files.append(os.path.realpath(executable.parent / "qt.conf"))
+        files += [
+            os.path.realpath(lookup.found)
+            for lookup in resolver.lookups(root)
+            if lookup.found is not None
+        ]
+    return [
+        Path(os.path.relpath(file_path, app_dir_path))
+        for file_path in dict.fromkeys(files)
+        if file_path.startswith(app_dir_path + os.sep)
+    ]
+
+
+def read_order_file(order_file: Path) -> List[Path]:
+    # one path relative to AppDir per line, empty lines and comments starting with '#'
+    with open(order_file) as order:
+        lines = [line.strip() for line in order]
+    return [Path(line) for line in lines if line and not line.startswith("#")]
+
+
+def write_sort_file(files: List[Path], sort_file: Path) -> None:
+    """Write sort file of mksquashfs, so that files are placed in the image in given order.
+
+    Args:
+        files (List[Path]): paths relative to AppDir
+        sort_file (Path): output file
+    """
+    with open(sort_file, "w") as sort:
+        for index, file_path in enumerate(files[: MAX_SORT_PRIORITY + 1]):
+            sort.write(f"{file_path.as_posix()} {MAX_SORT_PRIORITY - index}\n")
+
+
+def _tree_size(directory: Path) -> int:
+    # symlinks and hardlinks take no space in the image
+    size = 0
+    inodes: Set[int] = set()
+    for dir_path, _, file_names in os.walk(directory):
+        for file_name in file_names:
+            stat_result = os.lstat(os.path.join(dir_path, file_name))
+            if stat.S_ISREG(stat_result.st_mode) and stat_result.st_ino not in inodes:
+                inodes.add(stat_result.st_ino)
+                size += stat_result.st_size
+    return size
+
+
+def build_appimage(
+    app_dir: Path,
+    output_path: Path,
+    runtime_path: Path,
+    compressor: Compressor = Compressor.ZSTD,
+    level: Optional[int] = None,
+    block_size: int = 128 * 1024,
+    processors: Optional[int] = None,
+    order_file: Optional[Path] = None,
+    launch_args: Optional[List[str]] = None,
+) -> AppImageResult:
+    """Pack AppDir with mksquashfs and prepend the AppImage runtime.
+
+    Args:
+        app_dir (Path): predeployed AppDir
+        output_path (Path): AppImage file
+        runtime_path (Path): AppImage runtime, e.g. runtime-x86_64 of AppImageKit
+        compressor (Compressor): compression algorithm
+        level (Optional[int]): compression level, default of mksquashfs if not set
+        block_size (int): block size in bytes
+        processors (Optional[int]): number of compressing threads, number of CPUs by default
+        order_file (Optional[Path]): files to place first in the image, one path relative
+                                     to AppDir per line. Files read at startup by default
+        launch_args (Optional[List[str]]): if set, the image is started with these arguments
+                                           to measure the time to the first launch
+
+    Returns:
+        AppImageResult: sizes and times
+
+    Raises:
+        AppImageError: mksquashfs is not found or failed, invalid options
+    """
+    if shutil.which(MKSQUASHFS_TOOL) is None:
+        raise AppImageError(f"{MKSQUASHFS_TOOL} not found, install squashfs-tools")
+    if not runtime_path.is_file():
+        raise AppImageError(f"AppImage runtime {runtime_path} not found")
+
+    with profiling.stage("prepare AppDir"):
+        executable = prepare_app_dir(app_dir)
+        if order_file is not None:
+            files_order = read_order_file(order_file)
+        else:
+            files_order = startup_files(app_dir, executable)
+    logger.debug(
+        "Files placed first in the image:\n    "
+        + "\n    ".join(str(file_path) for file_path in files_order)
+    )
+
+    image_path = output_path.with_name(output_path.name + ".squashfs")
+    sort_file = output_path.with_name(output_path.name + ".sort")
+    try:
+        write_sort_file(files_order, sort_file)
+        command = mksquashfs_command(
+            app_dir,
+            image_path,
+            compressor=compressor,
+            level=level,
+            block_size=block_size,
+            processors=processors,
+            sort_file=sort_file,
+            excluded=[
+                path.name
+                for path in app_dir.iterdir()
+                if any(fnmatch(path.name, pattern) for pattern in BUILD_FILE_PATTERNS)
+            ],
+        )
+        with profiling.stage("mksquashfs"):
+            # compression is parallel inside of mksquashfs, see -processors
+            packing = run_command(command, timeout=MKSQUASHFS_TIMEOUT).check()
+
+        with profiling.stage("add runtime"):
+            with open(output_path, "wb") as output, open(runtime_path, "rb") as runtime:
+                shutil.copyfileobj(runtime, output)
+                with open(image_path, "rb") as image:
+                    shutil.copyfileobj(image, output)
+            output_path.chmod(0o755)
+    except CommandError as error:
+        raise AppImageError(str(error)) from error
+    finally:
+        for temporary_path in (image_path, sort_file):
+            if temporary_path.exists():
+                temporary_path.unlink()
+
+    result = AppImageResult(
+        output_path,
+        _tree_size(app_dir),
+        output_path.stat().st_size,
+        packing.duration,
+    )
+    if launch_args is not None:
+        with profiling.stage("first launch"):
+            launch = run_command(
+                [str(output_path.absolute())] + launch_args, timeout=LAUNCH_TIMEOUT
+            )
+        if launch.ok:
+            result.launch_time = launch.duration
+        else:
+            logger.warning(f"First launch of {output_path} failed: {launch.output}")
+    return result
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import shutil
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from modapp_buildtools.file_utils import file_digest, is_shared_library
+from modapp_buildtools.rpath_utils import relative_rpath
+from modapp_buildtools.staging import FileStager, StagedFile
+
+ARTIFACT_CACHE_VERSION = 1
+CACHE_DIR_ENV = "MODAPP_BUILDTOOLS_CACHE_DIR"
+DEFAULT_MAX_SIZE = 2 * 1024 * 1024 * 1024
+_ARTIFACTS_DIR = "artifacts"
+
+
+def default_cache_dir() -> Path:
+    if CACHE_DIR_ENV in os.environ:
+        return Path(os.environ[CACHE_DIR_ENV])
+    xdg_cache_home = os.environ.get("XDG_CACHE_HOME") or str(Path.home() / ".cache")
+    return Path(xdg_cache_home) / "modapp-buildtools"
+
+
+def qt_install_identity(qt_path: Path) -> str:
+    """Identify Qt installation by its path and content of QtCore library.
+
+    Args:
+        qt_path (Path): Qt installation directory
+
+    Returns:
+        str: identity, that changes if Qt is reinstalled or updated at the same path
+    """
+    identity = hashlib.sha256(str(qt_path.resolve()).encode())
+    core_libraries = sorted(
+        library
+        for library in (qt_path / "lib").glob("libQt*Core.so*")
+        if library.is_file() and not library.is_symlink()
+    )
+    for core_library in core_libraries:
+        identity.update(file_digest(core_library).encode())
+    return identity.hexdigest()
+
+
+@dataclass
+class CacheUsage:
+    entries: int
+    size: int
+
+
+class ArtifactCache:
+    """User-level cache of Qt plugins and libraries of QML modules with patched rpath.
+
+    Entries are keyed by identity of Qt installation, name and stat of the source file and
+    rpath, that the file gets in the app. The cache is shared between builds and apps: a
+    file is patched once and later it is only linked into the app. Modification time of
+    an entry is the time of its last use, the least recently used entries are evicted.
+
+    Args:
+        cache_dir (Path): root directory of the cache
+        qt_path (Path): Qt installation, that files are copied from
+        app_lib_path (Path): lib directory of the app, rpath of files points to it
+        max_size (int): size of the cache in bytes, that is kept after eviction
+        jobs (Optional[int]): number of workers, number of CPUs by default
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        qt_path: Path,
+        app_lib_path: Path,
+        max_size: int = DEFAULT_MAX_SIZE,
+        jobs: Optional[int] = None,
+    ) -> None:
+        self.artifacts_dir = cache_dir / _ARTIFACTS_DIR
+        self.app_lib_path = app_lib_path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._qt_path = qt_path.resolve()
+        self._qt_identity = qt_install_identity(qt_path)
+        self._stager = FileStager(jobs)
+        # copied files, that are not in the cache yet -> their keys
+        self._pending: Dict[Path, str] = {}
+        self._lock = Lock()
+
+    def key(self, source: Path, destination: Path) -> str:
+        source_stat = source.stat()
+        data = {
+            "version": ARTIFACT_CACHE_VERSION,
+            "qt": self._qt_identity,
+            "name": os.path.relpath(source.resolve(), self._qt_path),
+            "source": [source_stat.st_size, source_stat.st_mtime_ns],
+            "rpath": relative_rpath(destination.parent, self.app_lib_path),
+        }
+        return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+    def entry_path(self, key: str) -> Path:
+        return self.artifacts_dir / key[:2] / key
+
+    def copy(self, source: Path, destination: Path) -> None:
+        """Copy a file of Qt installation into the app, use patched copy from cache if any.
+
+        Signature is the same as of `shutil.copy2`: files, that are not libraries, are
+        just copied.
+        """
+        if not is_shared_library(source):
+            shutil.copy2(source, destination)
+            return
+        key = self.key(source, destination)
+        entry = self.entry_path(key)
+        try:
+            # touch first: the entry is the most recently used one and it is not evicted
+            # by another build in between
+            os.utime(entry)
+            self._link(entry, destination)
+        except FileNotFoundError:
+            shutil.copy2(source, destination)
+            with self._lock:
+                self.misses += 1
+                self._pending[destination] = key
+            return
+        with self._lock:
+            self.hits += 1
+
+    def _link(self, entry: Path, destination: Path) -> None:
+        # patching breaks hardlinks (see `binary_patcher.apply_edit_plan`), so the entry
+        # stays intact, other ways are reflink or copy
+        if destination.exists() or destination.is_symlink():
+            destination.unlink()
+        try:
+            os.link(entry, destination)
+        except FileNotFoundError:
+            raise
+        except OSError:
+            self._stager.stage_file(StagedFile(entry, destination, patchable=True))
+
+    def store_pending(self) -> None:
+        """Store copied files, that were not found in the cache, after they are patched."""
+        for destination, key in self._pending.items():
+            entry = self.entry_path(key)
+            entry.parent.mkdir(parents=True, exist_ok=True)
+            # readers never see a partially written entry
+            temporary_path = entry.with_name(f"{entry.name}.{os.getpid()}.tmp")
+            try:
+                shutil.copy2(destination, temporary_path)
+                os.replace(temporary_path, entry)
+            except OSError as error:
+                logger.warning(f"Failed to store {destination} in cache: {error}")
+                if temporary_path.exists():
+                    temporary_path.unlink()
+        self._pending.clear()
+        evict(self.artifacts_dir.parent, self.max_size)
+
+    def log_statistics(self) -> None:
+        logger.info(f"Artifact cache: {self.hits} hits, {self.misses} misses")
+
+
+def _entries(cache_dir: Path) -> List[Tuple[str, os.stat_result]]:
+    # paths of entries with their stats, the cache is shared: other builds can evict entries
+    # at the same time, such entries are skipped
+    artifacts_dir = cache_dir / _ARTIFACTS_DIR
+    if not artifacts_dir.is_dir():
+        return []
+    entries: List[Tuple[str, os.stat_result]] = []
+    for bucket in os.scandir(artifacts_dir):
+        if not bucket.is_dir():
+            continue
+        for entry in os.scandir(bucket.path):
+            if not entry.is_file(follow_symlinks=False) or entry.name.endswith(".tmp"):
+                continue
+            try:
+                entries.append((entry.path, entry.stat()))
+            except FileNotFoundError:
+                continue
+    return entries
+
+
+def cache_usage(cache_dir: Path) -> CacheUsage:
+    entries = _entries(cache_dir)
+    return CacheUsage(len(entries), sum(stat_result.st_size for _, stat_result in entries))
+
+
+def evict(cache_dir: Path, max_size: int) -> CacheUsage:
+    """Remove the least recently used entries until the cache fits in the size.
+
+    Args:
+        cache_dir (Path): root directory of the cache
+        max_size (int): size in bytes, 0 removes all entries
+
+    Returns:
+        CacheUsage: removed entries and their size
+    """
+    entries = sorted(_entries(cache_dir), key=lambda entry: entry[1].st_mtime)
+    total_size = sum(stat_result.st_size for _, stat_result in entries)
+    removed = CacheUsage(0, 0)
+    for entry_path, stat_result in entries:
+        if total_size <= max_size:
+            break
+        total_size -= stat_result.st_size
+        try:
+            os.unlink(entry_path)
+        except FileNotFoundError:
+            # already evicted by another build
+            continue
+        removed.entries += 1
+        removed.size += stat_result.st_size
+    if removed.entries > 0:
+        logger.debug(
+            f"Evicted {removed.entries} cache entries ({removed.size / 1024 / 1024:.1f} MiB)"
+        )
+    return removed
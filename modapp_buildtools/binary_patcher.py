@@ -0,0 +1,221 @@
+import mmap
+import os
+import shutil
+import struct
+from dataclasses import dataclass, field
+from pathlib import Path
+from platform import system
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from loguru import logger
+
+from modapp_buildtools.command_engine import CommandError, run_command
+from modapp_buildtools.elf_utils import (
+    DT_NEEDED,
+    DT_RPATH,
+    DT_RUNPATH,
+    ElfError,
+    ElfInfo,
+    read_elf,
+    read_string_references,
+)
+
+
+@dataclass
+class EditPlan:
+    """All changes of one binary, that are applied at once."""
+
+    # old needed library -> new one
+    replace_needed: Dict[str, str] = field(default_factory=dict)
+    # complete new rpath, None if rpath should not be changed
+    rpath: Optional[List[str]] = None
+    # keep DT_RPATH instead of converting it to DT_RUNPATH, as `patchelf --force-rpath`
+    force_rpath: bool = False
+    # rpath before changes, on macOS only new entries can be added
+    current_rpath: List[str] = field(default_factory=list)
+
+    def add_rpaths(self, current_rpaths: List[str], new_rpaths: List[str]) -> None:
+        # keep order of existing entries and skip duplicates
+        rpath: List[str] = []
+        for rpath_entry in current_rpaths + new_rpaths:
+            if rpath_entry != "" and rpath_entry not in rpath:
+                rpath.append(rpath_entry)
+        self.current_rpath = current_rpaths
+        if rpath != current_rpaths:
+            self.rpath = rpath
+
+    @property
+    def is_empty(self) -> bool:
+        return len(self.replace_needed) == 0 and self.rpath is None
+
+
+def _can_replace_string(
+    data: Union[bytes, mmap.mmap],
+    dynstr_offset: int,
+    references: Set[int],
+    string_offset: int,
+    old_value: bytes,
+    new_value: bytes,
+) -> bool:
+    # linkers merge string tails: a string, that starts before the old one and has no NUL
+    # until it, ends with the old string and would be changed as well
+    if len(new_value) > len(old_value):
+        return False
+    string_start = dynstr_offset + string_offset
+    for reference in references:
+        if string_offset < reference < string_offset + len(old_value):
+            return False
+        if reference < string_offset and data.find(
+            b"\0", dynstr_offset + reference, string_start
+        ) == -1:
+            return False
+    return True
+
+
+def _patch_in_place(file_path: Path, elf_info: ElfInfo, plan: EditPlan) -> bool:
+    # strings in the dynamic string table can be replaced in-place if the new one is not
+    # longer than the old one and no other string overlaps with the old one. Returns False
+    # if it's not possible, nothing is changed in this case
+    if elf_info.dynstr_offset is None:
+        return False
+    dynstr_offset = elf_info.dynstr_offset
+    references = read_string_references(file_path)
+    if references is None:
+        return False
+
+    with open(file_path, "r+b") as elf_file:
+        with mmap.mmap(elf_file.fileno(), 0) as data:
+
+            def read_string(string_offset: int) -> bytes:
+                start = dynstr_offset + string_offset
+                return data[start:data.find(b"\0", start)]
+
+            def can_replace(string_offset: int, old_value: bytes, new_value: bytes) -> bool:
+                return _can_replace_string(
+                    data, dynstr_offset, references, string_offset, old_value, new_value
+                )
+
+            # (offset of the string, old string, new string)
+            string_writes: List[Tuple[int, bytes, bytes]] = []
+            # (offset of the dynamic entry, new tag)
+            tag_writes: List[Tuple[int, int]] = []
+
+            for entry in elf_info.dynamic_entries:
+                if entry.tag != DT_NEEDED:
+                    continue
+                old_value = read_string(entry.value)
+                new_name = plan.replace_needed.get(old_value.decode(errors="surrogateescape"))
+                if new_name is None:
+                    continue
+                new_value = new_name.encode(errors="surrogateescape")
+                if not can_replace(entry.value, old_value, new_value):
+                    return False
+                string_writes.append((dynstr_offset + entry.value, old_value, new_value))
+
+            if plan.rpath is not None:
+                runpath_entry = elf_info.dynamic_entry(DT_RUNPATH)
+                rpath_entry = elf_info.dynamic_entry(DT_RPATH)
+                if runpath_entry is not None and rpath_entry is not None:
+                    return False
+                rpath_dyn_entry = runpath_entry or rpath_entry
+                if rpath_dyn_entry is None:
+                    # a new dynamic entry is required
+                    return False
+                old_value = read_string(rpath_dyn_entry.value)
+                new_value = ":".join(plan.rpath).encode(errors="surrogateescape")
+                if not can_replace(rpath_dyn_entry.value, old_value, new_value):
+                    return False
+                string_writes.append(
+                    (dynstr_offset + rpath_dyn_entry.value, old_value, new_value)
+                )
+                # the same as patchelf: DT_RPATH is converted to DT_RUNPATH if not forced
+                new_tag = DT_RPATH if plan.force_rpath and runpath_entry is None else DT_RUNPATH
+                if new_tag != rpath_dyn_entry.tag:
+                    tag_writes.append((rpath_dyn_entry.offset, new_tag))
+
+            tag_format = ("<" if elf_info.little_endian else ">") + (
+                "q" if elf_info.dynamic_entry_size == 16 else "i"
+            )
+            for offset, old_value, new_value in string_writes:
+                data[offset:offset + len(old_value)] = new_value.ljust(len(old_value), b"\0")
+            for offset, new_tag in tag_writes:
+                struct.pack_into(tag_format, data, offset, new_tag)
+            data.flush()
+    return True
+
+
+def _patch_command(file_path: Path, plan: EditPlan) -> List[str]:
+    if system() == "Darwin":
+        command = ["install_name_tool"]
+        for old, new in plan.replace_needed.items():
+            command += ["-change", old, new]
+        if plan.rpath is not None:
+            for rpath in plan.rpath:
+                if rpath not in plan.current_rpath:
+                    command += ["-add_rpath", rpath]
+        return command + [str(file_path)]
+
+    # patchelf 0.9 that is often used on old build systems has no --add-rpath, but all
+    # versions support multiple operations in one call
+    command = ["patchelf"]
+    for old, new in plan.replace_needed.items():
+        command += ["--replace-needed", old, new]
+    if plan.rpath is not None:
+        if plan.force_rpath:
+            command.append("--force-rpath")
+        command += ["--set-rpath", ":".join(plan.rpath)]
+    return command + [str(file_path)]
+
+
+def _unshare(file_path: Path) -> None:
+    # both in-place patching and patchelf write into the inode of the file, other hardlinks
+    # of it (e.g. in the artifact cache) must not be changed
+    if os.stat(file_path).st_nlink <= 1:
+        return
+    temporary_path = file_path.with_name(f"{file_path.name}.unshare.tmp")
+    shutil.copy2(file_path, temporary_path)
+    os.replace(temporary_path, file_path)
+
+
+def apply_edit_plan(file_path: Path, plan: EditPlan) -> bool:
+    """Apply all changes of the binary at once.
+
+    On Linux strings are rewritten in-place without any subprocess if they fit into existing
+    ones, otherwise one patchelf call is used for all changes. A hardlinked file gets its own
+    copy first.
+
+    Args:
+        file_path (Path): binary to change
+        plan (EditPlan): changes
+
+    Returns:
+        bool: True if binary was changed successfully
+    """
+    if plan.is_empty:
+        return True
+
+    try:
+        _unshare(file_path)
+    except OSError as error:
+        logger.error(f"Failed to unshare '{file_path}': {error}")
+        return False
+
+    if system() == "Linux":
+        try:
+            elf_info = read_elf(file_path)
+        except (OSError, ElfError) as error:
+            logger.error(f"Failed to read '{file_path}': {error}")
+            return False
+        if elf_info is None:
+            logger.error(f"Cannot patch '{file_path}': not an ELF file")
+            return False
+        if _patch_in_place(file_path, elf_info, plan):
+            logger.trace(f"Patched '{file_path}' in-place")
+            return True
+
+    result = run_command(_patch_command(file_path, plan))
+    if not result.ok:
+        logger.error(f"Failed to patch '{file_path}': {CommandError(result)}")
+        return False
+    logger.trace(f"Patched '{file_path}': {result.command_str}")
+    return True
@@ -1,17 +1,36 @@
 import re
 import os
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from platform import system
 from shutil import copyfile
 from sys import exit
+from time import monotonic
 from typing import Optional, List, Tuple
 
-from command_runner import command_runner
 from loguru import logger
 
-from modapp_buildtools.file_utils import is_executable, is_shared_library
-from modapp_buildtools.rpath_utils import get_rpaths
+from modapp_buildtools import profiling
+from modapp_buildtools.binary_patcher import EditPlan, apply_edit_plan
+from modapp_buildtools.command_engine import (
+    CommandError,
+    configure as configure_commands,
+    default_jobs,
+    run_command,
+    target_lock,
+)
+from modapp_buildtools.dependency_resolver import DependencyResolver
+from modapp_buildtools.file_scanner import scan_tree
+from modapp_buildtools.library_index import AmbiguousLibraryError, LibraryIndex
+from modapp_buildtools.linking_cache import LinkingCache, linking_cache_path
+from modapp_buildtools.linking_policy import LinkingPolicy
+from modapp_buildtools.linking_report import (
+    AppliedFix,
+    FileLinkingResult,
+    LinkingReport,
+    LinkingStatus,
+)
+from modapp_buildtools.rpath_utils import get_rpaths, relative_rpath
 
 
 def _parse_ldd_output(output: str) -> Tuple[List[str], List[str]]:
@@ -31,37 +50,27 @@ def _try_fix(
     file_to_fix: Path,
     external_libs: List[Path],
     not_found_libs: List[Path],
-    available_libs: List[Path],
+    available_libs: LibraryIndex,
     app_path: Path,
-) -> bool:
-    commands_by_system = {
-        "Linux": {
-            "change_link": (
-                'patchelf --replace-needed "{old_link}" "{new_link}" "{file_to_fix}"'
-            ),
-            "add_rpath": 'patchelf --add-rpath "{rpath}" "{file_to_fix}"',
-        },
-        "Darwin": {
-            "change_link": (
-                'install_name_tool -change "{old_link}" "{new_link}" "{file_to_fix}"'
-            ),
-            "add_rpath": 'install_name_tool -add_rpath "{rpath}" "{file_to_fix}"',
-        },
-    }
+) -> Tuple[bool, AppliedFix]:
     fixed = True
+    applied_fix = AppliedFix()
     current_system = system()
     if current_system == "":
         logger.error("Failed to recognize OS")
-        return False
-
-    commands = commands_by_system[current_system]
+        return False, applied_fix
 
+    # all changes of the file are collected first and then applied at once
+    plan = EditPlan()
+    new_rpaths: List[str] = []
     for problem_lib in external_libs + not_found_libs:
         try:
-            local_lib = next(
-                lib for lib in available_libs if lib.name == problem_lib.name
-            )
-        except StopIteration:
+            local_lib = available_libs.find(problem_lib.name)
+        except AmbiguousLibraryError as error:
+            logger.error(f"Cannot fix {str(problem_lib)}: {error}")
+            fixed = False
+            continue
+        if local_lib is None:
             logger.error(
                 f"Cannot fix {str(problem_lib)}: local library with the same name not"
                 " found"
@@ -77,75 +86,95 @@ def _try_fix(
             # but it resolves to libQt5Core.5.15.3
             # TODO: support of other platforms? Now supports only linux
             lib_in_app_path = app_path / 'lib' / problem_lib.name
-            if not lib_in_app_path.exists():
-                # if library is not in app yet (it could be copied as dependency for another
-                # library earlier)
-                copyfile(local_lib, lib_in_app_path)
-
-        change_command = commands["change_link"].format(
-            old_link=str(problem_lib),
-            new_link=str(lib_in_app_path.name),
-            file_to_fix=file_to_fix,
-        )
-        command_runner(change_command)
-        # TODO: error handling
-
-        rpaths = get_rpaths(file_to_fix)
-        relative_path = Path(os.path.relpath(local_lib, file_to_fix))
-        needed_rpath = f"{str(relative_path)}"
-        if needed_rpath not in rpaths:
-            # TODO: use add_rpath()
-            add_rpath_command = commands["add_rpath"].format(
-                rpath=needed_rpath, file_to_fix=file_to_fix
-            )
-            command_runner(add_rpath_command)
-            # TODO: error handling
+            # the same library can be needed by files that are fixed in parallel
+            with target_lock(lib_in_app_path):
+                if not lib_in_app_path.exists():
+                    # if library is not in app yet (it could be copied as dependency for
+                    # another library earlier). Copy under temporary name, so that other
+                    # workers never see partially copied library
+                    temporary_path = lib_in_app_path.with_name(lib_in_app_path.name + ".tmp")
+                    try:
+                        copyfile(local_lib, temporary_path)
+                        os.replace(temporary_path, lib_in_app_path)
+                        profiling.add_bytes_copied(lib_in_app_path.stat().st_size)
+                        applied_fix.copied.append(str(lib_in_app_path))
+                    except OSError as error:
+                        logger.error(f"Cannot fix {str(problem_lib)}: failed to copy: {error}")
+                        fixed = False
+                        continue
 
-    return fixed
+        # ELF files reference needed libraries by name, Mach-O files by path
+        old_link = str(problem_lib) if current_system == "Darwin" else problem_lib.name
+        if old_link != lib_in_app_path.name:
+            plan.replace_needed[old_link] = lib_in_app_path.name
+
+        # rpath entries are directories relative to the fixed file, not to the working dir
+        new_rpaths.append(relative_rpath(file_to_fix.absolute().parent, lib_in_app_path.parent))
+
+    plan.add_rpaths(get_rpaths(file_to_fix), new_rpaths)
+    if not apply_edit_plan(file_to_fix, plan):
+        fixed = False
+    else:
+        applied_fix.replaced_needed = dict(plan.replace_needed)
+        applied_fix.rpath = list(dict.fromkeys(new_rpaths))
+
+    return fixed, applied_fix
+
+
+def _external_libs(
+    linked_libs: List[str], app_path: Path, policy: Optional[LinkingPolicy]
+) -> List[Path]:
+    # without policy all libraries outside of the app are allowed
+    if policy is None:
+        return []
+    app_path_str = str(app_path.absolute())
+    return [
+        Path(linked_lib)
+        for linked_lib in linked_libs
+        if not linked_lib.startswith(app_path_str) and not policy.allows(linked_lib)
+    ]
 
 
 def check_file_linking_task(
     file_to_check: Path,
     app_path: Path,
     allowed_libs: Optional[List[str]] = None,
-    available_libs: Optional[List[Path]] = None,
+    available_libs: Optional[LibraryIndex] = None,
     fix: bool = False,
-) -> bool:
+    resolver: Optional[DependencyResolver] = None,
+    cache: Optional[LinkingCache] = None,
+    policy: Optional[LinkingPolicy] = None,
+) -> FileLinkingResult:
+    # a compiled policy takes precedence, patterns are compiled for callers without it
+    if policy is None:
+        policy = LinkingPolicy.from_options(allowed_libs)
     file_relative_path_str = str(file_to_check.relative_to(app_path))
     lib_linking_is_ok = True
+    if cache is not None and cache.is_unchanged(file_to_check):
+        logger.info(f"Skip {file_relative_path_str}, not changed since last successful check")
+        return FileLinkingResult(file_relative_path_str, LinkingStatus.CACHED)
     logger.info(f'Checking "{file_relative_path_str}"')
 
-    command = f'ldd "{str(file_to_check)}"'
-    exit_code, output = command_runner(command)
-    if exit_code != 0:
-        if exit_code == 1 and "not a dynamic executable" in str(output):
+    if system() == "Linux":
+        if resolver is None:
+            resolver = DependencyResolver()
+        dependencies = resolver.dependencies(file_to_check)
+        if dependencies is None:
             logger.info(f"Skip {file_relative_path_str}, not a dynamic executable")
-            return True
-        raise Exception(
-            f'Command "{command}" failed with status code {exit_code}, output: {output}'
-        )
-    if output is None:
-        raise Exception(f'Command "{command}" produced no output')
-    linked_libs, not_found_libs = _parse_ldd_output(str(output))
+            return FileLinkingResult(file_relative_path_str, LinkingStatus.SKIPPED)
+        linked_libs, not_found_libs = dependencies.linked, dependencies.not_found
+    else:
+        ldd_result = run_command(["ldd", str(file_to_check)])
+        if not ldd_result.ok:
+            if ldd_result.exit_code == 1 and "not a dynamic executable" in ldd_result.output:
+                logger.info(f"Skip {file_relative_path_str}, not a dynamic executable")
+                return FileLinkingResult(file_relative_path_str, LinkingStatus.SKIPPED)
+            raise CommandError(ldd_result)
+        linked_libs, not_found_libs = _parse_ldd_output(ldd_result.output)
     if len(not_found_libs) > 0:
         lib_linking_is_ok = False
 
-    external_libs: List[Path] = []
-    for linked_lib in linked_libs:
-        if not linked_lib.startswith(str(app_path.absolute())) and (
-            allowed_libs is not None and linked_lib not in allowed_libs
-        ):
-            linked_lib_path = Path(linked_lib)
-            try:
-                if allowed_libs is None:
-                    raise StopIteration()
-                next(
-                    allowed_lib
-                    for allowed_lib in allowed_libs
-                    if linked_lib_path.name.startswith(allowed_lib)
-                )
-            except StopIteration:
-                external_libs.append(linked_lib_path)
+    external_libs = _external_libs(linked_libs, app_path, policy)
 
     if len(external_libs) > 0:
         logger.info(
@@ -154,43 +183,163 @@ def check_file_linking_task(
         )
         lib_linking_is_ok = False
 
-    if fix:
+    result = FileLinkingResult(
+        file_relative_path_str,
+        LinkingStatus.OK,
+        resolved=linked_libs,
+        missing=not_found_libs,
+        external=[str(external_lib) for external_lib in external_libs],
+    )
+    fix_is_verified = True
+    if fix and not lib_linking_is_ok:
         if available_libs is None:
             raise Exception("Dependencies cannot be fixed without local libs")
 
-        lib_linking_is_ok |= _try_fix(
+        lib_linking_is_ok, result.fix = _try_fix(
             file_to_fix=file_to_check,
             available_libs=available_libs,
             external_libs=external_libs,
             not_found_libs=[Path(p) for p in not_found_libs],
             app_path=app_path,
         )
+        if resolver is None:
+            # fixed linking cannot be verified without the resolver, it is checked next time
+            fix_is_verified = False
+        else:
+            resolver.invalidate(file_to_check)
+            if lib_linking_is_ok:
+                # the fixed file is resolved again: only linking, that is correct now, is cached
+                fixed_dependencies = resolver.dependencies(file_to_check)
+                linked_libs = fixed_dependencies.linked if fixed_dependencies is not None else []
+                if fixed_dependencies is None or (
+                    len(fixed_dependencies.not_found) > 0
+                    or len(_external_libs(linked_libs, app_path, policy)) > 0
+                ):
+                    logger.error(f"Linking of {file_relative_path_str} is incorrect after fix")
+                    lib_linking_is_ok = False
+
+    if cache is not None:
+        if lib_linking_is_ok and fix_is_verified:
+            cache.store(file_to_check, linked_libs)
+        else:
+            cache.forget(file_to_check)
 
-    return lib_linking_is_ok
+    if not lib_linking_is_ok:
+        result.status = LinkingStatus.FAILED
+    elif result.fix is not None:
+        result.status = LinkingStatus.FIXED
+    return result
 
 
 def check_linking_in_files(
     files: List[Path],
     app_path: Path,
     allowed_libs: Optional[List[str]] = None,
-    available_libs: Optional[List[Path]] = None,
+    available_libs: Optional[LibraryIndex] = None,
     fix: bool = False,
+    resolver: Optional[DependencyResolver] = None,
+    use_cache: bool = False,
+    jobs: Optional[int] = None,
+    report_path: Optional[Path] = None,
+    fail_fast: bool = False,
+    policies: Optional[List[str]] = None,
+    failed_files: Optional[List[Path]] = None,
 ) -> bool:
-    with ThreadPoolExecutor(max_workers=2) as executor:
-        futures = [
-            executor.submit(
-                check_file_linking_task,
+    """Check linking of files in parallel.
+
+    Results are reported in the order of completion. If `report_path` is set, a JSON
+    record for each file is written there immediately, see `LinkingReport`.
+
+    Args:
+        files (List[Path]): executables and libraries to check
+        app_path (Path): app directory, libraries outside of it are external
+        allowed_libs (Optional[List[str]]): patterns of allowed external libraries, see
+                                            `LinkingPolicy`
+        available_libs (Optional[LibraryIndex]): libraries to fix linking with
+        fix (bool): copy missing and external libraries into the app and link them
+        resolver (Optional[DependencyResolver]): resolver to share parsed files with
+        use_cache (bool): skip files, that are not changed since the last successful check
+        jobs (Optional[int]): number of workers, number of CPUs by default
+        report_path (Optional[Path]): JSON Lines report, '-' for standard output
+        fail_fast (bool): cancel checks, that are not started yet, after the first failed
+                          file
+        policies (Optional[List[str]]): baseline profiles of allowed external libraries,
+                                        e.g. 'appimage-excludelist'
+        failed_files (Optional[List[Path]]): files with incorrect linking are appended to it
+
+    Returns:
+        bool: True if linking of all checked files is correct
+    """
+    # resolver is shared between all files: each library in the tree is analyzed only once
+    if resolver is None:
+        resolver = DependencyResolver()
+    # compiled once, classification of dependencies doesn't depend on the number of patterns
+    policy = LinkingPolicy.from_options(allowed_libs, policies)
+    cache: Optional[LinkingCache] = None
+    if use_cache:
+        cache = LinkingCache(
+            linking_cache_path(app_path),
+            context={
+                "app_path": str(app_path.absolute()),
+                "policy": policy.digest if policy is not None else None,
+                "fix": fix,
+                "ld_library_path": os.environ.get("LD_LIBRARY_PATH", ""),
+            },
+        )
+        with profiling.stage("load linking cache"):
+            cache.load()
+
+    def check_file(file_to_check: Path) -> FileLinkingResult:
+        start = monotonic()
+        with profiling.task("check", file_to_check.name):
+            result = check_file_linking_task(
                 file_to_check,
                 app_path,
-                allowed_libs,
-                available_libs,
-                fix,
+                available_libs=available_libs,
+                fix=fix,
+                resolver=resolver,
+                cache=cache,
+                policy=policy,
             )
-            for file_to_check in files
-        ]
-        results = [f.result() for f in futures]
+        result.duration = monotonic() - start
+        return result
+
+    linking_is_ok = True
+    not_checked = 0
+    with profiling.stage("check linking"), LinkingReport(report_path) as report, (
+        ThreadPoolExecutor(max_workers=jobs or default_jobs(), thread_name_prefix="check")
+    ) as executor:
+        futures = {
+            executor.submit(check_file, file_to_check): file_to_check for file_to_check in files
+        }
+        try:
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                result = future.result()
+                report.write(result)
+                if not result.ok and failed_files is not None:
+                    failed_files.append(futures[future])
+                if not result.ok and linking_is_ok:
+                    linking_is_ok = False
+                    if fail_fast:
+                        # running checks are finished and reported, other are cancelled
+                        not_checked = sum(other.cancel() for other in futures)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    if not_checked > 0:
+        logger.error(
+            f"Linking check is stopped after the first failure, {not_checked} files are"
+            " not checked"
+        )
+
+    if cache is not None:
+        with profiling.stage("save linking cache"):
+            cache.save()
+        logger.info(f"Linking cache: {cache.hits} hits, {cache.misses} misses")
 
-    linking_is_ok = all(results)
     return linking_is_ok
 
 
@@ -198,27 +347,33 @@ def check_linking(
     bin_path: Path,
     allowed_libs: Optional[List[str]] = None,
     fix: bool = False,
+    use_cache: bool = True,
+    jobs: Optional[int] = None,
+    report_path: Optional[Path] = None,
+    fail_fast: bool = False,
+    policies: Optional[List[str]] = None,
 ) -> None:
+    configure_commands(jobs)
     app_path = bin_path
-    files_to_check: List[Path] = []
-    available_libs: List[Path] = []
+    with profiling.stage("scan"):
+        manifest = scan_tree(bin_path)
+    files_to_check = manifest.binaries
+    available_libs = [library.absolute() for library in manifest.shared_libraries]
     if bin_path.is_file():
-        files_to_check.append(bin_path)
         app_path = bin_path.parent
-    elif bin_path.is_dir():
-        for app_file in bin_path.rglob("*"):
-            if is_executable(app_file) or is_shared_library(app_file):
-                files_to_check.append(app_file)
-                if is_shared_library(app_file):
-                    available_libs.append(app_file.absolute())
 
     logger.info(f"Working directory: {app_path}")
     linking_is_ok = check_linking_in_files(
         files_to_check,
         allowed_libs=allowed_libs,
-        available_libs=available_libs,
+        available_libs=LibraryIndex(available_libs),
         fix=fix,
         app_path=app_path,
+        use_cache=use_cache,
+        jobs=jobs,
+        report_path=report_path,
+        fail_fast=fail_fast,
+        policies=policies,
     )
 
     if not linking_is_ok:
@@ -1,13 +1,23 @@
 import typer
 from pathlib import Path
-from typing import Optional, List
+from typing import Dict, Optional, List
 
-from modapp_buildtools.check_linking import check_linking as _check_linking
-from modapp_buildtools.deploy_qt import deploy_qt as _deploy_qt, appimage_post_deploy
-from modapp_buildtools.predeploy import predeploy_app
+from modapp_buildtools.options import Compressor, LinkMode
+
+# implementations of commands are imported only when the command runs: CLI is started many
+# times in a pipeline, `--help` and small commands should not pay for import of all of them
 
 
 app = typer.Typer()
+cache_app = typer.Typer()
+app.add_typer(cache_app, name="cache")
+
+
+def _reject_with_watch(options: Dict[str, bool]) -> None:
+    # the watch mode runs until interrupted, it has no single result to report or fail on
+    ignored = [option for option, is_set in options.items() if is_set]
+    if ignored:
+        raise typer.BadParameter(f"{', '.join(ignored)} cannot be used with --watch")
 
 
 @app.command()
@@ -15,8 +25,57 @@ def check_linking(
     bin_path: Path,
     allowed_libs: Optional[List[str]] = None,
     fix: bool = False,
+    cache: bool = True,
+    jobs: Optional[int] = None,
+    report: Optional[Path] = None,
+    fail_fast: bool = False,
+    policy: Optional[List[str]] = None,
+    watch: bool = False,
+    profile: Optional[Path] = None,
 ) -> None:
-    _check_linking(bin_path, allowed_libs=allowed_libs, fix=fix)
+    from modapp_buildtools import profiling
+
+    if watch:
+        _reject_with_watch(
+            {"--report": report is not None, "--fail-fast": fail_fast, "--no-cache": not cache}
+        )
+        from modapp_buildtools.linking_watch import watch_linking
+
+        with profiling.profile(profile, "check-linking"):
+            watch_linking(
+                bin_path, allowed_libs=allowed_libs, fix=fix, jobs=jobs, policies=policy or None
+            )
+        return
+
+    from modapp_buildtools.check_linking import check_linking as _check_linking
+
+    with profiling.profile(profile, "check-linking"):
+        _check_linking(
+            bin_path,
+            allowed_libs=allowed_libs,
+            fix=fix,
+            use_cache=cache,
+            jobs=jobs,
+            report_path=report,
+            fail_fast=fail_fast,
+            # baseline profiles of allowed libraries, typer passes an empty list if not set
+            policies=policy or None,
+        )
+
+
+@app.command()
+def check_symbols(
+    bin_path: Path,
+    max_version: Optional[List[str]] = None,
+    jobs: Optional[int] = None,
+    profile: Optional[Path] = None,
+) -> None:
+    from modapp_buildtools import profiling
+    from modapp_buildtools.symbol_check import check_symbols as _check_symbols
+
+    with profiling.profile(profile, "check-symbols"):
+        # e.g. --max-version GLIBC_2.17 --max-version GLIBCXX_3.4.19
+        _check_symbols(bin_path, max_versions=max_version or None, jobs=jobs)
 
 
 @app.command()
@@ -27,19 +86,164 @@ def deploy_qt(
     fix: bool = False,
     plugins: Optional[List[str]] = None,
     qml_dir: Optional[Path] = None,
+    cache: bool = True,
+    jobs: Optional[int] = None,
+    exclude_plugins: Optional[List[str]] = None,
+    prune: bool = False,
+    keep_libraries: Optional[List[str]] = None,
+    normalize_rpath: bool = False,
+    strip: bool = False,
+    debug_dir: Optional[Path] = None,
+    dedupe: Optional[LinkMode] = None,
+    report: Optional[Path] = None,
+    fail_fast: bool = False,
+    policy: Optional[List[str]] = None,
+    watch: bool = False,
+    profile: Optional[Path] = None,
+) -> None:
+    if watch:
+        _reject_with_watch({"--report": report is not None, "--fail-fast": fail_fast})
+
+    from modapp_buildtools import profiling
+    from modapp_buildtools.deploy_qt import deploy_qt as _deploy_qt
+
+    with profiling.profile(profile, "deploy-qt"):
+        _deploy_qt(
+            bin_path,
+            qt_path,
+            allowed_libs=allowed_libs,
+            fix=fix,
+            # typer passes an empty list, if option is not given: infer plugins then
+            plugins=plugins or None,
+            qml_dir=qml_dir,
+            use_cache=cache,
+            jobs=jobs,
+            exclude_plugins=exclude_plugins,
+            prune=prune,
+            keep_libraries=keep_libraries,
+            normalize_rpath=normalize_rpath,
+            strip=strip,
+            debug_dir=debug_dir,
+            dedupe=dedupe,
+            report_path=report,
+            fail_fast=fail_fast,
+            # baseline profiles of allowed libraries, typer passes an empty list if not set
+            policies=policy or None,
+            watch=watch,
+        )
+
+
+@app.command()
+def predeploy(
+    app_path: Path,
+    output_path: Path,
+    app_dir_name: str = "AppDir",
+    jobs: Optional[int] = None,
+    incremental: bool = False,
+    prune: bool = False,
+    keep_libraries: Optional[List[str]] = None,
+    normalize_rpath: bool = False,
+    strip: bool = False,
+    debug_dir: Optional[Path] = None,
+    dedupe: Optional[LinkMode] = None,
+    profile: Optional[Path] = None,
 ) -> None:
-    _deploy_qt(bin_path, qt_path, allowed_libs=allowed_libs, fix=fix, plugins=plugins, qml_dir=qml_dir)
+    from modapp_buildtools import profiling
+    from modapp_buildtools.predeploy import predeploy_app
+
+    with profiling.profile(profile, "predeploy"):
+        predeploy_app(
+            app_path,
+            output_path,
+            app_dir_name=app_dir_name,
+            jobs=jobs,
+            incremental=incremental,
+            prune=prune,
+            keep_libraries=keep_libraries,
+            normalize_rpath=normalize_rpath,
+            strip=strip,
+            debug_dir=debug_dir,
+            dedupe=dedupe,
+        )
 
 
 @app.command()
-def predeploy(app_path: Path, output_path: Path, app_dir_name: str = "AppDir") -> None:
-    predeploy_app(app_path, output_path, app_dir_name=app_dir_name)
+def normalize_rpath(
+    bin_path: Path,
+    check: bool = False,
+    runpath: bool = True,
+    jobs: Optional[int] = None,
+    profile: Optional[Path] = None,
+) -> None:
+    from modapp_buildtools import profiling
+    from modapp_buildtools.rpath_normalizer import normalize_app_rpaths
+
+    with profiling.profile(profile, "normalize-rpath"):
+        normalize_app_rpaths(bin_path, check_only=check, use_runpath=runpath, jobs=jobs)
+
+
+@app.command()
+def appimage(
+    app_dir: Path,
+    output_path: Path,
+    runtime: Path = typer.Option(...),
+    compressor: Compressor = Compressor.ZSTD,
+    level: Optional[int] = None,
+    block_size: str = "128K",
+    processors: Optional[int] = None,
+    order_file: Optional[Path] = None,
+    launch: Optional[str] = None,
+    profile: Optional[Path] = None,
+) -> None:
+    import shlex
+
+    from modapp_buildtools import profiling
+    from modapp_buildtools.appimage import build_appimage, parse_size
+
+    with profiling.profile(profile, "appimage"):
+        result = build_appimage(
+            app_dir,
+            output_path,
+            runtime,
+            compressor=compressor,
+            level=level,
+            block_size=parse_size(block_size),
+            processors=processors,
+            order_file=order_file,
+            # arguments to start the image with, e.g. --launch="--help"
+            launch_args=shlex.split(launch) if launch is not None else None,
+        )
+    result.log()
 
 
 @app.command()
 def appimage_qt_post_deploy(app_run_dir_path: Path) -> None:
+    from modapp_buildtools.qt_conf import appimage_post_deploy
+
     appimage_post_deploy(app_run_dir_path)
 
 
+@cache_app.command("prune")
+def cache_prune(max_size_mib: Optional[int] = None) -> None:
+    from loguru import logger
+
+    from modapp_buildtools.artifact_cache import (
+        DEFAULT_MAX_SIZE,
+        cache_usage,
+        default_cache_dir,
+        evict,
+    )
+
+    # 0 removes all entries
+    max_size = max_size_mib * 1024 * 1024 if max_size_mib is not None else DEFAULT_MAX_SIZE
+    cache_dir = default_cache_dir()
+    removed = evict(cache_dir, max_size)
+    usage = cache_usage(cache_dir)
+    logger.info(
+        f"Removed {removed.entries} entries ({removed.size / 1024 / 1024:.1f} MiB) from "
+        f"{cache_dir}, {usage.entries} entries ({usage.size / 1024 / 1024:.1f} MiB) are left"
+    )
+
+
 if __name__ == "__main__":
     app()
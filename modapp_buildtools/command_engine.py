@@ -0,0 +1,174 @@
+import asyncio
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock, Thread
+from time import monotonic
+from typing import Dict, List, Optional, Sequence
+
+from loguru import logger
+
+from modapp_buildtools import profiling
+
+DEFAULT_COMMAND_TIMEOUT = 600.0
+
+
+def default_jobs() -> int:
+    return os.cpu_count() or 1
+
+
+@dataclass
+class CommandResult:
+    command: List[str]
+    # None if command was not started or it was killed after timeout
+    exit_code: Optional[int]
+    output: str
+    duration: float
+    timed_out: bool = False
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.exit_code == 0
+
+    @property
+    def command_str(self) -> str:
+        return " ".join(self.command)
+
+    def check(self) -> "CommandResult":
+        if not self.ok:
+            raise CommandError(self)
+        return self
+
+
+class CommandError(Exception):
+    def __init__(self, result: CommandResult) -> None:
+        if result.timed_out:
+            reason = f"timed out after {result.duration:.1f}s"
+        elif result.exit_code is None:
+            reason = f"failed to start: {result.error}"
+        else:
+            reason = f"failed with status code {result.exit_code}"
+        super().__init__(f'Command "{result.command_str}" {reason}, output: {result.output}')
+        self.result = result
+
+
+class CommandEngine:
+    """Run external commands concurrently on an asyncio event loop.
+
+    The loop runs in a background thread, so that commands can be started both from
+    synchronous code and from worker threads. Not more than `jobs` commands run at once.
+    """
+
+    def __init__(
+        self, jobs: Optional[int] = None, timeout: float = DEFAULT_COMMAND_TIMEOUT
+    ) -> None:
+        self.jobs = jobs if jobs is not None and jobs > 0 else default_jobs()
+        self.timeout = timeout
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._start_lock = Lock()
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                Thread(target=loop.run_forever, name="command-engine", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    async def _run(self, command: Sequence[str], timeout: float) -> CommandResult:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.jobs)
+        async with self._semaphore:
+            start = monotonic()
+            result = await self._execute(command, timeout, start)
+            profiling.record_command(command, start, monotonic(), result.exit_code)
+            return result
+
+    async def _execute(
+        self, command: Sequence[str], timeout: float, start: float
+    ) -> CommandResult:
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+            )
+        except OSError as error:
+            return CommandResult(
+                list(command), None, "", monotonic() - start, error=str(error)
+            )
+        try:
+            stdout, _ = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            return CommandResult(
+                list(command), None, "", monotonic() - start, timed_out=True
+            )
+        return CommandResult(
+            list(command),
+            process.returncode,
+            stdout.decode(errors="replace"),
+            monotonic() - start,
+        )
+
+    def close(self) -> None:
+        with self._start_lock:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._loop = None
+                self._semaphore = None
+
+    def run(self, command: Sequence[str], timeout: Optional[float] = None) -> CommandResult:
+        return self.run_many([command], timeout)[0]
+
+    def run_many(
+        self, commands: Sequence[Sequence[str]], timeout: Optional[float] = None
+    ) -> List[CommandResult]:
+        loop = self._ensure_started()
+        command_timeout = timeout if timeout is not None else self.timeout
+        futures = [
+            asyncio.run_coroutine_threadsafe(self._run(command, command_timeout), loop)
+            for command in commands
+        ]
+        results = [future.result() for future in futures]
+        for result in results:
+            logger.trace(f"'{result.command_str}' finished in {result.duration:.3f}s")
+        return results
+
+
+_engine: Optional[CommandEngine] = None
+_engine_lock = Lock()
+
+
+def configure(jobs: Optional[int] = None, timeout: float = DEFAULT_COMMAND_TIMEOUT) -> None:
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.close()
+        _engine = CommandEngine(jobs, timeout)
+
+
+def get_engine() -> CommandEngine:
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = CommandEngine()
+        return _engine
+
+
+def run_command(command: Sequence[str], timeout: Optional[float] = None) -> CommandResult:
+    return get_engine().run(command, timeout)
+
+
+_target_locks: Dict[str, Lock] = {}
+_target_locks_lock = Lock()
+
+
+def target_lock(path: Path) -> Lock:
+    """Lock for the file, that can be written by several workers, e.g. copied library."""
+    key = os.path.normpath(os.path.abspath(path))
+    with _target_locks_lock:
+        return _target_locks.setdefault(key, Lock())
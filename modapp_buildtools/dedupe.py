@@ -0,0 +1,197 @@
+import os
+import stat
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from modapp_buildtools import profiling
+from modapp_buildtools.command_engine import default_jobs
+from modapp_buildtools.dependency_resolver import DependencyResolver
+from modapp_buildtools.file_utils import file_digest
+from modapp_buildtools.options import LinkMode
+
+# smaller files occupy a filesystem block or a squashfs fragment anyway, a link saves
+# almost nothing there
+DEFAULT_MIN_SIZE = 4096
+
+
+@dataclass
+class DedupeResult:
+    # duplicate -> file it is linked to now
+    replaced: Dict[Path, Path] = field(default_factory=dict)
+    # duplicates, that are kept as copies, because a link changes their resolved libraries
+    kept: List[Path] = field(default_factory=list)
+    bytes_saved: int = 0
+
+    def log(self) -> None:
+        logger.info(
+            f"Replaced {len(self.replaced)} duplicate files with links,"
+            f" saved {self.bytes_saved / 1024 / 1024:.1f} MiB"
+        )
+        for duplicate, original in self.replaced.items():
+            logger.debug(f"{duplicate} -> {original}")
+        if len(self.kept) > 0:
+            logger.info(
+                f"{len(self.kept)} duplicates are kept, their libraries are resolved"
+                " differently from location of the original:\n    "
+                + "\n    ".join(str(file_path) for file_path in self.kept)
+            )
+
+
+def _original_order(file_path: Path) -> Tuple[int, str]:
+    # the least nested path is the original, e.g. library in lib dir and not its copy in
+    # plugins, and the shortest name among versioned copies in the same directory
+    return len(file_path.parts), str(file_path)
+
+
+def find_duplicates(
+    files: List[Path], min_size: int = DEFAULT_MIN_SIZE, jobs: Optional[int] = None
+) -> List[List[Path]]:
+    """Find groups of files with the same content.
+
+    Only files with the same size and mode are hashed, in parallel. Symlinks and paths
+    sharing an inode with already seen path are skipped: they are deduplicated already.
+
+    Args:
+        files (List[Path]): files to compare
+        min_size (int): smaller files are skipped
+        jobs (Optional[int]): number of workers, number of CPUs by default
+
+    Returns:
+        List[List[Path]]: groups of identical files, the original goes first in each group
+    """
+    candidates: Dict[Tuple[int, int], List[Path]] = {}
+    inodes: Set[Tuple[int, int]] = set()
+    for file_path in files:
+        if file_path.is_symlink():
+            continue
+        try:
+            stat_result = file_path.stat()
+        except OSError:
+            continue
+        inode = (stat_result.st_dev, stat_result.st_ino)
+        if (
+            not stat.S_ISREG(stat_result.st_mode)
+            or stat_result.st_size < min_size
+            or inode in inodes
+        ):
+            continue
+        inodes.add(inode)
+        candidates.setdefault((stat_result.st_size, stat_result.st_mode), []).append(file_path)
+
+    to_hash = [
+        (key, file_path)
+        for key, group in candidates.items()
+        if len(group) > 1
+        for file_path in group
+    ]
+
+    def hash_file(file_path: Path) -> str:
+        with profiling.task("hash", file_path.name):
+            return file_digest(file_path)
+
+    with ThreadPoolExecutor(
+        max_workers=jobs or default_jobs(), thread_name_prefix="hash"
+    ) as executor:
+        digests = list(executor.map(hash_file, [file_path for _, file_path in to_hash]))
+
+    groups: Dict[Tuple[int, int, str], List[Path]] = {}
+    for (key, file_path), digest in zip(to_hash, digests):
+        groups.setdefault(key + (digest,), []).append(file_path)
+    return sorted(
+        sorted(group, key=_original_order) for group in groups.values() if len(group) > 1
+    )
+
+
+def _resolved_libraries(file_path: Path, resolver: DependencyResolver) -> Set[Tuple[str, str]]:
+    return {
+        (lookup.soname, os.path.realpath(lookup.found) if lookup.found is not None else "")
+        for lookup in resolver.lookups(file_path)
+    }
+
+
+def can_link(
+    duplicate: Path, original: Path, mode: LinkMode, resolver: DependencyResolver
+) -> bool:
+    """Check whether replacing the duplicate with a link keeps linking of the app.
+
+    Other files find the duplicate at the same path, also if it is a link. A hardlink
+    doesn't change anything else. A symlink can change $ORIGIN of the file: the loader
+    expands it from the path of the target for executables, so libraries needed by the
+    duplicate must be resolved the same way from both locations.
+
+    Args:
+        duplicate (Path): file to replace
+        original (Path): identical file, that the link points to
+        mode (LinkMode): kind of the link
+        resolver (DependencyResolver): resolver for current locations of libraries
+
+    Returns:
+        bool: True if the duplicate can be replaced
+    """
+    if mode == LinkMode.HARDLINK or duplicate.parent == original.parent:
+        return True
+    return _resolved_libraries(duplicate, resolver) == _resolved_libraries(original, resolver)
+
+
+def link_file(duplicate: Path, original: Path, mode: LinkMode) -> None:
+    # the link is created next to the duplicate and replaces it atomically, so that the
+    # file is never missing
+    temporary_path = duplicate.with_name(duplicate.name + ".dedupe.tmp")
+    try:
+        if mode == LinkMode.SYMLINK:
+            os.symlink(os.path.relpath(original, duplicate.parent), temporary_path)
+        else:
+            os.link(original, temporary_path)
+        os.replace(temporary_path, duplicate)
+    finally:
+        if os.path.lexists(temporary_path):
+            temporary_path.unlink()
+
+
+def dedupe_files(
+    files: List[Path],
+    mode: LinkMode = LinkMode.SYMLINK,
+    resolver: Optional[DependencyResolver] = None,
+    min_size: int = DEFAULT_MIN_SIZE,
+    jobs: Optional[int] = None,
+) -> DedupeResult:
+    """Replace identical copies of files with relative symlinks or hardlinks.
+
+    Should be the last step of deployment: patching of a file changes all its links.
+
+    Args:
+        files (List[Path]): files of the app
+        mode (LinkMode): kind of links
+        resolver (Optional[DependencyResolver]): resolver to share parsed files with, its
+                                                 cache is invalidated
+        min_size (int): smaller files are not deduplicated
+        jobs (Optional[int]): number of workers, number of CPUs by default
+
+    Returns:
+        DedupeResult: replaced and kept duplicates, saved size
+    """
+    if resolver is None:
+        resolver = DependencyResolver()
+    result = DedupeResult()
+    for group in find_duplicates(files, min_size=min_size, jobs=jobs):
+        original = group[0]
+        for duplicate in group[1:]:
+            if not can_link(duplicate, original, mode, resolver):
+                result.kept.append(duplicate)
+                continue
+            size = duplicate.stat().st_size
+            try:
+                link_file(duplicate, original, mode)
+            except OSError as error:
+                # e.g. hardlinks are not supported by filesystem
+                logger.warning(f"Failed to link {duplicate} to {original}: {error}")
+                continue
+            result.replaced[duplicate] = original
+            result.bytes_saved += size
+    if len(result.replaced) > 0:
+        resolver.invalidate()
+    return result
@@ -0,0 +1,397 @@
+import os
+import re
+import struct
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from platform import machine
+from typing import Deque, Dict, List, Optional, Set, Tuple, cast
+
+from loguru import logger
+
+from modapp_buildtools.elf_utils import ELFCLASS64, ElfError, ElfInfo, read_elf
+
+LD_SO_CACHE_PATH = Path("/etc/ld.so.cache")
+_LD_SO_CACHE_MAGIC_OLD = b"ld.so-1.7.0"
+_LD_SO_CACHE_MAGIC_NEW = b"glibc-ld.so.cache1.1"
+# magic + version, nlibs, len_strings, flags + padding, extension offset, 3 unused
+_LD_SO_CACHE_HEADER_NEW = struct.Struct("=20sIIBxxxIIII")
+_LD_SO_CACHE_ENTRY_NEW = struct.Struct("=iIIIQ")
+_LD_SO_CACHE_ENTRY_OLD_SIZE = 12
+
+# dynamic loader is always loaded, also if file has no PT_INTERP (shared libraries)
+_DYNAMIC_LOADER_RE = re.compile(r"^ld(-linux[\w-]*|-musl-\w+|64)?\.so\.\d+$")
+
+DEFAULT_LIB_DIRS_64 = ["/lib64", "/usr/lib64", "/lib", "/usr/lib"]
+DEFAULT_LIB_DIRS_32 = ["/lib", "/usr/lib"]
+
+
+def read_ld_so_cache(cache_path: Path = LD_SO_CACHE_PATH) -> Dict[str, List[str]]:
+    """Read library paths from ld.so.cache in the same order as ld.so searches them.
+
+    Args:
+        cache_path (Path): path to ld.so.cache
+
+    Returns:
+        Dict[str, List[str]]: paths of libraries by their soname
+    """
+    try:
+        data = cache_path.read_bytes()
+    except OSError:
+        return {}
+
+    new_format_offset = 0
+    if data.startswith(_LD_SO_CACHE_MAGIC_OLD):
+        # old format header can be followed by the new format cache, aligned by 8 bytes
+        (old_nlibs,) = struct.unpack_from("=I", data, len(_LD_SO_CACHE_MAGIC_OLD) + 1)
+        new_format_offset = 16 + old_nlibs * _LD_SO_CACHE_ENTRY_OLD_SIZE
+        new_format_offset = (new_format_offset + 7) & ~7
+    if not data.startswith(_LD_SO_CACHE_MAGIC_NEW, new_format_offset):
+        logger.debug(f"Unsupported format of {cache_path}, it will be ignored")
+        return {}
+
+    libraries: Dict[str, List[str]] = {}
+    header = _LD_SO_CACHE_HEADER_NEW.unpack_from(data, new_format_offset)
+    nlibs = header[1]
+    entry_offset = new_format_offset + _LD_SO_CACHE_HEADER_NEW.size
+
+    def read_string(offset: int) -> str:
+        start = new_format_offset + offset
+        return data[start:data.index(b"\0", start)].decode("utf-8", errors="surrogateescape")
+
+    for index in range(nlibs):
+        _, key, value, _, _ = _LD_SO_CACHE_ENTRY_NEW.unpack_from(
+            data, entry_offset + index * _LD_SO_CACHE_ENTRY_NEW.size
+        )
+        libraries.setdefault(read_string(key), []).append(read_string(value))
+    return libraries
+
+
+@dataclass
+class LinkedLibraries:
+    # the same lists `ldd` output contains: normalized paths of found libraries and names
+    # of not found ones
+    linked: List[str] = field(default_factory=list)
+    not_found: List[str] = field(default_factory=list)
+
+
+@dataclass
+class LoaderLookup:
+    # object, that needs the library
+    requester: str
+    soname: str
+    # normalized path of found library or None
+    found: Optional[str]
+    # number of candidate paths, that the loader tries before the library is found
+    failed_lookups: int
+
+
+_MISSING = object()
+
+# (soname, found path or None if not found, rpath dirs that the found library inherits)
+_Dependency = Tuple[str, Optional[str], Tuple[str, ...]]
+
+
+class DependencyResolver:
+    """Resolve shared library dependencies like glibc ld.so does, but in-process.
+
+    Search order: DT_RPATH of the object and of its loaders (only if the object has no
+    DT_RUNPATH), LD_LIBRARY_PATH, DT_RUNPATH, ld.so.cache, default directories.
+    Parsed ELF files, resolved sonames and closures of libraries are cached, so that
+    every library is analyzed only once, even if the whole tree depends on it.
+    """
+
+    def __init__(
+        self,
+        ld_library_path: Optional[str] = None,
+        ld_so_cache_path: Path = LD_SO_CACHE_PATH,
+    ) -> None:
+        if ld_library_path is None:
+            ld_library_path = os.environ.get("LD_LIBRARY_PATH", "")
+        self._ld_library_path = [p for p in ld_library_path.replace(";", ":").split(":") if p]
+        self._ld_so_cache_path = ld_so_cache_path
+        self._ld_so_cache: Optional[Dict[str, List[str]]] = None
+        self._elf_infos: Dict[str, object] = {}
+        self._resolved: Dict[Tuple[Tuple[str, ...], str, int, int], object] = {}
+        self._direct_dependencies: Dict[Tuple[str, Tuple[str, ...]], List[_Dependency]] = {}
+        self._closures: Dict[Tuple[str, Tuple[str, ...]], List[Tuple[str, Optional[str]]]] = {}
+
+    @property
+    def ld_so_cache(self) -> Dict[str, List[str]]:
+        if self._ld_so_cache is None:
+            self._ld_so_cache = read_ld_so_cache(self._ld_so_cache_path)
+        return self._ld_so_cache
+
+    def elf_info(self, path: str) -> Optional[ElfInfo]:
+        # caches are shared between worker threads, read them without separate membership
+        # check, because they can be invalidated in between
+        cached = self._elf_infos.get(path, _MISSING)
+        if cached is not _MISSING:
+            return cast(Optional[ElfInfo], cached)
+        elf_info: Optional[ElfInfo] = None
+        try:
+            elf_info = read_elf(Path(path))
+        except FileNotFoundError:
+            # not cached: library can be copied later, e.g. by a fix of another file
+            return None
+        except (OSError, ElfError) as error:
+            logger.debug(f"Failed to read {path}: {error}")
+        self._elf_infos[path] = elf_info
+        return elf_info
+
+    def invalidate(self, path: Optional[Path] = None) -> None:
+        """Drop cached results after file was modified or added.
+
+        Args:
+            path (Optional[Path]): changed file. If it is None, all parsed files are dropped
+        """
+        if path is None:
+            self._elf_infos.clear()
+        else:
+            self._elf_infos.pop(os.path.normpath(path.absolute()), None)
+        self._resolved.clear()
+        self._direct_dependencies.clear()
+        self._closures.clear()
+
+    def _expand(self, search_path: Optional[str], origin: str, elf_info: ElfInfo) -> List[str]:
+        if not search_path:
+            return []
+        lib_dir = "lib64" if elf_info.elf_class == ELFCLASS64 else "lib"
+        dirs: List[str] = []
+        for entry in search_path.split(":"):
+            if entry == "":
+                continue
+            for token, value in (
+                ("$ORIGIN", origin),
+                ("$LIB", lib_dir),
+                ("$PLATFORM", machine()),
+            ):
+                entry = entry.replace("${" + token[1:] + "}", value).replace(token, value)
+            dirs.append(entry)
+        return dirs
+
+    def _is_compatible(self, path: str, requester: ElfInfo) -> bool:
+        candidate = self.elf_info(path)
+        return (
+            candidate is not None
+            and candidate.elf_class == requester.elf_class
+            and candidate.machine == requester.machine
+        )
+
+    def _search(self, soname: str, dirs: Tuple[str, ...], requester: ElfInfo) -> Optional[str]:
+        key = (dirs, soname, requester.elf_class, requester.machine)
+        cached = self._resolved.get(key, _MISSING)
+        if cached is not _MISSING:
+            return cast(Optional[str], cached)
+
+        found: Optional[str] = None
+        if "/" in soname:
+            if self._is_compatible(soname, requester):
+                found = os.path.normpath(soname)
+        else:
+            for directory in dirs:
+                candidate = os.path.normpath(os.path.join(directory, soname))
+                if self._is_compatible(candidate, requester):
+                    found = candidate
+                    break
+            else:
+                default_dirs = (
+                    DEFAULT_LIB_DIRS_64
+                    if requester.elf_class == ELFCLASS64
+                    else DEFAULT_LIB_DIRS_32
+                )
+                candidates = self.ld_so_cache.get(soname, []) + [
+                    os.path.join(directory, soname) for directory in default_dirs
+                ]
+                found = next(
+                    (
+                        os.path.normpath(candidate)
+                        for candidate in candidates
+                        if self._is_compatible(candidate, requester)
+                    ),
+                    None,
+                )
+        self._resolved[key] = found
+        return found
+
+    def _search_dirs(
+        self, path: str, elf_info: ElfInfo, inherited_rpath: Tuple[str, ...]
+    ) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+        # returns directories to search needed libraries of the object and rpath chain,
+        # that is inherited by its dependencies
+        origin = os.path.dirname(path)
+        runpath = self._expand(elf_info.runpath, origin, elf_info)
+        # DT_RPATH is ignored if DT_RUNPATH is present
+        own_rpath = (
+            [] if elf_info.runpath is not None
+            else self._expand(elf_info.rpath, origin, elf_info)
+        )
+        rpath_chain = tuple(own_rpath) + inherited_rpath
+        search_dirs = (
+            (() if elf_info.runpath is not None else rpath_chain)
+            + tuple(self._ld_library_path)
+            + tuple(runpath)
+        )
+        return search_dirs, rpath_chain
+
+    def _failed_lookups(
+        self, soname: str, dirs: Tuple[str, ...], requester: ElfInfo, found: Optional[str]
+    ) -> int:
+        if "/" in soname:
+            return 0
+        failed = 0
+        for directory in dirs:
+            if os.path.normpath(os.path.join(directory, soname)) == found:
+                return failed
+            failed += 1
+        # ld.so.cache lookup doesn't touch the file system, default directories do
+        if found is not None and found in self.ld_so_cache.get(soname, []):
+            return failed
+        default_dirs = (
+            DEFAULT_LIB_DIRS_64 if requester.elf_class == ELFCLASS64 else DEFAULT_LIB_DIRS_32
+        )
+        for directory in default_dirs:
+            if os.path.normpath(os.path.join(directory, soname)) == found:
+                return failed
+            failed += 1
+        return failed
+
+    def _direct(self, path: str, inherited_rpath: Tuple[str, ...]) -> List[_Dependency]:
+        key = (path, inherited_rpath)
+        cached = self._direct_dependencies.get(key)
+        if cached is not None:
+            return cached
+
+        elf_info = self.elf_info(path)
+        dependencies: List[_Dependency] = []
+        if elf_info is not None:
+            search_dirs, rpath_chain = self._search_dirs(path, elf_info, inherited_rpath)
+            for soname in elf_info.needed:
+                found = self._search(soname, search_dirs, elf_info)
+                dependencies.append((soname, found, rpath_chain))
+        self._direct_dependencies[key] = dependencies
+        return dependencies
+
+    def _closure(
+        self, path: str, inherited_rpath: Tuple[str, ...]
+    ) -> List[Tuple[str, Optional[str]]]:
+        key = (path, inherited_rpath)
+        cached = self._closures.get(key)
+        if cached is not None:
+            return cached
+
+        elf_info = self.elf_info(path)
+        # ld.so doesn't load library again if library with the same name or soname is
+        # already loaded: the object itself and the dynamic loader
+        loaded: Set[str] = {os.path.basename(path)}
+        if elf_info is not None:
+            if elf_info.soname is not None:
+                loaded.add(elf_info.soname)
+            if elf_info.interpreter is not None:
+                loaded.add(os.path.basename(elf_info.interpreter))
+
+        closure: List[Tuple[str, Optional[str]]] = []
+        queue = deque([(path, inherited_rpath)])
+        while queue:
+            current, current_inherited = queue.popleft()
+            for soname, found, rpath_chain in self._direct(current, current_inherited):
+                if soname in loaded or _DYNAMIC_LOADER_RE.match(soname):
+                    continue
+                loaded.add(soname)
+                closure.append((soname, found))
+                if found is None:
+                    continue
+                found_info = self.elf_info(found)
+                if found_info is not None and found_info.soname is not None:
+                    loaded.add(found_info.soname)
+                queue.append((found, rpath_chain))
+
+        self._closures[key] = closure
+        return closure
+
+    def lookups(self, path: Path) -> List[LoaderLookup]:
+        """Simulate library lookups of the dynamic loader, when the file is loaded.
+
+        Every candidate path, that is tried before the library is found, is a failed
+        `openat` call at startup. Directories are counted as if they exist, ld.so skips
+        missing ones after the first attempt.
+
+        Args:
+            path (Path): path to executable or shared library
+
+        Returns:
+            List[LoaderLookup]: lookups in the order of loading
+        """
+        normalized_path = os.path.normpath(path.absolute())
+        elf_info = self.elf_info(normalized_path)
+        if elf_info is None or not elf_info.has_dynamic:
+            return []
+
+        loaded: Set[str] = {os.path.basename(normalized_path)}
+        if elf_info.soname is not None:
+            loaded.add(elf_info.soname)
+        if elf_info.interpreter is not None:
+            loaded.add(os.path.basename(elf_info.interpreter))
+        lookups: List[LoaderLookup] = []
+        queue: Deque[Tuple[str, Tuple[str, ...]]] = deque([(normalized_path, ())])
+        while queue:
+            current, inherited_rpath = queue.popleft()
+            current_info = self.elf_info(current)
+            if current_info is None:
+                continue
+            search_dirs, rpath_chain = self._search_dirs(current, current_info, inherited_rpath)
+            for soname in current_info.needed:
+                if soname in loaded or _DYNAMIC_LOADER_RE.match(soname):
+                    continue
+                loaded.add(soname)
+                found = self._search(soname, search_dirs, current_info)
+                lookups.append(
+                    LoaderLookup(
+                        current,
+                        soname,
+                        found,
+                        self._failed_lookups(soname, search_dirs, current_info, found),
+                    )
+                )
+                if found is None:
+                    continue
+                found_info = self.elf_info(found)
+                if found_info is not None and found_info.soname is not None:
+                    loaded.add(found_info.soname)
+                queue.append((found, rpath_chain))
+        return lookups
+
+    def direct_dependencies(self, path: Path) -> List[Tuple[str, Optional[str]]]:
+        """Get needed libraries of the file and where they are found.
+
+        Args:
+            path (Path): path to executable or shared library
+
+        Returns:
+            List[Tuple[str, Optional[str]]]: needed names and found paths or None
+        """
+        normalized_path = os.path.normpath(path.absolute())
+        return [(soname, found) for soname, found, _ in self._direct(normalized_path, ())]
+
+    def dependencies(self, path: Path) -> Optional[LinkedLibraries]:
+        """Get all libraries that will be loaded with the given file.
+
+        Args:
+            path (Path): path to executable or shared library
+
+        Returns:
+            Optional[LinkedLibraries]: linked and not found libraries, None if file is not
+                                       a dynamic ELF file
+        """
+        normalized_path = os.path.normpath(path.absolute())
+        elf_info = self.elf_info(normalized_path)
+        if elf_info is None or not elf_info.has_dynamic:
+            return None
+
+        result = LinkedLibraries()
+        for soname, found in self._closure(normalized_path, ()):
+            if found is None:
+                result.not_found.append(soname)
+            else:
+                result.linked.append(found)
+        return result
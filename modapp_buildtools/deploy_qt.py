@@ -1,30 +1,32 @@
 from pathlib import Path
+from shutil import copy2
 from typing import Optional, List
 from sys import exit
-from shutil import copytree
-from os import makedirs
-from string import Template
 
 from loguru import logger
 
-from modapp_buildtools.file_utils import is_executable, is_shared_library
+from modapp_buildtools import profiling
+from modapp_buildtools.artifact_cache import ArtifactCache, default_cache_dir
+from modapp_buildtools.command_engine import configure as configure_commands
+from modapp_buildtools.dedupe import dedupe_files
+from modapp_buildtools.dependency_resolver import DependencyResolver
+from modapp_buildtools.file_scanner import scan_tree
 from modapp_buildtools.check_linking import check_linking_in_files
-from modapp_buildtools.rpath_utils import add_relative_rpath_if_needed
-
-
-def create_qt_conf(destination: Path, prefix: str) -> None:
-    template_path = Path(__file__).parent / "resources" / "linux_qt" / "qt.conf.template"
-    with open(template_path) as template_file:
-        qt_conf_template = Template(template_file.read())
-
-    qt_conf_content = qt_conf_template.safe_substitute(
-        {
-            "Prefix": prefix,
-        }
-    )
-
-    with open(destination / 'qt.conf', "w") as output_file:
-        output_file.write(qt_conf_content)
+from modapp_buildtools.library_index import LibraryIndex
+from modapp_buildtools.linking_watch import watch_linking
+from modapp_buildtools.options import LinkMode
+from modapp_buildtools.prune import find_unused_libraries
+from modapp_buildtools.qml_scanner import (
+    copy_qml_module,
+    find_used_qml_modules,
+    qml_imports_cache_path,
+)
+# appimage_post_deploy is re-exported, it was defined here before
+from modapp_buildtools.qt_conf import appimage_post_deploy, create_qt_conf  # noqa: F401
+from modapp_buildtools.qt_plugins import deploy_qt_plugins
+from modapp_buildtools.rpath_normalizer import normalize_rpaths
+from modapp_buildtools.rpath_utils import add_relative_rpaths_if_needed
+from modapp_buildtools.strip import strip_binaries
 
 
 def deploy_qt(
@@ -34,75 +36,191 @@ def deploy_qt(
     fix: bool = False,
     plugins: Optional[List[str]] = None,
     qml_dir: Optional[Path] = None,
+    use_cache: bool = True,
+    jobs: Optional[int] = None,
+    exclude_plugins: Optional[List[str]] = None,
+    prune: bool = False,
+    keep_libraries: Optional[List[str]] = None,
+    normalize_rpath: bool = False,
+    strip: bool = False,
+    debug_dir: Optional[Path] = None,
+    dedupe: Optional[LinkMode] = None,
+    report_path: Optional[Path] = None,
+    fail_fast: bool = False,
+    policies: Optional[List[str]] = None,
+    watch: bool = False,
 ) -> None:
+    configure_commands(jobs)
     app_path = bin_path
     app_lib_path = app_path / "lib"
 
     create_qt_conf(app_path / "bin", "../lib/")
+    # plugins and QML libraries with updated rpath are shared between builds
+    artifact_cache = (
+        ArtifactCache(default_cache_dir(), qt_path, app_lib_path, jobs=jobs) if use_cache else None
+    )
+    copy_function = artifact_cache.copy if artifact_cache is not None else copy2
 
-    if plugins is not None:
-        app_plugins_path = app_lib_path / "plugins"
-        if not app_plugins_path.exists():
-            makedirs(app_plugins_path)
-        for plugin in plugins:
-            copytree(qt_path / "plugins" / plugin, app_plugins_path / plugin, dirs_exist_ok=True)
-            # in default qt installation plugins dir is on the same level with lib dir, we
-            # place plugins inside lib, rpath should be updated
-            # TODO: make parallel
-            for file in (app_plugins_path / plugin).rglob("*"):
-                if is_shared_library(file):
-                    add_relative_rpath_if_needed(file, app_lib_path)
-
+    # in default qt installation plugins and qml dirs are on the same level with lib dir, we
+    # place them inside lib, rpath of their libraries should be updated
+    files_to_update: List[Path] = []
     if qml_dir is not None:
-        # temporary solution: copy all default qml modules
-        # TODO: copy only needed
+        # only modules, that are imported by the app directly or transitively
         app_qml_dir = app_lib_path / "qml"
-        copytree(qt_path / "qml", app_qml_dir, dirs_exist_ok=True)
-        # in default qt installation qml dir is on the same level with lib dir, we
-        # place qml inside lib, rpath should be updated
-        # TODO: make parallel
-        for file in (app_qml_dir).rglob("*"):
-            if is_shared_library(file):
-                add_relative_rpath_if_needed(file, app_lib_path)
-
-    files_to_check: List[Path] = []
-    available_libs: List[Path] = []
+        qt_qml_dir = qt_path / "qml"
+        with profiling.stage("find QML modules"):
+            qml_modules = find_used_qml_modules(
+                qml_dir,
+                qt_qml_dir,
+                cache_path=qml_imports_cache_path(app_path) if use_cache else None,
+            )
+        logger.info(f"Deploy {len(qml_modules)} QML modules: {', '.join(map(str, qml_modules))}")
+        with profiling.stage("copy QML modules"):
+            for qml_module in qml_modules:
+                copy_qml_module(qt_qml_dir, qml_module, app_qml_dir, copy_function=copy_function)
+            if app_qml_dir.exists():
+                files_to_update += scan_tree(app_qml_dir).shared_libraries
+
+    # QML modules are already copied, the tree is scanned only once. The resolver is shared
+    # between plugin selection and linking check
+    with profiling.stage("scan"):
+        manifest = scan_tree(bin_path)
+    resolver = DependencyResolver()
+    files_to_check = manifest.binaries
+    available_libs = [library.absolute() for library in manifest.shared_libraries]
+
+    qt_plugins_path = qt_path / "plugins"
+    if qt_plugins_path.is_dir():
+        with profiling.stage("Qt plugins"):
+            plugin_files = deploy_qt_plugins(
+                qt_plugins_path,
+                app_lib_path / "plugins",
+                manifest.binaries,
+                resolver,
+                plugins=plugins,
+                exclude_plugins=exclude_plugins,
+                copy_function=copy_function,
+            )
+        files_to_update += plugin_files
+        if bin_path.is_dir():
+            # plugins can be already in the app after previous deployment
+            files_to_check = list(dict.fromkeys(files_to_check + plugin_files))
+            available_libs = list(
+                dict.fromkeys(available_libs + [plugin.absolute() for plugin in plugin_files])
+            )
+    elif plugins is not None:
+        raise Exception(f"Qt plugins directory {qt_plugins_path} not found")
+
+    with profiling.stage("rpath"):
+        rpaths_are_updated = add_relative_rpaths_if_needed(
+            files_to_update, app_lib_path, jobs=jobs
+        )
+    if not rpaths_are_updated:
+        logger.error("Failed to update rpath of plugins and QML modules, see logs above")
+        exit(1)
+    for updated_file in files_to_update:
+        resolver.invalidate(updated_file)
+    if artifact_cache is not None:
+        with profiling.stage("store in artifact cache"):
+            artifact_cache.store_pending()
+        artifact_cache.log_statistics()
+
     if bin_path.is_file():
-        files_to_check.append(bin_path)
         app_path = bin_path.parent
         # TODO
         print(app_path.name)
         if app_path.name == "lib":
             app_path = app_path.parent
-    elif bin_path.is_dir():
-        for app_file in bin_path.rglob("*"):
-            if is_executable(app_file) or is_shared_library(app_file):
-                files_to_check.append(app_file)
-                if is_shared_library(app_file):
-                    available_libs.append(app_file.absolute())
 
     qt_lib_path = qt_path / "lib"
     if not qt_lib_path.exists():
         raise Exception()
-    for qt_file in qt_lib_path.rglob("*"):
-        if is_shared_library(qt_file):
-            available_libs.append(qt_file.absolute())
+    # app libraries have priority over Qt libraries
+    with profiling.stage("scan Qt libraries"):
+        library_index = LibraryIndex(available_libs)
+        library_index.add_libraries(
+            qt_file.absolute() for qt_file in scan_tree(qt_lib_path).shared_libraries
+        )
 
     logger.info(f"Working directory: {app_path}")
     linking_is_ok = check_linking_in_files(
         files_to_check,
         allowed_libs=allowed_libs,
-        available_libs=available_libs,
+        available_libs=library_index,
         fix=fix,
         app_path=app_path,
+        resolver=resolver,
+        use_cache=use_cache,
+        jobs=jobs,
+        report_path=report_path,
+        fail_fast=fail_fast,
+        policies=policies,
     )
 
+    def watch_app() -> None:
+        # Qt libraries stay available for fixes of changed files
+        watch_linking(
+            app_path,
+            allowed_libs=allowed_libs,
+            fix=fix,
+            jobs=jobs,
+            policies=policies,
+            resolver=resolver,
+            available_libs=library_index,
+        )
+
     if not linking_is_ok:
         logger.error("Linking check failed, see logs above")
+        if watch:
+            # the app is fixed while being watched, other steps are skipped
+            watch_app()
+            return
         exit(1)
     else:
         logger.success("Linking is correct")
 
-
-def appimage_post_deploy(app_run_dir_path: Path) -> None:
-    create_qt_conf(app_run_dir_path / "lib64", "../usr/lib/")
+    if prune and bin_path.is_dir():
+        # after fixes all needed libraries are in the app, unused ones can be removed
+        with profiling.stage("prune"):
+            prune_result = find_unused_libraries(
+                scan_tree(app_path), app_path, resolver=resolver, keep_patterns=keep_libraries
+            )
+            for unused_library in prune_result.removed:
+                unused_library.path.unlink()
+        prune_result.log()
+
+    if normalize_rpath and bin_path.is_dir():
+        with profiling.stage("normalize rpath"):
+            manifest = scan_tree(app_path)
+            normalize_result = normalize_rpaths(
+                manifest.binaries,
+                app_path,
+                resolver=resolver,
+                libraries=LibraryIndex(
+                    library.absolute() for library in manifest.shared_libraries
+                ),
+                jobs=jobs,
+            )
+        normalize_result.log()
+
+    if strip:
+        # the last step: linking is already checked and fixed, unused libraries are removed
+        with profiling.stage("strip"):
+            strip_result = strip_binaries(
+                scan_tree(bin_path).binaries, app_path, debug_dir=debug_dir, jobs=jobs
+            )
+        strip_result.log()
+
+    if dedupe is not None and bin_path.is_dir():
+        # after stripping: identical libraries can differ only in debug information
+        with profiling.stage("dedupe"):
+            dedupe_result = dedupe_files(
+                [entry.path for entry in scan_tree(app_path)],
+                mode=dedupe,
+                resolver=resolver,
+                jobs=jobs,
+            )
+        dedupe_result.log()
+
+    if watch:
+        watch_app()
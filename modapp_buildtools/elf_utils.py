@@ -0,0 +1,460 @@
+import mmap
+import struct
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+ELF_MAGIC = b"\x7fELF"
+# size of e_ident, class and data encoding are read from it
+EI_NIDENT = 16
+
+ELFCLASS32 = 1
+ELFCLASS64 = 2
+ELFDATA2LSB = 1
+
+ET_EXEC = 2
+ET_DYN = 3
+
+PT_LOAD = 1
+PT_DYNAMIC = 2
+PT_INTERP = 3
+
+DT_NULL = 0
+DT_NEEDED = 1
+DT_STRTAB = 5
+DT_STRSZ = 10
+DT_SONAME = 14
+DT_RPATH = 15
+DT_RUNPATH = 29
+DT_FLAGS_1 = 0x6FFFFFFB
+DT_AUXILIARY = 0x7FFFFFFD
+DT_FILTER = 0x7FFFFFFF
+# dynamic entries, which values are offsets in the dynamic string table
+STRING_DYNAMIC_TAGS = (DT_NEEDED, DT_SONAME, DT_RPATH, DT_RUNPATH, DT_AUXILIARY, DT_FILTER)
+
+DF_1_PIE = 0x08000000
+
+SHT_SYMTAB = 2
+SHT_DYNSYM = 11
+SHT_GNU_VERDEF = 0x6FFFFFFD
+SHT_GNU_VERNEED = 0x6FFFFFFE
+SHT_GNU_VERSYM = 0x6FFFFFFF
+
+SHN_UNDEF = 0
+STB_LOCAL = 0
+STB_WEAK = 2
+STV_INTERNAL = 1
+STV_HIDDEN = 2
+# version indices of .gnu.version: local symbol, unversioned global symbol
+VER_NDX_LOCAL = 0
+VER_NDX_GLOBAL = 1
+VERSYM_HIDDEN = 0x8000
+VER_FLG_BASE = 0x1
+
+
+class ElfError(Exception):
+    pass
+
+
+@dataclass
+class DynamicEntry:
+    tag: int
+    value: int
+    # position of the entry in the file, required to modify it in-place
+    offset: int
+
+
+@dataclass
+class ElfInfo:
+    path: Path
+    elf_class: int
+    little_endian: bool
+    machine: int
+    elf_type: int
+    interpreter: Optional[str] = None
+    has_dynamic: bool = False
+    needed: List[str] = field(default_factory=list)
+    soname: Optional[str] = None
+    rpath: Optional[str] = None
+    runpath: Optional[str] = None
+    flags_1: int = 0
+    dynamic_entries: List[DynamicEntry] = field(default_factory=list)
+    dynamic_entry_size: int = 0
+    dynstr_offset: Optional[int] = None
+    dynstr_size: int = 0
+
+    def dynamic_entry(self, tag: int) -> Optional[DynamicEntry]:
+        return next((entry for entry in self.dynamic_entries if entry.tag == tag), None)
+
+    @property
+    def rpaths(self) -> List[str]:
+        # the same as `patchelf --print-rpath`: DT_RUNPATH has priority over DT_RPATH
+        search_path = self.runpath if self.runpath is not None else self.rpath
+        if not search_path:
+            return []
+        return search_path.split(":")
+
+    @property
+    def is_pie(self) -> bool:
+        return self.flags_1 & DF_1_PIE != 0
+
+
+@dataclass
+class ImportedSymbol:
+    name: str
+    # e.g. GLIBC_2.17, None for unversioned references
+    version: Optional[str] = None
+    # soname of the library, that must define the version
+    library: Optional[str] = None
+    weak: bool = False
+
+
+@dataclass
+class DynamicSymbols:
+    path: Path
+    # defined global symbols: (name, version)
+    exported: List[Tuple[str, Optional[str]]] = field(default_factory=list)
+    imported: List[ImportedSymbol] = field(default_factory=list)
+    # soname -> versions, that are required from it
+    required_versions: Dict[str, List[str]] = field(default_factory=dict)
+
+
+class _ElfReader:
+    def __init__(self, data: mmap.mmap, path: Path) -> None:
+        self.data = data
+        self.path = path
+        if len(data) < EI_NIDENT:
+            # e.g. the file is still being written by the linker
+            raise ElfError(f"{path}: truncated ELF header")
+        self.elf_class = data[4]
+        if self.elf_class not in (ELFCLASS32, ELFCLASS64):
+            raise ElfError(f"{path}: unsupported ELF class {self.elf_class}")
+        self.little_endian = data[5] == ELFDATA2LSB
+        self.endian = "<" if self.little_endian else ">"
+        self.is_64 = self.elf_class == ELFCLASS64
+
+    def unpack(self, fmt: str, offset: int) -> Tuple[Any, ...]:
+        try:
+            return struct.unpack_from(self.endian + fmt, self.data, offset)
+        except struct.error as error:
+            raise ElfError(f"{self.path}: truncated ELF file") from error
+
+    def read_cstring(self, offset: int) -> str:
+        end = self.data.find(b"\0", offset)
+        if end == -1:
+            raise ElfError(f"{self.path}: unterminated string at {offset}")
+        return self.data[offset:end].decode("utf-8", errors="surrogateescape")
+
+
+def _vaddr_to_offset(loads: List[Tuple[int, int, int]], vaddr: int) -> Optional[int]:
+    for p_offset, p_vaddr, p_filesz in loads:
+        if p_vaddr <= vaddr < p_vaddr + p_filesz:
+            return p_offset + vaddr - p_vaddr
+    return None
+
+
+def _parse(reader: _ElfReader) -> ElfInfo:
+    if reader.is_64:
+        header = reader.unpack("HHIQQQIHHHHHH", 16)
+        phdr_format = "IIQQQQQQ"
+        dyn_format = "qQ"
+    else:
+        header = reader.unpack("HHIIIIIHHHHHH", 16)
+        phdr_format = "IIIIIIII"
+        dyn_format = "iI"
+    e_type, e_machine = header[0], header[1]
+    e_phoff, e_phentsize, e_phnum = header[4], header[8], header[9]
+
+    info = ElfInfo(
+        path=reader.path,
+        elf_class=reader.elf_class,
+        little_endian=reader.little_endian,
+        machine=e_machine,
+        elf_type=e_type,
+    )
+
+    loads: List[Tuple[int, int, int]] = []
+    dynamic: Optional[Tuple[int, int]] = None
+    for index in range(e_phnum):
+        phdr = reader.unpack(phdr_format, e_phoff + index * e_phentsize)
+        if reader.is_64:
+            p_type, _, p_offset, p_vaddr, _, p_filesz, _, _ = phdr
+        else:
+            p_type, p_offset, p_vaddr, _, p_filesz, _, _, _ = phdr
+        if p_type == PT_LOAD:
+            loads.append((p_offset, p_vaddr, p_filesz))
+        elif p_type == PT_DYNAMIC:
+            dynamic = (p_offset, p_filesz)
+        elif p_type == PT_INTERP:
+            info.interpreter = reader.read_cstring(p_offset)
+
+    if dynamic is None:
+        return info
+    info.has_dynamic = True
+
+    dyn_offset, dyn_size = dynamic
+    info.dynamic_entry_size = struct.calcsize(dyn_format)
+    for entry_offset in range(dyn_offset, dyn_offset + dyn_size, info.dynamic_entry_size):
+        tag, value = reader.unpack(dyn_format, entry_offset)
+        if tag == DT_NULL:
+            break
+        info.dynamic_entries.append(DynamicEntry(tag, value, entry_offset))
+
+    strtab_entry = info.dynamic_entry(DT_STRTAB)
+    if strtab_entry is None:
+        raise ElfError(f"{reader.path}: dynamic section without DT_STRTAB")
+    strtab_offset = _vaddr_to_offset(loads, strtab_entry.value)
+    if strtab_offset is None:
+        raise ElfError(f"{reader.path}: DT_STRTAB is outside of loadable segments")
+    info.dynstr_offset = strtab_offset
+    strsz_entry = info.dynamic_entry(DT_STRSZ)
+    info.dynstr_size = strsz_entry.value if strsz_entry is not None else 0
+
+    for tag, value in ((entry.tag, entry.value) for entry in info.dynamic_entries):
+        if tag == DT_NEEDED:
+            info.needed.append(reader.read_cstring(strtab_offset + value))
+        elif tag == DT_SONAME:
+            info.soname = reader.read_cstring(strtab_offset + value)
+        elif tag == DT_RPATH:
+            info.rpath = reader.read_cstring(strtab_offset + value)
+        elif tag == DT_RUNPATH:
+            info.runpath = reader.read_cstring(strtab_offset + value)
+        elif tag == DT_FLAGS_1:
+            info.flags_1 = value
+    return info
+
+
+def is_elf(path: Path) -> bool:
+    try:
+        with open(path, "rb") as elf_file:
+            return elf_file.read(4) == ELF_MAGIC
+    except OSError:
+        return False
+
+
+def read_elf(path: Path) -> Optional[ElfInfo]:
+    """Read dynamic linking information of ELF file without running external tools.
+
+    Args:
+        path (Path): path to file
+
+    Returns:
+        Optional[ElfInfo]: parsed information or None if file is not an ELF file
+
+    Raises:
+        ElfError: file is an ELF file, but it is malformed
+    """
+    with open(path, "rb") as elf_file:
+        if elf_file.read(4) != ELF_MAGIC:
+            return None
+        with mmap.mmap(elf_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return _parse(_ElfReader(data, path))
+
+
+def _section_string_references(reader: _ElfReader, info: ElfInfo) -> Optional[Set[int]]:
+    if reader.is_64:
+        header = reader.unpack("HHIQQQIHHHHHH", 16)
+        shdr_format = "IIQQQQIIQQ"
+    else:
+        header = reader.unpack("HHIIIIIHHHHHH", 16)
+        shdr_format = "IIIIIIIIII"
+    e_shoff, e_shentsize, e_shnum = header[5], header[10], header[11]
+    if e_shoff == 0 or e_shnum == 0:
+        return None
+
+    references: Set[int] = set()
+    for index in range(e_shnum):
+        _, sh_type, _, _, sh_offset, sh_size, _, sh_info, _, sh_entsize = reader.unpack(
+            shdr_format, e_shoff + index * e_shentsize
+        )
+        if sh_type == SHT_DYNSYM:
+            symbol_size = sh_entsize or (24 if reader.is_64 else 16)
+            for symbol_offset in range(sh_offset, sh_offset + sh_size, symbol_size):
+                references.add(reader.unpack("I", symbol_offset)[0])
+        elif sh_type == SHT_GNU_VERNEED:
+            offset = sh_offset
+            for _ in range(sh_info):
+                _, vn_cnt, vn_file, vn_aux, vn_next = reader.unpack("HHIII", offset)
+                references.add(vn_file)
+                aux_offset = offset + vn_aux
+                for _ in range(vn_cnt):
+                    _, _, _, vna_name, vna_next = reader.unpack("IHHII", aux_offset)
+                    references.add(vna_name)
+                    aux_offset += vna_next
+                offset += vn_next
+        elif sh_type == SHT_GNU_VERDEF:
+            offset = sh_offset
+            for _ in range(sh_info):
+                _, _, _, vd_cnt, _, vd_aux, vd_next = reader.unpack("HHHHIII", offset)
+                aux_offset = offset + vd_aux
+                for _ in range(vd_cnt):
+                    vda_name, vda_next = reader.unpack("II", aux_offset)
+                    references.add(vda_name)
+                    aux_offset += vda_next
+                offset += vd_next
+    references.update(
+        entry.value for entry in info.dynamic_entries if entry.tag in STRING_DYNAMIC_TAGS
+    )
+    return references
+
+
+def read_string_references(path: Path) -> Optional[Set[int]]:
+    """Collect offsets of all strings in the dynamic string table, that are used in the file.
+
+    Linkers merge string tails, so that one string can be a part of another one. String can
+    be safely rewritten in-place only if nothing points inside of it.
+
+    Args:
+        path (Path): path to ELF file
+
+    Returns:
+        Optional[Set[int]]: offsets relative to the dynamic string table or None if they
+                            cannot be determined, e.g. because section headers are stripped
+    """
+    with open(path, "rb") as elf_file:
+        if elf_file.read(4) != ELF_MAGIC:
+            return None
+        with mmap.mmap(elf_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            reader = _ElfReader(data, path)
+            return _section_string_references(reader, _parse(reader))
+
+
+def _has_debug_sections(reader: _ElfReader) -> bool:
+    if reader.is_64:
+        header = reader.unpack("HHIQQQIHHHHHH", 16)
+        shdr_format = "IIQQQQIIQQ"
+    else:
+        header = reader.unpack("HHIIIIIHHHHHH", 16)
+        shdr_format = "IIIIIIIIII"
+    e_shoff, e_shentsize, e_shnum, e_shstrndx = header[5], header[10], header[11], header[12]
+    if e_shoff == 0 or e_shnum == 0 or e_shstrndx >= e_shnum:
+        return False
+
+    names_offset = reader.unpack(shdr_format, e_shoff + e_shstrndx * e_shentsize)[4]
+    for index in range(e_shnum):
+        sh_name, sh_type = reader.unpack(shdr_format, e_shoff + index * e_shentsize)[:2]
+        if sh_type == SHT_SYMTAB:
+            return True
+        name = reader.read_cstring(names_offset + sh_name)
+        if name.startswith(".debug_") or name.startswith(".zdebug_"):
+            return True
+    return False
+
+
+def is_stripped(path: Path) -> bool:
+    """Check that ELF file has neither symbol table nor debug information.
+
+    Args:
+        path (Path): path to ELF file
+
+    Returns:
+        bool: True if there is nothing to strip
+    """
+    with open(path, "rb") as elf_file:
+        if elf_file.read(4) != ELF_MAGIC:
+            return True
+        with mmap.mmap(elf_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return not _has_debug_sections(_ElfReader(data, path))
+
+
+def _section_headers(reader: _ElfReader) -> List[Tuple[int, ...]]:
+    if reader.is_64:
+        header = reader.unpack("HHIQQQIHHHHHH", 16)
+        shdr_format = "IIQQQQIIQQ"
+    else:
+        header = reader.unpack("HHIIIIIHHHHHH", 16)
+        shdr_format = "IIIIIIIIII"
+    e_shoff, e_shentsize, e_shnum = header[5], header[10], header[11]
+    if e_shoff == 0:
+        return []
+    return [reader.unpack(shdr_format, e_shoff + index * e_shentsize) for index in range(e_shnum)]
+
+
+def _dynamic_symbols(reader: _ElfReader) -> DynamicSymbols:
+    symbols = DynamicSymbols(reader.path)
+    section_headers = _section_headers(reader)
+    sections = {shdr[1]: shdr for shdr in section_headers}
+    dynsym = sections.get(SHT_DYNSYM)
+    if dynsym is None:
+        return symbols
+    _, _, _, _, dynsym_offset, dynsym_size, sh_link, _, _, sh_entsize = dynsym
+    names_offset = section_headers[sh_link][4]
+
+    # version index -> (version name, soname of the library for required versions)
+    versions: Dict[int, Tuple[Optional[str], Optional[str]]] = {}
+    verneed = sections.get(SHT_GNU_VERNEED)
+    if verneed is not None:
+        offset = verneed[4]
+        for _ in range(verneed[7]):
+            _, vn_cnt, vn_file, vn_aux, vn_next = reader.unpack("HHIII", offset)
+            library = reader.read_cstring(names_offset + vn_file)
+            aux_offset = offset + vn_aux
+            for _ in range(vn_cnt):
+                _, _, vna_other, vna_name, vna_next = reader.unpack("IHHII", aux_offset)
+                version = reader.read_cstring(names_offset + vna_name)
+                versions[vna_other] = (version, library)
+                symbols.required_versions.setdefault(library, []).append(version)
+                aux_offset += vna_next
+            offset += vn_next
+    verdef = sections.get(SHT_GNU_VERDEF)
+    if verdef is not None:
+        offset = verdef[4]
+        for _ in range(verdef[7]):
+            _, vd_flags, vd_ndx, _, _, vd_aux, vd_next = reader.unpack("HHHHIII", offset)
+            # the base definition is the soname, symbols with it are unversioned
+            if not vd_flags & VER_FLG_BASE:
+                vda_name = reader.unpack("I", offset + vd_aux)[0]
+                versions[vd_ndx] = (reader.read_cstring(names_offset + vda_name), None)
+            offset += vd_next
+
+    symbol_format = reader.endian + ("IBBHQQ" if reader.is_64 else "IIIBBH")
+    symbol_size = sh_entsize or struct.calcsize(symbol_format)
+    symbol_count = dynsym_size // symbol_size
+    versym = sections.get(SHT_GNU_VERSYM)
+    version_indices = (
+        struct.unpack_from(f"{reader.endian}{symbol_count}H", reader.data, versym[4])
+        if versym is not None
+        else (VER_NDX_GLOBAL,) * symbol_count
+    )
+    table = reader.data[dynsym_offset:dynsym_offset + symbol_count * symbol_size]
+    # the first symbol is always the undefined null symbol
+    for index, entry in enumerate(struct.iter_unpack(symbol_format, table)):
+        if reader.is_64:
+            st_name, st_info, st_other, st_shndx, _, _ = entry
+        else:
+            st_name, _, _, st_info, st_other, st_shndx = entry
+        binding = st_info >> 4
+        if index == 0 or binding == STB_LOCAL or st_other & 0x3 in (STV_INTERNAL, STV_HIDDEN):
+            continue
+        version_index = version_indices[index] & ~VERSYM_HIDDEN
+        if version_index == VER_NDX_LOCAL:
+            continue
+        name = reader.read_cstring(names_offset + st_name)
+        symbol_version, symbol_library = versions.get(version_index, (None, None))
+        if st_shndx == SHN_UNDEF:
+            symbols.imported.append(
+                ImportedSymbol(name, symbol_version, symbol_library, weak=binding == STB_WEAK)
+            )
+        else:
+            symbols.exported.append((name, symbol_version))
+    return symbols
+
+
+def read_dynamic_symbols(path: Path) -> Optional[DynamicSymbols]:
+    """Read imported and exported symbols with their versions from .dynsym, .gnu.version,
+    .gnu.version_r and .gnu.version_d sections.
+
+    Args:
+        path (Path): path to ELF file
+
+    Returns:
+        Optional[DynamicSymbols]: symbols or None if file is not an ELF file
+
+    Raises:
+        ElfError: file is an ELF file, but it is malformed
+    """
+    with open(path, "rb") as elf_file:
+        if elf_file.read(4) != ELF_MAGIC:
+            return None
+        with mmap.mmap(elf_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return _dynamic_symbols(_ElfReader(data, path))
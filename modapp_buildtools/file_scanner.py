@@ -0,0 +1,216 @@
+import os
+import stat
+import struct
+from dataclasses import dataclass, field
+from enum import Enum
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+from loguru import logger
+
+from modapp_buildtools.elf_utils import ELF_MAGIC, ET_DYN, ET_EXEC, ElfError, read_elf
+
+# Mach-O: 32 and 64 bit in both byte orders. Universal binaries have the same magic as java
+# class files, they are distinguished by the number of architectures
+_MACHO_MAGICS = {
+    b"\xfe\xed\xfa\xce": ">",
+    b"\xfe\xed\xfa\xcf": ">",
+    b"\xce\xfa\xed\xfe": "<",
+    b"\xcf\xfa\xed\xfe": "<",
+}
+_MACHO_FAT_MAGIC = b"\xca\xfe\xba\xbe"
+_MACHO_FAT_MAX_ARCHS = 30
+MH_EXECUTE = 2
+MH_DYLIB = 6
+MH_BUNDLE = 8
+
+# enough for ELF e_type and Mach-O filetype
+_HEADER_SIZE = 20
+
+
+class FileKind(Enum):
+    EXECUTABLE = "executable"
+    SHARED_LIBRARY = "shared_library"
+    OTHER = "other"
+
+
+@dataclass
+class ScannedFile:
+    path: Path
+    kind: FileKind
+    size: int
+    mtime_ns: int
+    mode: int
+    is_symlink: bool = False
+    is_elf: bool = False
+
+
+def _has_library_name(name: str) -> bool:
+    # 'lib.so', 'lib.so.1.1', 'libpython3.10.so', 'lib.dylib'
+    name_parts = name.split(".")
+    return "so" in name_parts or "dylib" in name_parts
+
+
+def _classify_elf(path: Path, header: bytes, mode: int) -> FileKind:
+    endian = "<" if header[5] == 1 else ">"
+    (elf_type,) = struct.unpack_from(endian + "H", header, 16)
+    if elf_type == ET_EXEC:
+        return FileKind.EXECUTABLE
+    if elf_type != ET_DYN:
+        # object files, core dumps
+        return FileKind.OTHER
+    if _has_library_name(path.name):
+        return FileKind.SHARED_LIBRARY
+    # position independent executables are ET_DYN as well. Only files without library
+    # name are parsed to tell them apart from unsuffixed libraries
+    try:
+        elf_info = read_elf(path)
+    except (OSError, ElfError) as error:
+        logger.debug(f"Failed to read {path}: {error}")
+        return FileKind.OTHER
+    if elf_info is not None and (
+        elf_info.is_pie or (elf_info.interpreter is not None and mode & stat.S_IXUSR)
+    ):
+        return FileKind.EXECUTABLE
+    return FileKind.SHARED_LIBRARY
+
+
+def _classify_macho(path: Path, header: bytes, mode: int) -> FileKind:
+    magic = header[:4]
+    if magic == _MACHO_FAT_MAGIC:
+        (archs_count,) = struct.unpack_from(">I", header, 4)
+        if archs_count > _MACHO_FAT_MAX_ARCHS:
+            # java class file
+            return FileKind.OTHER
+        # file type of universal binary is in its architecture slices, name is enough
+        if _has_library_name(path.name):
+            return FileKind.SHARED_LIBRARY
+        return FileKind.EXECUTABLE if mode & stat.S_IXUSR else FileKind.OTHER
+    (file_type,) = struct.unpack_from(_MACHO_MAGICS[magic] + "I", header, 12)
+    if file_type == MH_EXECUTE:
+        return FileKind.EXECUTABLE
+    if file_type in (MH_DYLIB, MH_BUNDLE):
+        return FileKind.SHARED_LIBRARY
+    return FileKind.OTHER
+
+
+def classify_file(path: Path, mode: int) -> Tuple[FileKind, bool]:
+    """Classify file by its content: ELF and Mach-O headers.
+
+    Args:
+        path (Path): path to regular file or symlink to it
+        mode (int): st_mode of the file
+
+    Returns:
+        Tuple[FileKind, bool]: kind of the file and whether it is an ELF file
+    """
+    try:
+        with open(path, "rb") as binary_file:
+            header = binary_file.read(_HEADER_SIZE)
+    except OSError as error:
+        logger.debug(f"Failed to read {path}: {error}")
+        return FileKind.OTHER, False
+
+    if len(header) < _HEADER_SIZE:
+        return FileKind.OTHER, False
+    if header.startswith(ELF_MAGIC):
+        return _classify_elf(path, header, mode), True
+    if header[:4] in _MACHO_MAGICS or header[:4] == _MACHO_FAT_MAGIC:
+        return _classify_macho(path, header, mode), False
+    return FileKind.OTHER, False
+
+
+def _scanned_file(path: Path, stat_result: os.stat_result, is_symlink: bool) -> ScannedFile:
+    kind, is_elf = classify_file(path, stat_result.st_mode)
+    return ScannedFile(
+        path,
+        kind,
+        size=stat_result.st_size,
+        mtime_ns=stat_result.st_mtime_ns,
+        mode=stat_result.st_mode,
+        is_symlink=is_symlink,
+        is_elf=is_elf,
+    )
+
+
+@dataclass
+class FileManifest:
+    """All regular files of the tree, classified once and shared between steps."""
+
+    root: Path
+    entries: List[ScannedFile] = field(default_factory=list)
+
+    def __iter__(self) -> Iterator[ScannedFile]:
+        return iter(self.entries)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _paths(self, kind: FileKind) -> List[Path]:
+        return [entry.path for entry in self.entries if entry.kind == kind]
+
+    @property
+    def executables(self) -> List[Path]:
+        return self._paths(FileKind.EXECUTABLE)
+
+    @property
+    def shared_libraries(self) -> List[Path]:
+        return self._paths(FileKind.SHARED_LIBRARY)
+
+    @property
+    def other_files(self) -> List[Path]:
+        return self._paths(FileKind.OTHER)
+
+    @property
+    def binaries(self) -> List[Path]:
+        return [entry.path for entry in self.entries if entry.kind != FileKind.OTHER]
+
+
+def _scan_dir(directory: str, entries: List[ScannedFile]) -> None:
+    # explicit stack instead of recursion: deep trees are possible in QML modules
+    directories = [directory]
+    while directories:
+        current = directories.pop()
+        try:
+            dir_entries = sorted(os.scandir(current), key=lambda entry: entry.name)
+        except OSError as error:
+            logger.warning(f"Failed to scan {current}: {error}")
+            continue
+        subdirectories: List[str] = []
+        for dir_entry in dir_entries:
+            try:
+                # symlinks to directories are not followed, the same as Path.rglob
+                if dir_entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(dir_entry.path)
+                    continue
+                # the only stat call for the file, file type of directories comes from scandir
+                stat_result = dir_entry.stat()
+            except OSError:
+                # broken symlink
+                continue
+            if not stat.S_ISREG(stat_result.st_mode):
+                continue
+            entries.append(
+                _scanned_file(Path(dir_entry.path), stat_result, dir_entry.is_symlink())
+            )
+        directories.extend(reversed(subdirectories))
+
+
+def scan_tree(root: Path) -> FileManifest:
+    """Scan directory tree (or a single file) once and classify all regular files.
+
+    Executables and shared libraries are recognized by their headers, not by names, so
+    that unsuffixed libraries are found and non-binary files named like libraries are not.
+
+    Args:
+        root (Path): directory or file
+
+    Returns:
+        FileManifest: classified files in stable order
+    """
+    manifest = FileManifest(root)
+    if root.is_dir():
+        _scan_dir(str(root), manifest.entries)
+    elif root.is_file():
+        manifest.entries.append(_scanned_file(root, root.stat(), root.is_symlink()))
+    return manifest
@@ -1,17 +1,45 @@
+import hashlib
+import mmap
+import os
 from pathlib import Path
-from os import access, X_OK
+
+from modapp_buildtools.file_scanner import FileKind, classify_file
+
+# smaller files are read at once, larger ones are mapped to memory instead of copying them
+# chunk by chunk. Hashing releases GIL, so files can be hashed in parallel threads
+MMAP_THRESHOLD = 1024 * 1024
+
+
+def file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        if size < MMAP_THRESHOLD:
+            digest.update(file.read())
+        else:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                digest.update(mapped_file)
+    return digest.hexdigest()
+
+
+def _kind(path: Path) -> FileKind:
+    try:
+        stat_result = path.stat()
+    except OSError:
+        return FileKind.OTHER
+    if not path.is_file():
+        return FileKind.OTHER
+    return classify_file(path, stat_result.st_mode)[0]
 
 
 def is_executable(path: Path) -> bool:
-    # TODO: handle other OS
-    return path.is_file() and path.suffix == "" and access(path, mode=X_OK)
+    # prefer `scan_tree` for directories, it classifies each file only once
+    return _kind(path) == FileKind.EXECUTABLE
 
 
 def is_shared_library(path: Path) -> bool:
-    # TODO: handle Windows
-    # - on linux libraries can have unversioned file name 'lib.so' and versioned
-    # 'lib.so.1' or even 'lib.so.1.1'. Library name can also includes dotes:
-    # 'libpython3.10.so'
-    # - python libraries have '.so' extension both on Linux and macOS
-    name_parts = path.name.split(".")
-    return "so" in name_parts or "dylib" in name_parts
+    return _kind(path) == FileKind.SHARED_LIBRARY
+
+
+def is_binary(path: Path) -> bool:
+    return _kind(path) != FileKind.OTHER
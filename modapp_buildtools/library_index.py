@@ -0,0 +1,103 @@
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from loguru import logger
+
+from modapp_buildtools.elf_utils import ElfError, read_elf
+
+
+class AmbiguousLibraryError(Exception):
+    def __init__(self, name: str, candidates: List[Path]) -> None:
+        super().__init__(
+            f"Library '{name}' is ambiguous, candidates: "
+            + ", ".join(str(candidate) for candidate in candidates)
+        )
+        self.name = name
+        self.candidates = candidates
+
+
+def _versioned_aliases(name: str) -> List[str]:
+    # libQt5Core.so.5.15.3 -> libQt5Core.so.5.15, libQt5Core.so.5, libQt5Core.so
+    name_parts = name.split(".")
+    if "so" not in name_parts:
+        return []
+    so_index = len(name_parts) - 1 - name_parts[::-1].index("so")
+    return [
+        ".".join(name_parts[:end]) for end in range(len(name_parts) - 1, so_index, -1)
+    ]
+
+
+class _LibraryGroup:
+    def __init__(self) -> None:
+        self.by_name: Dict[str, List[Path]] = {}
+        self.by_soname: Dict[str, List[Path]] = {}
+        self.by_alias: Dict[str, List[Path]] = {}
+
+    def add(self, library: Path) -> None:
+        self.by_name.setdefault(library.name, []).append(library)
+        for alias in _versioned_aliases(library.name):
+            self.by_alias.setdefault(alias, []).append(library)
+        try:
+            elf_info = read_elf(library)
+        except (OSError, ElfError) as error:
+            logger.debug(f"Failed to read soname of {library}: {error}")
+            return
+        if elf_info is not None and elf_info.soname is not None:
+            self.by_soname.setdefault(elf_info.soname, []).append(library)
+
+
+class LibraryIndex:
+    """Index of libraries available to fix linking by file name and DT_SONAME.
+
+    Libraries added in one `add_libraries` call have the same priority, libraries added
+    earlier have priority over ones added later (e.g. app libraries over Qt libraries).
+    """
+
+    def __init__(self, libraries: Optional[Iterable[Path]] = None) -> None:
+        self._groups: List[_LibraryGroup] = []
+        self._libraries: List[Path] = []
+        if libraries is not None:
+            self.add_libraries(libraries)
+
+    def add_libraries(self, libraries: Iterable[Path]) -> None:
+        group = _LibraryGroup()
+        for library in libraries:
+            group.add(library)
+            self._libraries.append(library)
+        self._groups.append(group)
+
+    def __iter__(self) -> Iterator[Path]:
+        return iter(self._libraries)
+
+    def __len__(self) -> int:
+        return len(self._libraries)
+
+    def find(self, name: str) -> Optional[Path]:
+        """Find library by linked name.
+
+        Exact file name has priority over soname and soname over versioned file name,
+        e.g. libQt5Core.so.5 can be found as libQt5Core.so.5.15.3.
+
+        Args:
+            name (str): linked name of the library
+
+        Returns:
+            Optional[Path]: found library or None
+
+        Raises:
+            AmbiguousLibraryError: different libraries match the name
+        """
+        for group in self._groups:
+            for libraries_by_key in (group.by_name, group.by_soname, group.by_alias):
+                candidates = libraries_by_key.get(name)
+                if not candidates:
+                    continue
+                # symlinks to the same file, e.g. versioned names, are not ambiguous
+                unique_candidates: Dict[str, Path] = {}
+                for candidate in candidates:
+                    unique_candidates.setdefault(os.path.realpath(candidate), candidate)
+                if len(unique_candidates) > 1:
+                    raise AmbiguousLibraryError(name, list(unique_candidates.values()))
+                return candidates[0]
+        return None
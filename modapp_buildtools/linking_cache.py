@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, List
+
+from loguru import logger
+
+from modapp_buildtools.file_utils import file_digest
+
+CACHE_VERSION = 1
+
+
+def linking_cache_path(app_path: Path) -> Path:
+    # the cache is stored next to app directory, not inside, so that it is not deployed
+    app_path = app_path.absolute()
+    return app_path.parent / f".{app_path.name}.linking-cache.json"
+
+
+class LinkingCache:
+    """Results of previous linking checks.
+
+    A file is not checked again if its path, size, modification time (or content hash if
+    only modification time has changed) and all its resolved dependencies are the same as
+    in the last successful check. Only successful verdicts are cached, failed files are
+    always checked again to report and fix them.
+    """
+
+    def __init__(self, path: Path, context: Dict[str, Any]) -> None:
+        self.path = path
+        # options of the check, that influence the result. If they differ, cache is not used
+        self._context = hashlib.sha256(
+            json.dumps(context, sort_keys=True).encode()
+        ).hexdigest()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        # digests computed during this run
+        self._digests: Dict[str, str] = {}
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self) -> None:
+        try:
+            with open(self.path) as cache_file:
+                data = json.load(cache_file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as error:
+            logger.warning(f"Failed to read linking cache {self.path}: {error}")
+            return
+        if data.get("version") == CACHE_VERSION and data.get("context") == self._context:
+            self._entries = data.get("files", {})
+
+    def save(self) -> None:
+        data = {"version": CACHE_VERSION, "context": self._context, "files": self._entries}
+        temporary_path = self.path.with_name(self.path.name + ".tmp")
+        try:
+            with open(temporary_path, "w") as cache_file:
+                json.dump(data, cache_file)
+            os.replace(temporary_path, self.path)
+        except OSError as error:
+            logger.warning(f"Failed to write linking cache {self.path}: {error}")
+
+    def _digest(self, path: Path, stat_result: os.stat_result) -> str:
+        # files can be changed during the run by fixes, digest is valid only for the same stat
+        key = f"{path}:{stat_result.st_size}:{stat_result.st_mtime_ns}"
+        digest = self._digests.get(key)
+        if digest is None:
+            digest = file_digest(path)
+            self._digests[key] = digest
+        return digest
+
+    def _identity(self, path: Path) -> Dict[str, Any]:
+        stat_result = path.stat()
+        return {
+            "size": stat_result.st_size,
+            "mtime_ns": stat_result.st_mtime_ns,
+            "sha256": self._digest(path, stat_result),
+        }
+
+    def _is_same(self, path: Path, identity: Dict[str, Any]) -> bool:
+        try:
+            stat_result = path.stat()
+        except OSError:
+            return False
+        if stat_result.st_size != identity["size"]:
+            return False
+        if stat_result.st_mtime_ns == identity["mtime_ns"]:
+            return True
+        # file was rewritten, e.g. by a new build, but content can be the same
+        try:
+            return bool(self._digest(path, stat_result) == identity["sha256"])
+        except OSError:
+            return False
+
+    def is_unchanged(self, file_path: Path) -> bool:
+        key = str(file_path.absolute())
+        with self._lock:
+            entry = self._entries.get(key)
+        unchanged = (
+            entry is not None
+            and self._is_same(file_path, entry["file"])
+            and all(
+                self._is_same(Path(dependency), identity)
+                for dependency, identity in entry["dependencies"].items()
+            )
+        )
+        with self._lock:
+            if unchanged:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return unchanged
+
+    def store(self, file_path: Path, dependencies: List[str]) -> None:
+        try:
+            entry = {
+                "file": self._identity(file_path),
+                "dependencies": {
+                    dependency: self._identity(Path(dependency)) for dependency in dependencies
+                },
+            }
+        except OSError as error:
+            logger.debug(f"Failed to cache linking result of {file_path}: {error}")
+            return
+        with self._lock:
+            self._entries[str(file_path.absolute())] = entry
+
+    def forget(self, file_path: Path) -> None:
+        with self._lock:
+            self._entries.pop(str(file_path.absolute()), None)
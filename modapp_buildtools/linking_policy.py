@@ -0,0 +1,112 @@
+import hashlib
+import os
+import re
+from fnmatch import translate
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Pattern
+
+from loguru import logger
+
+PROFILES_PATH = Path(__file__).parent / "resources" / "linking_policies"
+PROFILE_SUFFIX = ".txt"
+_VERSION_PREFIX = "# version:"
+_GLOB_CHARS = "*?["
+
+
+class LinkingPolicyError(Exception):
+    pass
+
+
+def available_profiles() -> List[str]:
+    return sorted(profile.stem for profile in PROFILES_PATH.glob(f"*{PROFILE_SUFFIX}"))
+
+
+def read_profile(name: str) -> List[str]:
+    """Read patterns of a baseline profile.
+
+    Args:
+        name (str): name of the profile, e.g. 'appimage-excludelist'
+
+    Returns:
+        List[str]: patterns of allowed libraries
+
+    Raises:
+        LinkingPolicyError: profile not found
+    """
+    profile_path = PROFILES_PATH / f"{name}{PROFILE_SUFFIX}"
+    try:
+        with open(profile_path) as profile_file:
+            lines = [line.strip() for line in profile_file]
+    except FileNotFoundError:
+        raise LinkingPolicyError(
+            f"Unknown linking policy '{name}', available: {', '.join(available_profiles())}"
+        ) from None
+    versions = [
+        line[len(_VERSION_PREFIX):].strip() for line in lines if line.startswith(_VERSION_PREFIX)
+    ]
+    version = versions[0] if len(versions) > 0 else "unknown"
+    logger.debug(f"Linking policy {name}, version {version}")
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+def _pattern_regex(pattern: str) -> str:
+    if any(char in pattern for char in _GLOB_CHARS):
+        return translate(pattern)
+    return re.escape(pattern)
+
+
+class LinkingPolicy:
+    """External libraries, that the app is allowed to link to.
+
+    Patterns are matched against the file name of the library: glob patterns like
+    'libGL*.so*' must match the whole name, other patterns are prefixes of the name like
+    'libc' or soname 'libX11.so.6'. Patterns with '/' are paths of allowed libraries. All
+    name patterns are compiled into one regular expression and verdicts are cached by
+    name, so that each dependency is classified once per run.
+    """
+
+    def __init__(self, patterns: Iterable[str]) -> None:
+        self.patterns = list(dict.fromkeys(patterns))
+        self._paths = {
+            os.path.normpath(pattern) for pattern in self.patterns if "/" in pattern
+        }
+        name_patterns = [pattern for pattern in self.patterns if "/" not in pattern]
+        self._name_re: Optional[Pattern[str]] = (
+            re.compile("|".join(f"(?:{_pattern_regex(pattern)})" for pattern in name_patterns))
+            if len(name_patterns) > 0
+            else None
+        )
+        self._verdicts: Dict[str, bool] = {}
+
+    @classmethod
+    def from_options(
+        cls, allowed_libs: Optional[List[str]] = None, profiles: Optional[List[str]] = None
+    ) -> Optional["LinkingPolicy"]:
+        """Compile policy from baseline profiles and additional patterns.
+
+        Args:
+            allowed_libs (Optional[List[str]]): additional patterns
+            profiles (Optional[List[str]]): names of baseline profiles
+
+        Returns:
+            Optional[LinkingPolicy]: None if neither is given: all libraries are allowed
+        """
+        if allowed_libs is None and not profiles:
+            return None
+        patterns: List[str] = []
+        for profile in profiles or []:
+            patterns += read_profile(profile)
+        return cls(patterns + list(allowed_libs or []))
+
+    @property
+    def digest(self) -> str:
+        # identifies the policy in caches of verdicts
+        return hashlib.sha256("\n".join(self.patterns).encode()).hexdigest()
+
+    def allows(self, library_path: str) -> bool:
+        name = os.path.basename(library_path)
+        verdict = self._verdicts.get(name)
+        if verdict is None:
+            verdict = self._name_re is not None and self._name_re.match(name) is not None
+            self._verdicts[name] = verdict
+        return verdict or library_path in self._paths
@@ -0,0 +1,77 @@
+import json
+import sys
+from dataclasses import asdict, dataclass, field
+from enum import Enum
+from pathlib import Path
+from typing import Any, Dict, List, Optional, TextIO
+
+# report is written to standard output instead of a file, logs go to standard error
+STDOUT_PATH = "-"
+
+
+class LinkingStatus(str, Enum):
+    OK = "ok"
+    # not changed since the last successful check
+    CACHED = "cached"
+    # not a dynamic executable or library
+    SKIPPED = "skipped"
+    FIXED = "fixed"
+    FAILED = "failed"
+
+
+@dataclass
+class AppliedFix:
+    # libraries copied into the app
+    copied: List[str] = field(default_factory=list)
+    # old needed name -> new one
+    replaced_needed: Dict[str, str] = field(default_factory=dict)
+    # added rpath entries
+    rpath: List[str] = field(default_factory=list)
+
+
+@dataclass
+class FileLinkingResult:
+    file: str
+    status: LinkingStatus
+    resolved: List[str] = field(default_factory=list)
+    missing: List[str] = field(default_factory=list)
+    external: List[str] = field(default_factory=list)
+    fix: Optional[AppliedFix] = None
+    duration: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.status != LinkingStatus.FAILED
+
+    def to_json(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["status"] = self.status.value
+        return data
+
+
+class LinkingReport:
+    """Results of linking check in JSON Lines format, one record per file.
+
+    Each record is written and flushed as soon as the file is checked, so that other
+    tools can consume the report while the check is still running.
+    """
+
+    def __init__(self, path: Optional[Path]) -> None:
+        self.path = path
+        self._file: Optional[TextIO] = None
+
+    def __enter__(self) -> "LinkingReport":
+        if self.path is not None:
+            self._file = sys.stdout if str(self.path) == STDOUT_PATH else open(self.path, "w")
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        if self._file is not None and self._file is not sys.stdout:
+            self._file.close()
+        self._file = None
+
+    def write(self, result: FileLinkingResult) -> None:
+        if self._file is None:
+            return
+        self._file.write(json.dumps(result.to_json()) + "\n")
+        self._file.flush()
@@ -0,0 +1,192 @@
+import os
+from pathlib import Path
+from time import monotonic
+from typing import Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from modapp_buildtools.check_linking import check_linking_in_files
+from modapp_buildtools.dependency_resolver import DependencyResolver
+from modapp_buildtools.file_scanner import scan_tree
+from modapp_buildtools.file_utils import is_binary, is_shared_library
+from modapp_buildtools.library_index import LibraryIndex
+from modapp_buildtools.watch import Changes, FileWatcher, create_watcher
+
+
+def _stat_key(path: Path) -> Optional[Tuple[int, int]]:
+    # inode and ctime change with any write, chmod or replacement of the file
+    try:
+        stat_result = path.stat()
+    except OSError:
+        return None
+    return stat_result.st_ino, stat_result.st_ctime_ns
+
+
+class LinkingWatch:
+    """Linking state of the app, that is kept between checks in watch mode.
+
+    The resolver caches parsed files, the reverse dependency graph maps each library to the
+    files, that load it. After a change only changed files, files that depend on them and
+    files that failed before are checked again.
+
+    Args:
+        app_path (Path): app directory
+        files (List[Path]): executables and libraries of the app
+        resolver (DependencyResolver): resolver to share parsed files with
+        available_libs (LibraryIndex): libraries to fix linking with
+        allowed_libs (Optional[List[str]]): patterns of allowed external libraries
+        fix (bool): copy missing and external libraries into the app and link them
+        jobs (Optional[int]): number of workers, number of CPUs by default
+        policies (Optional[List[str]]): baseline profiles of allowed external libraries
+    """
+
+    def __init__(
+        self,
+        app_path: Path,
+        files: List[Path],
+        resolver: DependencyResolver,
+        available_libs: LibraryIndex,
+        allowed_libs: Optional[List[str]] = None,
+        fix: bool = False,
+        jobs: Optional[int] = None,
+        policies: Optional[List[str]] = None,
+    ) -> None:
+        self.app_path = app_path
+        self.resolver = resolver
+        self.available_libs = available_libs
+        self.allowed_libs = allowed_libs
+        self.fix = fix
+        self.jobs = jobs
+        self.policies = policies
+        # known binaries -> their state after the last check, files changed by fixes
+        # are not checked again
+        self._stats: Dict[Path, Optional[Tuple[int, int]]] = {path: None for path in files}
+        # real path of a library -> files, that load it
+        self._dependents: Dict[str, Set[Path]] = {}
+        self._failed: Set[Path] = set()
+
+    def check(self, files: List[Path]) -> bool:
+        start = monotonic()
+        failed_files: List[Path] = []
+        linking_is_ok = check_linking_in_files(
+            files,
+            self.app_path,
+            allowed_libs=self.allowed_libs,
+            available_libs=self.available_libs,
+            fix=self.fix,
+            resolver=self.resolver,
+            jobs=self.jobs,
+            policies=self.policies,
+            failed_files=failed_files,
+        )
+        self._failed.difference_update(files)
+        self._failed.update(failed_files)
+        for file_path in files:
+            self._stats[file_path] = _stat_key(file_path)
+            dependencies = self.resolver.dependencies(file_path)
+            for library in dependencies.linked if dependencies is not None else []:
+                self._dependents.setdefault(os.path.realpath(library), set()).add(file_path)
+
+        duration = (monotonic() - start) * 1000
+        if linking_is_ok and not self._failed:
+            logger.success(f"Checked {len(files)} files in {duration:.0f} ms, linking is correct")
+        else:
+            logger.error(
+                f"Checked {len(files)} files in {duration:.0f} ms, linking of"
+                f" {len(self._failed)} files is incorrect:"
+                f" {', '.join(str(path) for path in sorted(self._failed))}"
+            )
+        return linking_is_ok
+
+    def files_to_recheck(self, changes: Changes) -> List[Path]:
+        if changes.overflow:
+            logger.warning("File events are lost, checking the whole app")
+            self.resolver.invalidate()
+            binaries = scan_tree(self.app_path).binaries
+            self._stats = {path: self._stats.get(path) for path in binaries}
+            return binaries
+
+        to_recheck: Set[Path] = set()
+        new_libraries: List[Path] = []
+        binaries_are_removed = False
+        for path in changes.paths:
+            self.resolver.invalidate(path)
+            changed_paths = [path]
+            if not path.exists():
+                # removed file or directory
+                changed_paths += [known for known in self._stats if path in known.parents]
+                for removed_path in changed_paths:
+                    if removed_path in self._stats:
+                        del self._stats[removed_path]
+                        binaries_are_removed = True
+                    self._failed.discard(removed_path)
+            elif path.is_file() and (path in self._stats or is_binary(path)):
+                if path not in self._stats and is_shared_library(path):
+                    new_libraries.append(path.absolute())
+                if _stat_key(path) == self._stats.get(path):
+                    # written by the previous check, e.g. its rpath is fixed
+                    continue
+                to_recheck.add(path)
+            for changed_path in changed_paths:
+                to_recheck.update(self._dependents.get(os.path.realpath(changed_path), set()))
+        if new_libraries:
+            self.available_libs.add_libraries(new_libraries)
+        if to_recheck or binaries_are_removed:
+            # new libraries can be the missing ones
+            to_recheck.update(self._failed)
+        return sorted(path for path in to_recheck if path.exists())
+
+    def run(self, watcher: FileWatcher) -> None:
+        while True:
+            files = self.files_to_recheck(watcher.changes())
+            if files:
+                logger.info(f"Rechecking {', '.join(str(path) for path in files)}")
+                self.check(files)
+
+
+def watch_linking(
+    bin_path: Path,
+    allowed_libs: Optional[List[str]] = None,
+    fix: bool = False,
+    jobs: Optional[int] = None,
+    policies: Optional[List[str]] = None,
+    resolver: Optional[DependencyResolver] = None,
+    available_libs: Optional[LibraryIndex] = None,
+) -> None:
+    """Check linking of the app and recheck changed files until interrupted.
+
+    Args:
+        bin_path (Path): app directory
+        allowed_libs (Optional[List[str]]): patterns of allowed external libraries
+        fix (bool): copy missing and external libraries into the app and link them
+        jobs (Optional[int]): number of workers, number of CPUs by default
+        policies (Optional[List[str]]): baseline profiles of allowed external libraries
+        resolver (Optional[DependencyResolver]): resolver with already parsed files
+        available_libs (Optional[LibraryIndex]): libraries to fix linking with, libraries
+                                                 of the app by default
+
+    Raises:
+        WatchError: file watching is not available
+    """
+    app_path = bin_path.parent if bin_path.is_file() else bin_path
+    manifest = scan_tree(bin_path)
+    if available_libs is None:
+        available_libs = LibraryIndex(library.absolute() for library in manifest.shared_libraries)
+    linking_watch = LinkingWatch(
+        app_path,
+        manifest.binaries,
+        resolver if resolver is not None else DependencyResolver(),
+        available_libs,
+        allowed_libs=allowed_libs,
+        fix=fix,
+        jobs=jobs,
+        policies=policies,
+    )
+    # watching starts before the first check: changes during it are not lost
+    with create_watcher(app_path) as watcher:
+        linking_watch.check(manifest.binaries)
+        logger.info(f"Watching {app_path} for changes, press Ctrl+C to stop")
+        try:
+            linking_watch.run(watcher)
+        except KeyboardInterrupt:
+            logger.info("Watching is stopped")
@@ -0,0 +1,15 @@
+from enum import Enum
+
+# choices of command line options. The module has no dependencies: CLI declares options
+# with them without importing implementations of commands
+
+
+class LinkMode(str, Enum):
+    SYMLINK = "symlink"
+    HARDLINK = "hardlink"
+
+
+class Compressor(str, Enum):
+    ZSTD = "zstd"
+    XZ = "xz"
+    GZIP = "gzip"
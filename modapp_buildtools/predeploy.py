@@ -1,23 +1,37 @@
 from __future__ import annotations
+import hashlib
+import json
+import os
 from pathlib import Path
-from typing import TYPE_CHECKING
-from os import mkdir, makedirs
+from typing import TYPE_CHECKING, Optional
+from os import makedirs
 from os.path import relpath
 from shutil import copy, rmtree
 from string import Template
 
-from command_runner import command_runner
 from loguru import logger
 
-from modapp_buildtools.file_utils import is_executable, is_shared_library
+from modapp_buildtools import profiling
+from modapp_buildtools.binary_patcher import EditPlan, apply_edit_plan
+from modapp_buildtools.command_engine import configure as configure_commands
+from modapp_buildtools.dedupe import dedupe_files
+from modapp_buildtools.file_scanner import FileKind, ScannedFile, scan_tree
+from modapp_buildtools.library_index import LibraryIndex
+from modapp_buildtools.options import LinkMode
+from modapp_buildtools.prune import find_unused_libraries
+from modapp_buildtools.rpath_normalizer import normalize_rpaths
+from modapp_buildtools.rpath_utils import get_rpaths
+from modapp_buildtools.strip import strip_binaries
+from modapp_buildtools.staging import FileStager, StagedFile
 
 if TYPE_CHECKING:
-    from typing import List
+    from typing import Any, Dict, List, Set
 
 
 BIN_REL_PATH = Path("bin")
 LIB_REL_PATH = Path("lib")
 RESOURCE_REL_PATH = Path("share")
+PREDEPLOY_STATE_VERSION = 2
 
 
 def prepare_output_dir(output_path: Path, app_dir_name: str) -> Path:
@@ -32,68 +46,180 @@ def prepare_output_dir(output_path: Path, app_dir_name: str) -> Path:
     return res_app_path
 
 
-def add_rpath(file_path: Path, new_rpath: str) -> None:
-    # patchlelf has also --add-rpath subcommand, but it's supported since v0.14,
-    # that cannot be built on old systems with C++ standard lower C++17
-    # use --print-rpath and --set-rpath instead, that are supported in all versions
-    exit_code, output = command_runner(
-        f"patchelf --print-rpath {str(file_path.absolute())}", shell=True
-    )
-    if exit_code != 0:
-        logger.error(f"Failed to get rpath of {str(file_path)}: {output}")
+def predeploy_state_path(output_path: Path, app_dir_name: str) -> Path:
+    # stored next to AppDir, not inside, so that AppDir is the same as after clean predeploy
+    return output_path / f".{app_dir_name}.predeploy.json"
 
-    current_rpath = str(output).strip("\n")
-    rpaths = set(current_rpath.split(":"))
-    rpaths.add(new_rpath)
-    updated_rpath = ":".join(rpaths)
 
-    exit_code, output = command_runner(
-        f"patchelf --set-rpath '{updated_rpath}' {str(file_path.absolute())}",
-        shell=True,
-    )
-    if exit_code != 0:
-        logger.error(f"Failed to set rpath of {str(file_path)}: {output}")
+class PredeployState:
+    """Files of AppDir written by the last predeploy and their sources.
+
+    A file is up to date if its source has the same size, modification time and mode as
+    in the last run and the file in AppDir was not changed since then. Files are processed
+    depending on options like `strip`, all of them are outdated if options change.
+    """
+
+    def __init__(
+        self, path: Path, app_path: Path, options: Optional[Dict[str, Any]] = None
+    ) -> None:
+        self.path = path
+        self._app_path = str(app_path.absolute())
+        self._options_digest = hashlib.sha256(
+            json.dumps(options or {}, sort_keys=True).encode()
+        ).hexdigest()
+        self.files: Dict[str, Dict[str, Any]] = {}
+
+    def load(self) -> None:
+        try:
+            with open(self.path) as state_file:
+                data = json.load(state_file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as error:
+            logger.warning(f"Failed to read predeploy state {self.path}: {error}")
+            return
+        if (
+            data.get("version") == PREDEPLOY_STATE_VERSION
+            and data.get("app_path") == self._app_path
+            and data.get("options") == self._options_digest
+        ):
+            self.files = data.get("files", {})
+
+    def save(self) -> None:
+        data = {
+            "version": PREDEPLOY_STATE_VERSION,
+            "app_path": self._app_path,
+            "options": self._options_digest,
+            "files": self.files,
+        }
+        try:
+            with open(self.path, "w") as state_file:
+                json.dump(data, state_file)
+        except OSError as error:
+            logger.warning(f"Failed to write predeploy state {self.path}: {error}")
+
+    @staticmethod
+    def _identity(source: ScannedFile, destination: Path) -> Dict[str, Any]:
+        destination_stat = destination.stat()
+        return {
+            "source": [str(source.path), source.size, source.mtime_ns, source.mode],
+            "output": [
+                destination_stat.st_size,
+                destination_stat.st_mtime_ns,
+                destination_stat.st_mode,
+            ],
+        }
 
+    def is_up_to_date(self, key: str, source: ScannedFile, destination: Path) -> bool:
+        recorded = self.files.get(key)
+        if recorded is None:
+            return False
+        try:
+            return self._identity(source, destination) == recorded
+        except OSError:
+            return False
 
-def handle_executables(executables: List[Path], res_app_path: Path) -> None:
+    def record(self, key: str, source: ScannedFile, destination: Path) -> None:
+        self.files[key] = self._identity(source, destination)
+
+    def forget(self, key: str) -> None:
+        self.files.pop(key, None)
+
+
+def _remove_stale_files(res_app_path: Path, expected_files: Set[Path]) -> None:
+    # directories that clean predeploy always creates
+    kept_dirs = {
+        res_app_path,
+        res_app_path / BIN_REL_PATH,
+        res_app_path / LIB_REL_PATH,
+        res_app_path / RESOURCE_REL_PATH,
+        res_app_path / RESOURCE_REL_PATH / "applications",
+    }
+    for dir_path, dir_names, file_names in os.walk(res_app_path, topdown=False):
+        directory = Path(dir_path)
+        for name in file_names + [d for d in dir_names if (directory / d).is_symlink()]:
+            if directory / name not in expected_files:
+                logger.trace(f"Remove stale {directory / name}")
+                (directory / name).unlink()
+        if directory not in kept_dirs and not any(directory.iterdir()):
+            directory.rmdir()
+
+
+def add_rpath(file_path: Path, new_rpath: str) -> None:
+    plan = EditPlan()
+    plan.add_rpaths(get_rpaths(file_path), [new_rpath])
+    if not apply_edit_plan(file_path, plan):
+        raise Exception(f"Failed to set rpath of {str(file_path)}")
+
+
+def handle_executables(executables: List[Path], res_app_path: Path, stager: FileStager) -> None:
     destination = res_app_path / BIN_REL_PATH
-    mkdir(destination)
+    makedirs(destination, exist_ok=True)
 
     lib_path = res_app_path / LIB_REL_PATH
     # Path.relative_to cannot be used here, because it cannot compute relative path
     # between relative pathes. It's a case if output path is relative
     bin_to_lib_rel_path = relpath(lib_path, start=destination)
 
-    for executable in executables:
-        app_executable_path = destination / executable.name
-        copy(executable, app_executable_path)
+    staged_files = [
+        StagedFile(executable, destination / executable.name, patchable=True)
+        for executable in executables
+    ]
+    stager.stage(staged_files)
+    for staged_file in staged_files:
         # all libs will be placed in lib dir, add rpath to it
-        add_rpath(app_executable_path, f"$ORIGIN/{bin_to_lib_rel_path}")
+        add_rpath(staged_file.destination, f"$ORIGIN/{bin_to_lib_rel_path}")
 
 
-def handle_libraries(libraries: List[Path], app_path: Path, res_app_path: Path) -> None:
+def handle_libraries(
+    libraries: List[Path], app_path: Path, res_app_path: Path, stager: FileStager
+) -> None:
     destination = res_app_path / LIB_REL_PATH
-    mkdir(destination)
-    for library in libraries:
-        library_rel_path = library.relative_to(app_path)
-        library_res_path = destination / library_rel_path
-        makedirs(library_res_path.parent, exist_ok=True)
-        copy(library, library_res_path)
+    makedirs(destination, exist_ok=True)
+    # libraries are patched by linking fixes later
+    stager.stage(
+        [
+            StagedFile(library, destination / library.relative_to(app_path), patchable=True)
+            for library in libraries
+        ]
+    )
 
 
 def handle_other_files(
-    other_files: List[Path], app_path: Path, res_app_path: Path
+    other_files: List[Path], app_path: Path, res_app_path: Path, stager: FileStager
 ) -> None:
     destination = res_app_path / RESOURCE_REL_PATH
-    mkdir(destination)
-    for other_file in other_files:
-        other_file_rel_path = other_file.relative_to(app_path)
-        other_file_res_path = destination / other_file_rel_path
-        makedirs(other_file_res_path.parent, exist_ok=True)
-        copy(other_file, other_file_res_path)
+    makedirs(destination, exist_ok=True)
+    stager.stage(
+        [
+            StagedFile(other_file, destination / other_file.relative_to(app_path))
+            for other_file in other_files
+        ]
+    )
+
+
+def _destination(scanned_file: ScannedFile, app_path: Path, res_app_path: Path) -> Path:
+    if scanned_file.kind == FileKind.EXECUTABLE:
+        return res_app_path / BIN_REL_PATH / scanned_file.path.name
+    relative_path = scanned_file.path.relative_to(app_path)
+    if scanned_file.kind == FileKind.SHARED_LIBRARY:
+        return res_app_path / LIB_REL_PATH / relative_path
+    return res_app_path / RESOURCE_REL_PATH / relative_path
 
 
-def predeploy_app(app_path: Path, output_path: Path, app_dir_name: str = "AppDir"):
+def predeploy_app(
+    app_path: Path,
+    output_path: Path,
+    app_dir_name: str = "AppDir",
+    jobs: Optional[int] = None,
+    incremental: bool = False,
+    prune: bool = False,
+    keep_libraries: Optional[List[str]] = None,
+    normalize_rpath: bool = False,
+    strip: bool = False,
+    debug_dir: Optional[Path] = None,
+    dedupe: Optional[LinkMode] = None,
+):
     """Predeploy application.
 
     Args:
@@ -101,27 +227,151 @@ def predeploy_app(app_path: Path, output_path: Path, app_dir_name: str = "AppDir
         output_path (Path): output directory. If application exists inside, it
                             will be overwritten
         app_dir_name (str): name of app directory. 'AppDir' by default.
+        jobs (Optional[int]): maximal number of files copied and external commands
+                              running at once, number of CPUs by default
+        incremental (bool): update existing app directory instead of recreating it: only
+                            new and changed files are copied, stale files are removed
+        prune (bool): do not copy libraries, that are not reachable from executables,
+                      plugins, QML modules and Python extension modules
+        keep_libraries (Optional[List[str]]): patterns of libraries, that are always
+                                              copied with `prune`, e.g. loaded with dlopen
+        normalize_rpath (bool): replace rpath of copied binaries with minimal
+                                $ORIGIN-relative DT_RUNPATH
+        strip (bool): strip symbols and debug information from copied binaries
+        debug_dir (Optional[Path]): directory for separate debug files of stripped
+                                    binaries, debug information is dropped if not set
+        dedupe (Optional[LinkMode]): replace identical files with links of this kind
+
+    Raises:
+        Exception: no executables found in application directory
     """
-    executables: List[Path] = []
-    libraries: List[Path] = []
-    other_files: List[Path] = []
-
-    for app_file in app_path.rglob("*"):
-        if is_executable(app_file):
-            executables.append(app_file)
-        elif is_shared_library(app_file):
-            libraries.append(app_file)
-        elif app_file.is_file():
-            other_files.append(app_file)
-
-    res_app_path = prepare_output_dir(output_path, app_dir_name)
-    handle_executables(executables, res_app_path)
-    handle_libraries(libraries, app_path, res_app_path)
-    handle_other_files(other_files, app_path, res_app_path)
-
-    if len(executables) == 0:
+    configure_commands(jobs)
+    with profiling.stage("scan"):
+        manifest = scan_tree(app_path)
+    if len(manifest.executables) == 0:
         raise Exception("No executables found")
-    app_name = executables[0].stem
+    app_name = manifest.executables[0].stem
+    files_to_deploy = manifest.entries
+    if prune:
+        with profiling.stage("prune"):
+            prune_result = find_unused_libraries(
+                manifest, app_path, keep_patterns=keep_libraries
+            )
+        prune_result.log()
+        files_to_deploy = prune_result.kept
+
+    res_app_path = output_path / app_dir_name
+    desktop_file_dst_path = (
+        res_app_path / "share" / "applications" / f"{app_name}.desktop"
+    )
+    state = PredeployState(
+        predeploy_state_path(output_path, app_dir_name),
+        app_path,
+        options={
+            "prune": prune,
+            "keep_libraries": keep_libraries if prune else None,
+            "normalize_rpath": normalize_rpath,
+            "strip": strip,
+            "debug_dir": str(debug_dir.absolute()) if strip and debug_dir is not None else None,
+            "dedupe": dedupe.value if dedupe is not None else None,
+        },
+    )
+    if incremental and res_app_path.is_dir():
+        state.load()
+    else:
+        prepare_output_dir(output_path, app_dir_name)
+
+    expected_files: Dict[Path, ScannedFile] = {
+        _destination(scanned_file, app_path, res_app_path): scanned_file
+        for scanned_file in files_to_deploy
+    }
+    with profiling.stage("remove stale files"):
+        _remove_stale_files(res_app_path, set(expected_files) | {desktop_file_dst_path})
+    for key in list(state.files):
+        if res_app_path / key not in expected_files:
+            state.forget(key)
+
+    outdated_files = {
+        destination: scanned_file
+        for destination, scanned_file in expected_files.items()
+        if not state.is_up_to_date(
+            str(destination.relative_to(res_app_path)), scanned_file, destination
+        )
+    }
+    if dedupe is not None:
+        # a symlink of the previous deduplication follows its target, it must be restored
+        # if the target changes. Hardlinks keep the old content, they are always correct
+        changed_files = {os.path.realpath(destination) for destination in outdated_files}
+        for destination, scanned_file in expected_files.items():
+            if destination.is_symlink() and os.path.realpath(destination) in changed_files:
+                outdated_files[destination] = scanned_file
+    if incremental:
+        logger.info(
+            f"{len(outdated_files)} of {len(expected_files)} files are new or changed"
+        )
+
+    def outdated(kind: FileKind) -> List[Path]:
+        return [
+            scanned_file.path
+            for scanned_file in outdated_files.values()
+            if scanned_file.kind == kind
+        ]
+
+    stager = FileStager(jobs)
+    with profiling.stage("executables"):
+        handle_executables(outdated(FileKind.EXECUTABLE), res_app_path, stager)
+    with profiling.stage("libraries"):
+        handle_libraries(outdated(FileKind.SHARED_LIBRARY), app_path, res_app_path, stager)
+    with profiling.stage("other files"):
+        handle_other_files(outdated(FileKind.OTHER), app_path, res_app_path, stager)
+    stager.log_statistics()
+
+    binaries_to_update = [
+        destination
+        for destination, scanned_file in outdated_files.items()
+        if scanned_file.kind != FileKind.OTHER
+    ]
+    if normalize_rpath:
+        # all binaries: minimal rpath of an unchanged file depends on the current libraries
+        with profiling.stage("normalize rpath"):
+            output_libraries = scan_tree(res_app_path / LIB_REL_PATH).shared_libraries
+            normalize_result = normalize_rpaths(
+                [
+                    destination
+                    for destination, scanned_file in expected_files.items()
+                    if scanned_file.kind != FileKind.OTHER and not destination.is_symlink()
+                ],
+                res_app_path,
+                libraries=LibraryIndex(library.absolute() for library in output_libraries),
+                jobs=jobs,
+            )
+        normalize_result.log()
+        for changed_file in normalize_result.changed:
+            outdated_files[changed_file] = expected_files[changed_file]
+
+    if strip:
+        # only just copied files, files of previous run are already stripped
+        with profiling.stage("strip"):
+            strip_result = strip_binaries(
+                binaries_to_update,
+                res_app_path,
+                debug_dir=debug_dir,
+                jobs=jobs,
+            )
+        strip_result.log()
+
+    if dedupe is not None:
+        # all files: a new file can duplicate a file of the previous run
+        with profiling.stage("dedupe"):
+            dedupe_result = dedupe_files(list(expected_files), mode=dedupe, jobs=jobs)
+        dedupe_result.log()
+        for duplicate in dedupe_result.replaced:
+            outdated_files[duplicate] = expected_files[duplicate]
+
+    with profiling.stage("save state"):
+        for destination, scanned_file in outdated_files.items():
+            state.record(str(destination.relative_to(res_app_path)), scanned_file, destination)
+        state.save()
 
     # icon
     icon_src_path = Path(__file__).parent / "resources" / "app.png"
@@ -131,9 +381,6 @@ def predeploy_app(app_path: Path, output_path: Path, app_dir_name: str = "AppDir
 
     # .desktop file
     desktop_file_template_path = Path(__file__).parent / "resources" / "app.desktop"
-    desktop_file_dst_path = (
-        res_app_path / "share" / "applications" / f"{app_name}.desktop"
-    )
     with open(desktop_file_template_path) as template_file:
         desktop_template = Template(template_file.read())
 
@@ -143,6 +390,6 @@ def predeploy_app(app_path: Path, output_path: Path, app_dir_name: str = "AppDir
             "exec": app_name,
         }
     )
-    makedirs(desktop_file_dst_path.parent)
+    makedirs(desktop_file_dst_path.parent, exist_ok=True)
     with open(desktop_file_dst_path, "w") as output_file:
         output_file.write(desktop_file_content)
@@ -0,0 +1,263 @@
+import json
+import os
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import Lock, current_thread, local
+from time import monotonic
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from loguru import logger
+
+STAGE_CATEGORY = "stage"
+TASK_CATEGORY = "task"
+COMMAND_CATEGORY = "command"
+# stage names are joined into a path to distinguish the same stage in different commands
+STAGE_SEPARATOR = " > "
+
+
+@dataclass
+class TraceEvent:
+    name: str
+    category: str
+    start: float
+    end: float
+    thread: str
+    args: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+def trace_path(summary_path: Path) -> Path:
+    # profile.json -> profile.trace.json
+    return summary_path.with_name(f"{summary_path.stem}.trace.json")
+
+
+class Profiler:
+    """Collect stage, worker task and external command timings of one run.
+
+    Events are recorded from any thread. They are converted to a JSON summary and to
+    a Chrome trace, that can be opened in chrome://tracing or ui.perfetto.dev.
+    """
+
+    def __init__(self) -> None:
+        self.start = monotonic()
+        self.end: Optional[float] = None
+        self.events: List[TraceEvent] = []
+        self.bytes_copied = 0
+        self._lock = Lock()
+        self._stages = local()
+
+    def add_event(self, event: TraceEvent) -> None:
+        with self._lock:
+            self.events.append(event)
+
+    def add_bytes_copied(self, count: int) -> None:
+        with self._lock:
+            self.bytes_copied += count
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        stack: List[str] = getattr(self._stages, "stack", [])
+        self._stages.stack = stack + [name]
+        start = monotonic()
+        try:
+            yield
+        finally:
+            self._stages.stack = stack
+            self.add_event(
+                TraceEvent(
+                    STAGE_SEPARATOR.join(stack + [name]),
+                    STAGE_CATEGORY,
+                    start,
+                    monotonic(),
+                    current_thread().name,
+                )
+            )
+
+    def _events(self, category: str) -> List[TraceEvent]:
+        with self._lock:
+            return [event for event in self.events if event.category == category]
+
+    def summary(self) -> Dict[str, Any]:
+        end = self.end if self.end is not None else monotonic()
+
+        stages: Dict[str, Dict[str, Any]] = {}
+        for event in self._events(STAGE_CATEGORY):
+            stage_summary = stages.setdefault(event.name, {"count": 0, "time": 0.0})
+            stage_summary["count"] += 1
+            stage_summary["time"] += event.duration
+
+        commands: Dict[str, Dict[str, Any]] = {}
+        for event in self._events(COMMAND_CATEGORY):
+            command_summary = commands.setdefault(
+                event.name, {"count": 0, "time": 0.0, "failed": 0}
+            )
+            command_summary["count"] += 1
+            command_summary["time"] += event.duration
+            if event.args.get("exit_code") != 0:
+                command_summary["failed"] += 1
+
+        pools: Dict[str, Dict[str, Any]] = {}
+        tasks_by_pool: Dict[str, List[TraceEvent]] = {}
+        for event in self._events(TASK_CATEGORY):
+            tasks_by_pool.setdefault(event.args["pool"], []).append(event)
+        for pool, tasks in tasks_by_pool.items():
+            # time from the first started to the last finished task of the pool
+            wall_time = max(task.end for task in tasks) - min(task.start for task in tasks)
+            workers: Dict[str, Dict[str, Any]] = {}
+            for task in tasks:
+                worker = workers.setdefault(task.thread, {"tasks": 0, "busy_time": 0.0})
+                worker["tasks"] += 1
+                worker["busy_time"] += task.duration
+            for worker in workers.values():
+                worker["utilization"] = worker["busy_time"] / wall_time if wall_time > 0 else 1.0
+            pools[pool] = {
+                "tasks": len(tasks),
+                "wall_time": wall_time,
+                "workers": dict(sorted(workers.items())),
+            }
+
+        return {
+            "total_time": end - self.start,
+            "stages": stages,
+            "commands": dict(sorted(commands.items())),
+            "bytes_copied": self.bytes_copied,
+            "pools": pools,
+        }
+
+    def trace(self) -> Dict[str, Any]:
+        with self._lock:
+            events = sorted(self.events, key=lambda event: event.start)
+
+        # commands run concurrently on the event loop thread, each one gets a free lane
+        # so that their slices do not overlap
+        lanes_end: List[float] = []
+        thread_ids: Dict[str, int] = {}
+        trace_events: List[Dict[str, Any]] = []
+        for event in events:
+            thread = event.thread
+            if event.category == COMMAND_CATEGORY:
+                lane = next(
+                    (index for index, end in enumerate(lanes_end) if end <= event.start),
+                    len(lanes_end),
+                )
+                if lane == len(lanes_end):
+                    lanes_end.append(event.end)
+                else:
+                    lanes_end[lane] = event.end
+                thread = f"command {lane}"
+            thread_id = thread_ids.setdefault(thread, len(thread_ids) + 1)
+            trace_events.append(
+                {
+                    "name": event.name,
+                    "cat": event.category,
+                    "ph": "X",
+                    "ts": (event.start - self.start) * 1e6,
+                    "dur": event.duration * 1e6,
+                    "pid": 1,
+                    "tid": thread_id,
+                    "args": event.args,
+                }
+            )
+        trace_events += [
+            {"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": thread}}
+            for thread, tid in thread_ids.items()
+        ]
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    def write(self, summary_path: Path) -> None:
+        with open(summary_path, "w") as summary_file:
+            json.dump(self.summary(), summary_file, indent=2)
+        with open(trace_path(summary_path), "w") as trace_file:
+            json.dump(self.trace(), trace_file)
+
+
+_profiler: Optional[Profiler] = None
+
+
+def get_profiler() -> Optional[Profiler]:
+    return _profiler
+
+
+@contextmanager
+def profile(summary_path: Optional[Path], name: str) -> Iterator[Optional[Profiler]]:
+    """Profile the block, if path is given. Results are written even if the block fails.
+
+    Args:
+        summary_path (Optional[Path]): path to JSON summary, Chrome trace is written next
+                                       to it. Profiling is disabled if it is None
+        name (str): name of the root stage, e.g. command name
+    """
+    global _profiler
+    if summary_path is None:
+        yield None
+        return
+
+    profiler = Profiler()
+    _profiler = profiler
+    try:
+        with profiler.stage(name):
+            yield profiler
+    finally:
+        _profiler = None
+        profiler.end = monotonic()
+        try:
+            profiler.write(summary_path)
+            logger.info(f"Profile written to {summary_path} and {trace_path(summary_path)}")
+        except OSError as error:
+            logger.error(f"Failed to write profile {summary_path}: {error}")
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    profiler = _profiler
+    if profiler is None:
+        yield
+        return
+    with profiler.stage(name):
+        yield
+
+
+@contextmanager
+def task(pool: str, name: str) -> Iterator[None]:
+    """Measure a task of a worker pool, used to compute utilization of workers."""
+    profiler = _profiler
+    if profiler is None:
+        yield
+        return
+    start = monotonic()
+    try:
+        yield
+    finally:
+        profiler.add_event(
+            TraceEvent(
+                name, TASK_CATEGORY, start, monotonic(), current_thread().name, {"pool": pool}
+            )
+        )
+
+
+def record_command(
+    command: Sequence[str], start: float, end: float, exit_code: Optional[int]
+) -> None:
+    profiler = _profiler
+    if profiler is None or len(command) == 0:
+        return
+    profiler.add_event(
+        TraceEvent(
+            os.path.basename(command[0]),
+            COMMAND_CATEGORY,
+            start,
+            end,
+            current_thread().name,
+            {"command": " ".join(command), "exit_code": exit_code},
+        )
+    )
+
+
+def add_bytes_copied(count: int) -> None:
+    profiler = _profiler
+    if profiler is not None:
+        profiler.add_bytes_copied(count)
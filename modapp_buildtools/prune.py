@@ -0,0 +1,127 @@
+import os
+from dataclasses import dataclass, field
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import List, Optional, Set
+
+from loguru import logger
+
+from modapp_buildtools.dependency_resolver import DependencyResolver
+from modapp_buildtools.file_scanner import FileKind, FileManifest, ScannedFile
+from modapp_buildtools.library_index import AmbiguousLibraryError, LibraryIndex
+
+# libraries, that are loaded with dlopen and never appear in DT_NEEDED: Qt plugins, QML
+# modules and Python extension modules. Patterns are matched against '/' + path relative
+# to the app directory, '*' matches '/' as well
+DEFAULT_KEEP_PATTERNS = [
+    "*/plugins/*",
+    "*/qml/*",
+    "*.cpython-*.so",
+    "*.abi3.so",
+]
+
+
+@dataclass
+class PruneResult:
+    kept: List[ScannedFile] = field(default_factory=list)
+    removed: List[ScannedFile] = field(default_factory=list)
+
+    @property
+    def bytes_saved(self) -> int:
+        # symlinks are scanned with the size of their target, count each file once
+        return sum(entry.size for entry in self.removed if not entry.is_symlink)
+
+    def log(self) -> None:
+        logger.info(
+            f"Pruned {len(self.removed)} unused libraries,"
+            f" saved {self.bytes_saved / 1024 / 1024:.1f} MiB"
+        )
+        for entry in self.removed:
+            logger.debug(f"Unused library: {entry.path}")
+
+
+def _matches(relative_path: str, patterns: List[str]) -> bool:
+    name = os.path.basename(relative_path)
+    return any(
+        fnmatch("/" + relative_path, pattern) or fnmatch(name, pattern) for pattern in patterns
+    )
+
+
+def is_root(entry: ScannedFile, app_path: Path, keep_patterns: List[str]) -> bool:
+    if entry.kind == FileKind.EXECUTABLE:
+        return True
+    if entry.kind != FileKind.SHARED_LIBRARY:
+        return False
+    # libraries in DT_NEEDED are named lib*.so, other shared objects are modules, that
+    # are loaded explicitly, e.g. Python extension modules like _ssl.so
+    if not entry.path.name.startswith("lib"):
+        return True
+    return _matches(entry.path.relative_to(app_path).as_posix(), keep_patterns)
+
+
+def find_unused_libraries(
+    manifest: FileManifest,
+    app_path: Path,
+    resolver: Optional[DependencyResolver] = None,
+    keep_patterns: Optional[List[str]] = None,
+) -> PruneResult:
+    """Find shared libraries of the app, that cannot be loaded starting from roots.
+
+    Roots are executables, plugins, QML modules, Python extension modules and libraries
+    matching keep patterns. Libraries, that are reachable from roots over DT_NEEDED
+    entries, are kept. Dependencies, that cannot be resolved from the current location
+    of the file, are looked up by name among libraries of the app, because they are
+    found there after deployment.
+
+    Args:
+        manifest (FileManifest): scanned app directory
+        app_path (Path): app directory
+        resolver (Optional[DependencyResolver]): resolver to share parsed files with
+        keep_patterns (Optional[List[str]]): additional patterns of libraries to keep,
+                                             e.g. libraries that are loaded with dlopen
+
+    Returns:
+        PruneResult: kept and unused files, files that are not libraries are always kept
+    """
+    if resolver is None:
+        resolver = DependencyResolver()
+    patterns = DEFAULT_KEEP_PATTERNS + (keep_patterns or [])
+    app_dir = os.path.normpath(app_path.absolute())
+    libraries = LibraryIndex(library.absolute() for library in manifest.shared_libraries)
+
+    # paths are compared resolved: versioned symlinks point to the same library
+    reachable: Set[str] = set()
+    queue: List[Path] = [
+        entry.path.absolute() for entry in manifest if is_root(entry, app_path, patterns)
+    ]
+    while queue:
+        file_path = queue.pop()
+        real_path = os.path.realpath(file_path)
+        if real_path in reachable:
+            continue
+        reachable.add(real_path)
+        dependencies = resolver.dependencies(file_path)
+        if dependencies is None:
+            continue
+        for linked in dependencies.linked:
+            if linked.startswith(app_dir + os.sep):
+                queue.append(Path(linked))
+        for name in dependencies.not_found:
+            try:
+                local_library = libraries.find(name)
+            except AmbiguousLibraryError as error:
+                # not clear which one is loaded, keep all of them
+                queue += error.candidates
+                continue
+            if local_library is not None:
+                queue.append(local_library)
+
+    result = PruneResult()
+    for entry in manifest:
+        if entry.kind == FileKind.SHARED_LIBRARY and (
+            os.path.realpath(entry.path.absolute()) not in reachable
+        ):
+            result.removed.append(entry)
+        else:
+            result.kept.append(entry)
+    return result
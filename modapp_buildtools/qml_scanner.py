@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+from shutil import copy2
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from modapp_buildtools import profiling
+
+CACHE_VERSION = 1
+QML_SOURCE_SUFFIXES = (".qml", ".js", ".mjs")
+
+# `import QtQuick.Controls 2.15 as Controls` in QML and `.import QtQuick 2.0 as Q` in
+# javascript. Directory and javascript imports (quoted) are not modules
+_IMPORT_RE = re.compile(
+    r"^\s*\.?import\s+(?P<name>[A-Za-z_][\w.]*)(?:\s+(?P<version>\d+(?:\.\d+)?|auto))?",
+    re.MULTILINE,
+)
+# qmldir entries, that reference other modules. `import` and `optional import` are used
+# by Qt 6, `depends` by Qt 5
+_QMLDIR_IMPORT_RE = re.compile(
+    r"^\s*(?:depends|(?:optional\s+|default\s+)?import)\s+(?P<name>[A-Za-z_][\w.]*)"
+    r"(?:\s+(?P<version>\d+(?:\.\d+)?|auto))?",
+    re.MULTILINE,
+)
+
+
+def qml_imports_cache_path(app_path: Path) -> Path:
+    app_path = app_path.absolute()
+    return app_path.parent / f".{app_path.name}.qml-imports.json"
+
+
+def _source_files(directory: Path) -> List[Path]:
+    return sorted(
+        path
+        for path in directory.rglob("*")
+        if path.suffix in QML_SOURCE_SUFFIXES and path.is_file()
+    )
+
+
+def _imports(source: str) -> List[Tuple[str, Optional[str]]]:
+    return [(match["name"], match["version"]) for match in _IMPORT_RE.finditer(source)]
+
+
+def qml_sources_hash(qml_dir: Path, qt_qml_dir: Path) -> str:
+    digest = hashlib.sha256(str(qt_qml_dir.absolute()).encode())
+    for source_path in _source_files(qml_dir):
+        digest.update(str(source_path.relative_to(qml_dir)).encode())
+        digest.update(source_path.read_bytes())
+    return digest.hexdigest()
+
+
+def module_files(module_dir: Path) -> List[Path]:
+    """Get files of the QML module without nested modules, they have own qmldir.
+
+    Args:
+        module_dir (Path): directory with qmldir
+
+    Returns:
+        List[Path]: files of the module
+    """
+    files: List[Path] = []
+    directories = [module_dir]
+    while directories:
+        directory = directories.pop()
+        for entry in os.scandir(directory):
+            entry_path = Path(entry.path)
+            if entry.is_dir(follow_symlinks=False):
+                if not (entry_path / "qmldir").exists():
+                    directories.append(entry_path)
+            else:
+                files.append(entry_path)
+    return sorted(files)
+
+
+class QmlImportScanner:
+    """Find QML modules of Qt installation, that are reachable from imports of the app."""
+
+    def __init__(self, qt_qml_dir: Path) -> None:
+        self.qt_qml_dir = qt_qml_dir
+        self._resolved: Dict[Tuple[str, Optional[str]], Optional[Path]] = {}
+
+    def resolve(self, name: str, version: Optional[str] = None) -> Optional[Path]:
+        """Find directory of the module in the same order as QML engine does.
+
+        E.g. `QtQuick.Controls 2.15` is searched in QtQuick/Controls.2.15,
+        QtQuick.2.15/Controls, QtQuick/Controls.2, QtQuick.2/Controls and QtQuick/Controls.
+
+        Args:
+            name (str): module name
+            version (Optional[str]): imported version
+
+        Returns:
+            Optional[Path]: module directory relative to Qt qml directory or None if module
+                            is not a part of Qt, e.g. it is a module of the app
+        """
+        key = (name, version)
+        if key in self._resolved:
+            return self._resolved[key]
+
+        name_parts = name.split(".")
+        versions: List[str] = []
+        if version is not None and version != "auto":
+            version_parts = version.split(".")
+            versions = [
+                ".".join(version_parts[:end]) for end in range(len(version_parts), 0, -1)
+            ]
+        candidates: List[List[str]] = []
+        for candidate_version in versions:
+            for index in range(len(name_parts) - 1, -1, -1):
+                parts = list(name_parts)
+                parts[index] = f"{parts[index]}.{candidate_version}"
+                candidates.append(parts)
+        candidates.append(name_parts)
+
+        found: Optional[Path] = None
+        for parts in candidates:
+            module_dir = Path(*parts)
+            if (self.qt_qml_dir / module_dir / "qmldir").is_file():
+                found = module_dir
+                break
+        self._resolved[key] = found
+        return found
+
+    def scan(self, qml_dir: Path) -> List[Path]:
+        """Find all modules that are imported by the app directly or transitively.
+
+        Args:
+            qml_dir (Path): directory with QML sources of the app
+
+        Returns:
+            List[Path]: module directories relative to Qt qml directory
+        """
+        queue: List[Tuple[str, Optional[str]]] = []
+        for source_path in _source_files(qml_dir):
+            queue += _imports(source_path.read_text(errors="replace"))
+
+        modules: Set[Path] = set()
+        visited: Set[Tuple[str, Optional[str]]] = set()
+        while queue:
+            name, version = queue.pop()
+            if (name, version) in visited:
+                continue
+            visited.add((name, version))
+            module_dir = self.resolve(name, version)
+            if module_dir is None:
+                logger.debug(f"QML module {name} is not found in Qt, skip it")
+                continue
+            if module_dir in modules:
+                continue
+            modules.add(module_dir)
+
+            qmldir = (self.qt_qml_dir / module_dir / "qmldir").read_text(errors="replace")
+            queue += [
+                (match["name"], match["version"])
+                for match in _QMLDIR_IMPORT_RE.finditer(qmldir)
+            ]
+            # QML files of the module can import other modules as well
+            for file_path in module_files(self.qt_qml_dir / module_dir):
+                if file_path.suffix in QML_SOURCE_SUFFIXES:
+                    queue += _imports(file_path.read_text(errors="replace"))
+        return sorted(modules)
+
+
+def find_used_qml_modules(
+    qml_dir: Path, qt_qml_dir: Path, cache_path: Optional[Path] = None
+) -> List[Path]:
+    """Find QML modules used by the app, the result is cached by hash of QML sources.
+
+    Args:
+        qml_dir (Path): directory with QML sources of the app
+        qt_qml_dir (Path): qml directory of Qt installation
+        cache_path (Optional[Path]): path to cache file, cache is not used if it is None
+
+    Returns:
+        List[Path]: module directories relative to Qt qml directory
+    """
+    sources_hash = qml_sources_hash(qml_dir, qt_qml_dir)
+    if cache_path is not None:
+        try:
+            with open(cache_path) as cache_file:
+                data = json.load(cache_file)
+            if data.get("version") == CACHE_VERSION and data.get("sources") == sources_hash:
+                modules = [Path(module) for module in data["modules"]]
+                # Qt installation could be changed in the meantime
+                if all((qt_qml_dir / module / "qmldir").is_file() for module in modules):
+                    logger.info("QML imports are not changed, use cached list of modules")
+                    return modules
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as error:
+            logger.warning(f"Failed to read QML imports cache {cache_path}: {error}")
+
+    modules = QmlImportScanner(qt_qml_dir).scan(qml_dir)
+
+    if cache_path is not None:
+        data = {
+            "version": CACHE_VERSION,
+            "sources": sources_hash,
+            "modules": [str(module) for module in modules],
+        }
+        try:
+            with open(cache_path, "w") as cache_file:
+                json.dump(data, cache_file)
+        except OSError as error:
+            logger.warning(f"Failed to write QML imports cache {cache_path}: {error}")
+    return modules
+
+
+def copy_qml_module(
+    qt_qml_dir: Path,
+    module_dir: Path,
+    destination: Path,
+    copy_function: Callable[[Path, Path], Any] = copy2,
+) -> None:
+    for file_path in module_files(qt_qml_dir / module_dir):
+        destination_path = destination / file_path.relative_to(qt_qml_dir)
+        destination_path.parent.mkdir(parents=True, exist_ok=True)
+        copy_function(file_path, destination_path)
+        profiling.add_bytes_copied(destination_path.stat().st_size)
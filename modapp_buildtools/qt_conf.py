@@ -0,0 +1,21 @@
+from pathlib import Path
+from string import Template
+
+
+def create_qt_conf(destination: Path, prefix: str) -> None:
+    template_path = Path(__file__).parent / "resources" / "linux_qt" / "qt.conf.template"
+    with open(template_path) as template_file:
+        qt_conf_template = Template(template_file.read())
+
+    qt_conf_content = qt_conf_template.safe_substitute(
+        {
+            "Prefix": prefix,
+        }
+    )
+
+    with open(destination / 'qt.conf', "w") as output_file:
+        output_file.write(qt_conf_content)
+
+
+def appimage_post_deploy(app_run_dir_path: Path) -> None:
+    create_qt_conf(app_run_dir_path / "lib64", "../usr/lib/")
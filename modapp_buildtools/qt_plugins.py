@@ -0,0 +1,214 @@
+import os
+import re
+from dataclasses import dataclass
+from fnmatch import fnmatch
+from pathlib import Path
+from shutil import copy2
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from loguru import logger
+
+from modapp_buildtools import profiling
+from modapp_buildtools.dependency_resolver import DependencyResolver
+from modapp_buildtools.file_scanner import scan_tree
+
+# plugin categories, that are loaded by Qt modules. Categories of both Qt 5 and Qt 6 are
+# listed, only existing ones are deployed
+QT_MODULE_PLUGINS: Dict[str, List[str]] = {
+    "Gui": [
+        "platforms",
+        "platforminputcontexts",
+        "platformthemes",
+        "imageformats",
+        "iconengines",
+        "xcbglintegrations",
+        "egldeviceintegrations",
+        "generic",
+    ],
+    "Network": ["bearer", "tls", "networkinformation"],
+    "Sql": ["sqldrivers"],
+    "Svg": ["iconengines", "imageformats"],
+    "PrintSupport": ["printsupport"],
+    "Multimedia": ["mediaservice", "audio", "playlistformats", "multimedia"],
+    "Positioning": ["position"],
+    "Location": ["geoservices"],
+    "Sensors": ["sensors", "sensorgestures"],
+    "TextToSpeech": ["texttospeech"],
+    "SerialBus": ["canbus"],
+    "Gamepad": ["gamepads"],
+    "VirtualKeyboard": ["platforminputcontexts", "virtualkeyboard"],
+    "WaylandClient": [
+        "wayland-decoration-client",
+        "wayland-graphics-integration-client",
+        "wayland-shell-integration",
+    ],
+    "XcbQpa": ["xcbglintegrations"],
+    "3DRender": ["sceneparsers", "geometryloaders", "renderers"],
+    "Quick": ["scenegraph"],
+}
+
+# categories with plugins for many backends: by default only ones, that work without
+# additional system libraries in most environments, are deployed
+DEFAULT_PLUGIN_FILES: Dict[str, List[str]] = {
+    "platforms": ["libqxcb.so", "libqwayland-*.so", "libqoffscreen.so", "libqminimal.so"],
+    "sqldrivers": ["libqsqlite.so"],
+}
+
+# libQt5Gui.so.5, libQt6Gui.so.6.5.0, QtGui.framework/Versions/A/QtGui
+_QT_LIBRARY_RE = re.compile(r"^libQt\d([A-Za-z0-9]+)\.so|^Qt([A-Za-z0-9]+)$")
+
+
+@dataclass
+class PluginSpec:
+    category: str
+    # pattern of plugin file name, all plugins of the category if None
+    pattern: Optional[str] = None
+
+    def matches(self, plugin: Path) -> bool:
+        return plugin.parent.name == self.category and (
+            self.pattern is None or fnmatch(plugin.name, self.pattern)
+        )
+
+
+def parse_plugin_spec(spec: str) -> PluginSpec:
+    """Parse plugin category or plugin file pattern.
+
+    Args:
+        spec (str): 'imageformats' or 'imageformats/libqsvg*'
+
+    Returns:
+        PluginSpec: parsed spec
+    """
+    category, _, pattern = spec.strip("/").partition("/")
+    return PluginSpec(category, pattern or None)
+
+
+def qt_modules(libraries: Iterable[str]) -> Set[str]:
+    modules: Set[str] = set()
+    for library in libraries:
+        match = _QT_LIBRARY_RE.match(os.path.basename(library))
+        if match is not None:
+            modules.add(match[1] or match[2])
+    return modules
+
+
+def plugin_categories(modules: Iterable[str]) -> Set[str]:
+    return {
+        category for module in modules for category in QT_MODULE_PLUGINS.get(module, [])
+    }
+
+
+def _category_plugins(qt_plugins_dir: Path, category: str) -> List[Path]:
+    category_dir = qt_plugins_dir / category
+    if not category_dir.is_dir():
+        return []
+    patterns = DEFAULT_PLUGIN_FILES.get(category, ["*"])
+    return [
+        plugin
+        for plugin in scan_tree(category_dir).shared_libraries
+        if any(fnmatch(plugin.name, pattern) for pattern in patterns)
+    ]
+
+
+def _selected_plugins(qt_plugins_dir: Path, specs: List[PluginSpec]) -> List[Path]:
+    plugins: List[Path] = []
+    for spec in specs:
+        category_dir = qt_plugins_dir / spec.category
+        if not category_dir.is_dir():
+            logger.warning(f"Qt plugin category '{spec.category}' not found")
+            continue
+        plugins += [
+            plugin
+            for plugin in scan_tree(category_dir).shared_libraries
+            if spec.matches(plugin)
+        ]
+    return plugins
+
+
+def _linked_libraries(files: Iterable[Path], resolver: DependencyResolver) -> List[str]:
+    libraries: List[str] = []
+    for file_path in files:
+        dependencies = resolver.dependencies(file_path)
+        if dependencies is not None:
+            libraries += dependencies.linked + dependencies.not_found
+    return libraries
+
+
+def deploy_qt_plugins(
+    qt_plugins_dir: Path,
+    app_plugins_dir: Path,
+    app_binaries: List[Path],
+    resolver: DependencyResolver,
+    plugins: Optional[List[str]] = None,
+    exclude_plugins: Optional[List[str]] = None,
+    copy_function: Callable[[Path, Path], Any] = copy2,
+) -> List[Path]:
+    """Copy Qt plugins, that are required by the app.
+
+    If plugins are not specified explicitly, their categories are inferred from Qt modules,
+    that the app and already selected plugins link, e.g. Gui requires platforms.
+
+    Args:
+        qt_plugins_dir (Path): plugins directory of Qt installation
+        app_plugins_dir (Path): plugins directory of the app
+        app_binaries (List[Path]): executables and libraries of the app
+        resolver (DependencyResolver): resolver to get linked libraries
+        plugins (Optional[List[str]]): plugin categories or files to deploy instead of
+                                       inferred ones, e.g. 'imageformats/libqsvg.so'
+        exclude_plugins (Optional[List[str]]): plugin categories or files that should not be
+                                               deployed
+        copy_function (Callable[[Path, Path], Any]): function to copy a plugin, e.g. from
+                                                     the artifact cache
+
+    Returns:
+        List[Path]: copied plugins
+    """
+    excluded = [parse_plugin_spec(spec) for spec in exclude_plugins or []]
+
+    def is_excluded(plugin: Path) -> bool:
+        return any(spec.matches(plugin) for spec in excluded)
+
+    copied: List[Path] = []
+
+    def copy_plugins(plugins_to_copy: List[Path]) -> List[Path]:
+        new_plugins: List[Path] = []
+        for plugin in plugins_to_copy:
+            if is_excluded(plugin):
+                continue
+            destination = app_plugins_dir / plugin.relative_to(qt_plugins_dir)
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            copy_function(plugin, destination)
+            profiling.add_bytes_copied(destination.stat().st_size)
+            new_plugins.append(destination)
+        copied.extend(new_plugins)
+        return new_plugins
+
+    if plugins is not None:
+        copy_plugins(_selected_plugins(qt_plugins_dir, [parse_plugin_spec(p) for p in plugins]))
+        return copied
+
+    # plugins link Qt modules as well, e.g. xcb platform plugin links XcbQpa, that requires
+    # xcbglintegrations. Repeat until no new categories are found
+    known_modules: Set[str] = set()
+    selected_categories: Set[str] = set()
+    pending = app_binaries
+    while pending:
+        modules = qt_modules(_linked_libraries(pending, resolver)) - known_modules
+        known_modules |= modules
+        categories = plugin_categories(modules) - selected_categories
+        selected_categories |= categories
+        if len(categories) > 0:
+            logger.info(
+                f"Qt modules {', '.join(sorted(modules))} require plugins: "
+                + ", ".join(sorted(categories))
+            )
+        pending = copy_plugins(
+            [
+                plugin
+                for category in sorted(categories)
+                for plugin in _category_plugins(qt_plugins_dir, category)
+            ]
+        )
+    if len(known_modules) == 0:
+        logger.warning("No linked Qt modules found, use --plugins to select plugins")
+    return copied
@@ -0,0 +1,304 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from sys import exit
+from typing import Dict, List, Optional, Set
+
+from loguru import logger
+
+from modapp_buildtools import profiling
+from modapp_buildtools.binary_patcher import EditPlan, apply_edit_plan
+from modapp_buildtools.command_engine import configure as configure_commands, default_jobs
+from modapp_buildtools.dependency_resolver import DependencyResolver, LoaderLookup
+from modapp_buildtools.file_scanner import scan_tree
+from modapp_buildtools.library_index import AmbiguousLibraryError, LibraryIndex
+from modapp_buildtools.rpath_utils import relative_rpath
+
+ORIGIN = "$ORIGIN"
+
+
+@dataclass
+class RpathChange:
+    file_path: Path
+    old_rpath: List[str]
+    old_is_rpath: bool
+    new_rpath: List[str]
+    new_is_rpath: bool
+
+
+@dataclass
+class NormalizeResult:
+    changed: List[Path] = field(default_factory=list)
+    failed: List[Path] = field(default_factory=list)
+    failed_lookups_before: int = 0
+    failed_lookups_after: int = 0
+
+    def log(self) -> None:
+        logger.info(
+            f"Normalized rpath of {len(self.changed)} files, failed lookups of the dynamic"
+            f" loader: {self.failed_lookups_before} -> {self.failed_lookups_after}"
+        )
+        if len(self.failed) > 0:
+            logger.error(
+                f"rpath of {len(self.failed)} files is restored, normalized one changed"
+                " resolved libraries:\n    "
+                + "\n    ".join(str(file_path) for file_path in self.failed)
+            )
+
+
+def _is_inside(path: str, directory: str) -> bool:
+    return path == directory or path.startswith(directory + os.sep)
+
+
+def _expand_origin(entry: str, origin: str) -> str:
+    return os.path.normpath(entry.replace("${ORIGIN}", origin).replace(ORIGIN, origin))
+
+
+def minimal_rpath(
+    file_path: Path,
+    app_path: Path,
+    resolver: DependencyResolver,
+    libraries: Optional[LibraryIndex] = None,
+) -> Optional[List[str]]:
+    """Compute the smallest list of rpath entries, that satisfies all needed libraries.
+
+    Libraries of the app are referenced relative to $ORIGIN, libraries that are not
+    found from the current location are looked up by name in `libraries`. Existing
+    entries outside of the app are kept only if a library is found there, system
+    libraries don't need any entry. Directories serving more libraries go first, so
+    that the loader makes as few failed lookups as possible.
+
+    Args:
+        file_path (Path): ELF file of the app
+        app_path (Path): app directory
+        resolver (DependencyResolver): resolver for current locations of libraries
+        libraries (Optional[LibraryIndex]): libraries of the app
+
+    Returns:
+        Optional[List[str]]: rpath entries or None if file is not a dynamic ELF file
+    """
+    normalized_path = os.path.normpath(file_path.absolute())
+    elf_info = resolver.elf_info(normalized_path)
+    if elf_info is None or not elf_info.has_dynamic:
+        return None
+    app_dir = os.path.normpath(app_path.absolute())
+    origin = os.path.dirname(normalized_path)
+    existing_entries = {_expand_origin(entry, origin): entry for entry in elf_info.rpaths}
+
+    # entry -> number of libraries found with it, in order of first use
+    usage: Dict[str, int] = {}
+    for soname, found in resolver.direct_dependencies(file_path):
+        if found is None and libraries is not None:
+            try:
+                local_library = libraries.find(soname)
+            except AmbiguousLibraryError as error:
+                logger.warning(f"Cannot choose rpath of {file_path}: {error}")
+                local_library = None
+            if local_library is not None:
+                found = os.path.normpath(local_library.absolute())
+        if found is None:
+            continue
+        library_dir = os.path.dirname(found)
+        if _is_inside(library_dir, app_dir):
+            entry = relative_rpath(Path(origin), Path(library_dir))
+        elif library_dir in existing_entries:
+            entry = existing_entries[library_dir]
+        else:
+            continue
+        usage[entry] = usage.get(entry, 0) + 1
+    # sort is stable: order of first use among entries with the same usage
+    return sorted(usage, key=lambda entry: -usage[entry])
+
+
+def _resolved(lookups: List[LoaderLookup]) -> Dict[str, str]:
+    return {
+        lookup.soname: os.path.realpath(lookup.found)
+        for lookup in lookups
+        if lookup.found is not None
+    }
+
+
+def _lost_libraries(resolved_before: Dict[str, str], lookups: List[LoaderLookup]) -> bool:
+    # the same library must be found for every needed name, a library that was not found
+    # before can be found now
+    resolved = _resolved(lookups)
+    return any(resolved.get(soname) != path for soname, path in resolved_before.items())
+
+
+def count_failed_lookups(
+    files: List[Path], resolver: Optional[DependencyResolver] = None
+) -> Dict[Path, int]:
+    """Count failed lookups of the dynamic loader, when each file is loaded.
+
+    Args:
+        files (List[Path]): executables and libraries
+        resolver (Optional[DependencyResolver]): resolver to share parsed files with
+
+    Returns:
+        Dict[Path, int]: failed lookups of the file and all its dependencies, symlinks
+                         are skipped
+    """
+    if resolver is None:
+        resolver = DependencyResolver()
+    return {
+        file_path: sum(lookup.failed_lookups for lookup in resolver.lookups(file_path))
+        for file_path in files
+        if not file_path.is_symlink()
+    }
+
+
+def log_failed_lookups(failed_lookups: Dict[Path, int], top: int = 10) -> None:
+    total = sum(failed_lookups.values())
+    logger.info(f"Failed lookups of the dynamic loader in {len(failed_lookups)} files: {total}")
+    for file_path, count in sorted(failed_lookups.items(), key=lambda item: -item[1])[:top]:
+        if count > 0:
+            logger.info(f"    {count:6} {file_path}")
+
+
+def _apply(file_path: Path, rpath: List[str], is_rpath: bool) -> bool:
+    plan = EditPlan(rpath=rpath, force_rpath=is_rpath)
+    with profiling.task("rpath", file_path.name):
+        return apply_edit_plan(file_path, plan)
+
+
+def normalize_rpaths(
+    files: List[Path],
+    app_path: Path,
+    resolver: Optional[DependencyResolver] = None,
+    libraries: Optional[LibraryIndex] = None,
+    use_runpath: bool = True,
+    jobs: Optional[int] = None,
+) -> NormalizeResult:
+    """Replace rpath of ELF files with minimal $ORIGIN-relative one.
+
+    Files with rpath entries outside of the app keep DT_RPATH: libraries loaded from there
+    can rely on rpath inherited from the file. After the change, every file must resolve
+    the same libraries as before, including files, that are not changed, but load changed
+    ones. Otherwise rpath of the changed files, that load the affected file or its
+    dependencies, is restored, e.g. DT_RPATH inherited by their dependencies.
+
+    Args:
+        files (List[Path]): ELF files to normalize
+        app_path (Path): app directory
+        resolver (Optional[DependencyResolver]): resolver to share parsed files with, its
+                                                 cache is invalidated
+        libraries (Optional[LibraryIndex]): libraries of the app to find not found ones
+        use_runpath (bool): switch to DT_RUNPATH where it is possible
+        jobs (Optional[int]): number of workers, number of CPUs by default
+
+    Returns:
+        NormalizeResult: changed and restored files, failed lookups before and after
+    """
+    if resolver is None:
+        resolver = DependencyResolver()
+    result = NormalizeResult()
+
+    # symlinks share the file with their targets, it is normalized once
+    files = [file_path for file_path in files if not file_path.is_symlink()]
+    changes: List[RpathChange] = []
+    # file -> libraries resolved before the change and objects, that load them
+    resolved_before: Dict[Path, Dict[str, str]] = {}
+    loaders: Dict[Path, Set[str]] = {}
+    for file_path in files:
+        lookups = resolver.lookups(file_path)
+        result.failed_lookups_before += sum(lookup.failed_lookups for lookup in lookups)
+        resolved_before[file_path] = _resolved(lookups)
+        loaders[file_path] = {lookup.requester for lookup in lookups} | {
+            os.path.normpath(file_path.absolute())
+        }
+        new_rpath = minimal_rpath(file_path, app_path, resolver, libraries)
+        elf_info = resolver.elf_info(os.path.normpath(file_path.absolute()))
+        if new_rpath is None or elf_info is None:
+            continue
+        old_is_rpath = elf_info.rpath is not None and elf_info.runpath is None
+        keeps_external = any(not entry.startswith(ORIGIN) for entry in new_rpath)
+        if use_runpath and not keeps_external:
+            new_is_rpath = False
+        elif len(elf_info.rpaths) > 0:
+            new_is_rpath = old_is_rpath
+        else:
+            new_is_rpath = not use_runpath
+        if new_rpath == elf_info.rpaths and (new_is_rpath == old_is_rpath or not new_rpath):
+            continue
+        changes.append(
+            RpathChange(
+                file_path,
+                elf_info.rpaths,
+                old_is_rpath,
+                new_rpath,
+                new_is_rpath,
+            )
+        )
+
+    def apply_change(change: RpathChange) -> bool:
+        return _apply(change.file_path, change.new_rpath, change.new_is_rpath)
+
+    def restore_change(change: RpathChange) -> bool:
+        return _apply(change.file_path, change.old_rpath, change.old_is_rpath)
+
+    with ThreadPoolExecutor(
+        max_workers=jobs or default_jobs(), thread_name_prefix="rpath"
+    ) as executor:
+        applied = list(executor.map(apply_change, changes))
+        resolver.invalidate()
+        active = {
+            os.path.normpath(change.file_path.absolute()): change
+            for change, is_applied in zip(changes, applied)
+            if is_applied
+        }
+        to_restore = [change for change, is_applied in zip(changes, applied) if not is_applied]
+        if len(to_restore) > 0:
+            list(executor.map(restore_change, to_restore))
+            resolver.invalidate()
+
+        # restored files are in the original state, each round restores at least one file
+        while True:
+            culprits = {
+                loader
+                for file_path in files
+                if _lost_libraries(resolved_before[file_path], resolver.lookups(file_path))
+                for loader in loaders[file_path]
+                if loader in active
+            }
+            if len(culprits) == 0:
+                break
+            restored = [active.pop(loader) for loader in sorted(culprits)]
+            list(executor.map(restore_change, restored))
+            resolver.invalidate()
+            to_restore += restored
+    result.changed = [change.file_path for change in active.values()]
+    result.failed = sorted(change.file_path for change in to_restore)
+
+    result.failed_lookups_after = sum(
+        lookup.failed_lookups for file_path in files for lookup in resolver.lookups(file_path)
+    )
+    return result
+
+
+def normalize_app_rpaths(
+    bin_path: Path,
+    check_only: bool = False,
+    use_runpath: bool = True,
+    jobs: Optional[int] = None,
+) -> None:
+    configure_commands(jobs)
+    manifest = scan_tree(bin_path)
+    app_path = bin_path if bin_path.is_dir() else bin_path.parent
+    resolver = DependencyResolver()
+
+    if check_only:
+        log_failed_lookups(count_failed_lookups(manifest.binaries, resolver))
+        return
+
+    result = normalize_rpaths(
+        manifest.binaries,
+        app_path,
+        resolver=resolver,
+        libraries=LibraryIndex(library.absolute() for library in manifest.shared_libraries),
+        use_runpath=use_runpath,
+        jobs=jobs,
+    )
+    result.log()
+    if len(result.failed) > 0:
+        exit(1)
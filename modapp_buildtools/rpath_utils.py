@@ -1,69 +1,101 @@
 import os
 import re
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 from pathlib import Path
 from platform import system
 
-from command_runner import command_runner
 from loguru import logger
 
+from modapp_buildtools import profiling
+from modapp_buildtools.binary_patcher import EditPlan, apply_edit_plan
+from modapp_buildtools.command_engine import default_jobs, run_command
+from modapp_buildtools.elf_utils import read_elf
+
 
 def get_rpaths(filepath: Path) -> List[str]:
     current_system = system()
     if current_system == "Linux":
-        command = f"patchelf --print-rpath {filepath}"
-        exit_code, output = command_runner(command)
-        if exit_code != 0:
-            ...  # TODO
-        return str(output).split(":")
+        elf_info = read_elf(filepath)
+        if elf_info is None:
+            return []
+        return elf_info.rpaths
     elif current_system == "Darwin":
-        command = f"otool -l {filepath}"
-        exit_code, output = command_runner(command)
-        if exit_code != 0:
-            ...  # TODO
+        output = run_command(["otool", "-l", str(filepath)]).check().output
         p2 = re.compile(
             r"cmd LC_RPATH\n      cmdsize \d+\n         path (?P<lib>.*) \("
         )
-        return p2.findall(str(output))
+        return p2.findall(output)
     return []
 
 
-def add_relative_rpath_if_needed(file_path: Path, to_path: Path) -> None:
+def relative_rpath(from_dir: Path, to_path: Path) -> str:
+    relative_path = Path(os.path.relpath(to_path, from_dir))
+    if relative_path == Path("."):
+        return "$ORIGIN"
+    return f"$ORIGIN/{str(relative_path)}"
+
+
+def add_relative_rpath_if_needed(file_path: Path, to_path: Path) -> bool:
     # from file to directory
-    relative_path = Path(os.path.relpath(to_path, file_path.parent))
-    rpath = f"$ORIGIN/{str(relative_path)}"
-    add_rpath_if_needed(file_path, rpath)
+    return add_rpath_if_needed(file_path, relative_rpath(file_path.parent, to_path))
+
+
+def add_relative_rpaths_if_needed(
+    files: List[Path], to_path: Path, jobs: Optional[int] = None
+) -> bool:
+    """Add rpath to the directory to all files in parallel.
+
+    Files that already have the rpath are only read, no external command is started
+    for them.
 
+    Args:
+        files (List[Path]): binaries to update
+        to_path (Path): directory with libraries, rpath is relative to each file
+        jobs (Optional[int]): number of workers, number of CPUs by default
 
-def add_rpath_if_needed(file_path: Path, rpath: str) -> None:
+    Returns:
+        bool: True if all files have the rpath now
+    """
+    # all files in one directory get the same rpath
+    rpaths_by_dir: Dict[Path, str] = {}
+    for file_path in files:
+        if file_path.parent not in rpaths_by_dir:
+            rpaths_by_dir[file_path.parent] = relative_rpath(file_path.parent, to_path)
+
+    def update_file(file_path: Path) -> bool:
+        with profiling.task("rpath", file_path.name):
+            return add_rpath_if_needed(file_path, rpaths_by_dir[file_path.parent])
+
+    with ThreadPoolExecutor(
+        max_workers=jobs or default_jobs(), thread_name_prefix="rpath"
+    ) as executor:
+        results = list(executor.map(update_file, files))
+    return all(results)
+
+
+def add_rpath_if_needed(file_path: Path, rpath: str) -> bool:
     rpaths = get_rpaths(file_path)
     if rpath not in rpaths:
-        add_rpath(file_path, rpath)
+        return add_rpath(file_path, rpath, current_rpaths=rpaths)
+    return True
 
 
-def add_rpath(file_path: Path, rpath: str) -> None:
-    # add new rpath. If it exists, it'll be duplicated(check before)
+def add_rpath(
+    file_path: Path, rpath: str, current_rpaths: Optional[List[str]] = None
+) -> bool:
+    # add new rpath, existing rpath entries are not duplicated
     current_system = system()
     if current_system == "":
         logger.error("Failed to recognize OS")
-        return
-
-    commands_by_system = {
-        # Older systems that are often used for build include patchelf 0.9 which doesn't support
-        # --add-rpath. It was introduced in patchelf 0.14 that cannot be built for old systems,
-        # because it requires C++17. Use set + print instead of add.
-        "Linux": (
-            'patchelf --set-rpath "$(patchelf --print-rpath \'{file_to_fix}\'):{rpath}"'
-            ' "{file_to_fix}"'
-        ),
-        "Darwin": 'install_name_tool -add_rpath "{rpath}" "{file_to_fix}"',
-    }
-
-    add_rpath_command = commands_by_system[current_system].format(
-        rpath=rpath, file_to_fix=file_path
-    )
-    exit_code, output = command_runner(add_rpath_command)
-    if exit_code != 0:
-        logger.error(f"Failed to add rpath '{rpath}' to '{file_path}': {output}")
-    else:
+        return False
+
+    if current_rpaths is None:
+        current_rpaths = get_rpaths(file_path)
+    plan = EditPlan()
+    plan.add_rpaths(current_rpaths, [rpath])
+    if apply_edit_plan(file_path, plan):
         logger.trace(f"Added rpath '{rpath}' to '{file_path}'")
+        return True
+    logger.error(f"Failed to add rpath '{rpath}' to '{file_path}'")
+    return False
@@ -0,0 +1,165 @@
+import errno
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+from threading import Lock
+from typing import Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from modapp_buildtools import profiling
+from modapp_buildtools.command_engine import default_jobs
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore
+
+# _IOW(0x94, 9, int) from linux/fs.h
+FICLONE = 0x40049409
+# errors meaning that the strategy is not supported for this pair of filesystems
+_UNSUPPORTED_ERRNOS = {
+    errno.EXDEV,
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.EOPNOTSUPP,
+    errno.ENOTTY,
+    errno.EPERM,
+}
+
+
+class CopyStrategy(Enum):
+    REFLINK = "reflink"
+    COPY_FILE_RANGE = "copy_file_range"
+    HARDLINK = "hardlink"
+    COPY = "copy"
+
+
+@dataclass
+class StagedFile:
+    source: Path
+    destination: Path
+    # file will be modified in the output (rpath, strip), it must not share data with the
+    # source, so it cannot be hardlinked
+    patchable: bool = False
+
+
+def _reflink(source: Path, destination: Path) -> None:
+    if fcntl is None:
+        raise OSError(errno.ENOSYS, "reflink is not supported")
+    with open(source, "rb") as source_file, open(destination, "wb") as destination_file:
+        fcntl.ioctl(destination_file.fileno(), FICLONE, source_file.fileno())
+
+
+def _copy_file_range(source: Path, destination: Path) -> None:
+    if not hasattr(os, "copy_file_range"):
+        raise OSError(errno.ENOSYS, "copy_file_range is not supported")
+    with open(source, "rb") as source_file, open(destination, "wb") as destination_file:
+        size = os.fstat(source_file.fileno()).st_size
+        copied = 0
+        while copied < size:
+            count = os.copy_file_range(
+                source_file.fileno(), destination_file.fileno(), size - copied
+            )
+            if count == 0:
+                break
+            copied += count
+
+
+class FileStager:
+    """Copy files to the output directory in parallel using the cheapest possible way.
+
+    Strategies are tried in order: reflink (copy-on-write clone), copy_file_range (copy in
+    kernel), hardlink (only for files that are not modified later) and regular copy.
+    If a strategy is not supported between two filesystems, it is not tried again for them.
+    """
+
+    def __init__(self, jobs: Optional[int] = None) -> None:
+        self.jobs = jobs or default_jobs()
+        self.bytes_by_strategy: Dict[CopyStrategy, int] = {
+            strategy: 0 for strategy in CopyStrategy
+        }
+        self.files_by_strategy: Dict[CopyStrategy, int] = {
+            strategy: 0 for strategy in CopyStrategy
+        }
+        # (source device, destination device, strategy)
+        self._unsupported: Set[Tuple[int, int, CopyStrategy]] = set()
+        self._lock = Lock()
+
+    def _strategies(
+        self, staged_file: StagedFile, devices: Tuple[int, int]
+    ) -> List[CopyStrategy]:
+        strategies = [CopyStrategy.REFLINK, CopyStrategy.COPY_FILE_RANGE]
+        if not staged_file.patchable and devices[0] == devices[1]:
+            strategies.append(CopyStrategy.HARDLINK)
+        return [
+            strategy
+            for strategy in strategies
+            if (devices[0], devices[1], strategy) not in self._unsupported
+        ] + [CopyStrategy.COPY]
+
+    def _stage_file(self, staged_file: StagedFile) -> None:
+        source, destination = staged_file.source, staged_file.destination
+        source_stat = source.stat()
+        devices = (source_stat.st_dev, destination.parent.stat().st_dev)
+        if destination.exists() or destination.is_symlink():
+            destination.unlink()
+
+        for strategy in self._strategies(staged_file, devices):
+            try:
+                if strategy == CopyStrategy.REFLINK:
+                    _reflink(source, destination)
+                elif strategy == CopyStrategy.COPY_FILE_RANGE:
+                    _copy_file_range(source, destination)
+                elif strategy == CopyStrategy.HARDLINK:
+                    os.link(source, destination)
+                else:
+                    shutil.copyfile(source, destination)
+            except OSError as error:
+                if strategy == CopyStrategy.COPY or error.errno not in _UNSUPPORTED_ERRNOS:
+                    raise
+                with self._lock:
+                    self._unsupported.add((devices[0], devices[1], strategy))
+                if destination.exists():
+                    destination.unlink()
+                continue
+            if strategy != CopyStrategy.HARDLINK:
+                shutil.copymode(source, destination)
+            with self._lock:
+                self.bytes_by_strategy[strategy] += source_stat.st_size
+                self.files_by_strategy[strategy] += 1
+            # hardlinks share data with the source, nothing is copied
+            if strategy != CopyStrategy.HARDLINK:
+                profiling.add_bytes_copied(source_stat.st_size)
+            return
+
+    def stage_file(self, staged_file: StagedFile) -> None:
+        # one file in the calling thread, its directory must exist
+        self._stage_file(staged_file)
+
+    def stage(self, files: List[StagedFile]) -> None:
+        # all directories are created once before copying
+        for directory in sorted({staged_file.destination.parent for staged_file in files}):
+            os.makedirs(directory, exist_ok=True)
+
+        def stage_file(staged_file: StagedFile) -> None:
+            with profiling.task("stage", staged_file.source.name):
+                self._stage_file(staged_file)
+
+        with ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix="stage") as executor:
+            # result() reraises errors of workers
+            for future in [executor.submit(stage_file, f) for f in files]:
+                future.result()
+
+    def log_statistics(self) -> None:
+        logger.info(
+            "Staged files: "
+            + ", ".join(
+                f"{strategy.value} {self.files_by_strategy[strategy]} files"
+                f" ({self.bytes_by_strategy[strategy] / 1024 / 1024:.1f} MiB)"
+                for strategy in CopyStrategy
+            )
+        )
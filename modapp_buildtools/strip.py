@@ -0,0 +1,185 @@
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from platform import system
+from threading import Lock
+from typing import List, Optional, Tuple
+
+from loguru import logger
+
+from modapp_buildtools import profiling
+from modapp_buildtools.command_engine import CommandError, default_jobs, run_command
+from modapp_buildtools.elf_utils import ElfError, ElfInfo, is_stripped, read_elf
+
+STRIP_TOOL = "strip"
+OBJCOPY_TOOL = "objcopy"
+DEBUG_SUFFIX = ".debug"
+
+
+class StripError(Exception):
+    pass
+
+
+@dataclass
+class StripResult:
+    size_before: int = 0
+    size_after: int = 0
+    stripped: int = 0
+    skipped: int = 0
+    failed: List[Path] = field(default_factory=list)
+    _lock: Lock = field(default_factory=Lock, repr=False, compare=False)
+
+    def add(self, size_before: int, size_after: int) -> None:
+        with self._lock:
+            self.size_before += size_before
+            self.size_after += size_after
+            self.stripped += 1
+
+    def add_skipped(self) -> None:
+        with self._lock:
+            self.skipped += 1
+
+    def add_failed(self, file_path: Path) -> None:
+        with self._lock:
+            self.failed.append(file_path)
+
+    def log(self) -> None:
+        logger.info(
+            f"Stripped {self.stripped} files ({self.skipped} already stripped):"
+            f" {self.size_before / 1024 / 1024:.1f} MiB ->"
+            f" {self.size_after / 1024 / 1024:.1f} MiB"
+        )
+        if len(self.failed) > 0:
+            logger.error(
+                f"Failed to strip {len(self.failed)} files, they are left unchanged:\n    "
+                + "\n    ".join(str(file_path) for file_path in self.failed)
+            )
+
+
+def _linking_info(elf_info: ElfInfo) -> Tuple[object, ...]:
+    # everything the dynamic loader uses to find libraries: must survive stripping
+    return (
+        elf_info.needed,
+        elf_info.soname,
+        elf_info.rpath,
+        elf_info.runpath,
+        elf_info.interpreter,
+    )
+
+
+def debug_file_path(file_path: Path, root: Path, debug_dir: Path) -> Path:
+    # app/lib/libfoo.so -> debug_dir/lib/libfoo.so.debug
+    relative_path = file_path.relative_to(root)
+    return debug_dir / relative_path.with_name(relative_path.name + DEBUG_SUFFIX)
+
+
+def strip_file(file_path: Path, debug_file: Optional[Path] = None) -> Optional[Tuple[int, int]]:
+    """Strip symbols and debug information from ELF file.
+
+    The file is stripped into a temporary copy first. It replaces the original only if
+    needed libraries, soname, rpath and interpreter are not changed, otherwise the
+    original is kept untouched.
+
+    Args:
+        file_path (Path): ELF file
+        debug_file (Optional[Path]): if set, debug information is saved to this file and
+                                     the stripped file is linked to it with .gnu_debuglink
+
+    Returns:
+        Optional[Tuple[int, int]]: size before and after stripping, None if the file is not
+                                   an ELF file or it is already stripped
+
+    Raises:
+        StripError: strip failed or it changed linking information
+    """
+    try:
+        elf_info = read_elf(file_path)
+        if elf_info is None or is_stripped(file_path):
+            return None
+    except ElfError as error:
+        raise StripError(str(error)) from error
+
+    temporary_path = file_path.with_name(file_path.name + ".strip.tmp")
+    try:
+        if debug_file is not None:
+            debug_file.parent.mkdir(parents=True, exist_ok=True)
+            run_command(
+                [OBJCOPY_TOOL, "--only-keep-debug", str(file_path), str(debug_file)]
+            ).check()
+        run_command(
+            [STRIP_TOOL, "--strip-unneeded", "-o", str(temporary_path), str(file_path)]
+        ).check()
+        if debug_file is not None:
+            run_command(
+                [OBJCOPY_TOOL, f"--add-gnu-debuglink={debug_file}", str(temporary_path)]
+            ).check()
+
+        stripped_info = read_elf(temporary_path)
+        if stripped_info is None or _linking_info(stripped_info) != _linking_info(elf_info):
+            raise StripError(f"stripping of {file_path} changed its linking information")
+
+        size_before = file_path.stat().st_size
+        shutil.copymode(file_path, temporary_path)
+        os.replace(temporary_path, file_path)
+        return size_before, file_path.stat().st_size
+    except (CommandError, ElfError, OSError) as error:
+        raise StripError(str(error)) from error
+    finally:
+        if temporary_path.exists():
+            temporary_path.unlink()
+
+
+def strip_binaries(
+    files: List[Path],
+    root: Path,
+    debug_dir: Optional[Path] = None,
+    jobs: Optional[int] = None,
+) -> StripResult:
+    """Strip ELF files in parallel.
+
+    Args:
+        files (List[Path]): executables and libraries
+        root (Path): directory, paths of debug files are relative to it
+        debug_dir (Optional[Path]): directory for separate debug files, debug information
+                                    is dropped if it is None
+        jobs (Optional[int]): number of workers, number of CPUs by default
+
+    Returns:
+        StripResult: sizes before and after and files that failed to strip
+    """
+    result = StripResult()
+    if system() != "Linux":
+        logger.warning("Stripping is supported only on Linux, skip it")
+        return result
+    tools = [STRIP_TOOL] + ([OBJCOPY_TOOL] if debug_dir is not None else [])
+    missing_tools = [tool for tool in tools if shutil.which(tool) is None]
+    if len(missing_tools) > 0:
+        logger.warning(f"{', '.join(missing_tools)} not found, skip stripping")
+        return result
+
+    def strip_one(file_path: Path) -> None:
+        debug_file = (
+            debug_file_path(file_path, root, debug_dir) if debug_dir is not None else None
+        )
+        with profiling.task("strip", file_path.name):
+            try:
+                sizes = strip_file(file_path, debug_file)
+            except StripError as error:
+                logger.debug(f"Failed to strip {file_path}: {error}")
+                result.add_failed(file_path)
+                return
+        if sizes is None:
+            result.add_skipped()
+        else:
+            result.add(*sizes)
+
+    # symlinks, e.g. versioned names of libraries, point to files that are stripped anyway
+    files = [file_path for file_path in files if not file_path.is_symlink()]
+    with ThreadPoolExecutor(
+        max_workers=jobs or default_jobs(), thread_name_prefix="strip"
+    ) as executor:
+        list(executor.map(strip_one, files))
+    result.failed.sort()
+    return result
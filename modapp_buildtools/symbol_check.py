@@ -0,0 +1,255 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from sys import exit
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from modapp_buildtools import profiling
+from modapp_buildtools.command_engine import default_jobs
+from modapp_buildtools.dependency_resolver import DependencyResolver
+from modapp_buildtools.elf_utils import (
+    DynamicSymbols,
+    ElfError,
+    ImportedSymbol,
+    read_dynamic_symbols,
+)
+from modapp_buildtools.file_scanner import scan_tree
+
+# versions of glibc, libstdc++ and its ABI, that limit distributions the app runs on
+TRACKED_VERSIONS = ("GLIBC", "GLIBCXX", "CXXABI")
+# not more unresolved symbols are logged per file
+MAX_LOGGED_SYMBOLS = 10
+_VERSION_RE = re.compile(r"^(?P<prefix>[A-Z]+)_(?P<number>\d+(?:\.\d+)*)$")
+
+
+class SymbolCheckError(Exception):
+    pass
+
+
+def parse_version(version: str) -> Optional[Tuple[str, Tuple[int, ...]]]:
+    """Split symbol version into its prefix and number, e.g. 'GLIBC_2.17'.
+
+    Args:
+        version (str): version name
+
+    Returns:
+        Optional[Tuple[str, Tuple[int, ...]]]: prefix and number or None for versions
+                                               without number like 'GLIBC_PRIVATE'
+    """
+    match = _VERSION_RE.match(version)
+    if match is None:
+        return None
+    return match["prefix"], tuple(int(part) for part in match["number"].split("."))
+
+
+def parse_max_versions(max_versions: Iterable[str]) -> Dict[str, Tuple[int, ...]]:
+    """Parse limits of required versions, e.g. ['GLIBC_2.17', 'GLIBCXX_3.4.19'].
+
+    Args:
+        max_versions (Iterable[str]): maximal allowed versions
+
+    Returns:
+        Dict[str, Tuple[int, ...]]: prefix -> maximal allowed number, e.g. 'GLIBC' -> (2, 17)
+
+    Raises:
+        SymbolCheckError: version has wrong format
+    """
+    limits: Dict[str, Tuple[int, ...]] = {}
+    for max_version in max_versions:
+        parsed = parse_version(max_version)
+        if parsed is None:
+            raise SymbolCheckError(f"Invalid version: {max_version}, expected e.g. GLIBC_2.17")
+        limits[parsed[0]] = parsed[1]
+    return limits
+
+
+class SymbolIndex:
+    """Symbols exported by all libraries of one run: bundled ones and system ones."""
+
+    def __init__(self) -> None:
+        # name -> versions, None for unversioned definitions
+        self._versions: Dict[str, Set[Optional[str]]] = {}
+
+    def add(self, symbols: DynamicSymbols) -> None:
+        for name, version in symbols.exported:
+            self._versions.setdefault(name, set()).add(version)
+
+    def provides(self, symbol: ImportedSymbol) -> bool:
+        versions = self._versions.get(symbol.name)
+        if versions is None:
+            return False
+        # the loader binds versioned references to unversioned definitions as well
+        return symbol.version is None or symbol.version in versions or None in versions
+
+
+@dataclass
+class FileSymbolsResult:
+    file: Path
+    unresolved: List[str] = field(default_factory=list)
+    # prefix -> maximal required version, e.g. 'GLIBC' -> 'GLIBC_2.34'
+    max_versions: Dict[str, str] = field(default_factory=dict)
+    too_new: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return len(self.unresolved) == 0 and len(self.too_new) == 0
+
+
+def _max_versions(symbols: DynamicSymbols) -> Dict[str, str]:
+    max_versions: Dict[str, Tuple[Tuple[int, ...], str]] = {}
+    for versions in symbols.required_versions.values():
+        for version in versions:
+            parsed = parse_version(version)
+            if parsed is None or parsed[0] not in TRACKED_VERSIONS:
+                continue
+            prefix, number = parsed
+            if prefix not in max_versions or number > max_versions[prefix][0]:
+                max_versions[prefix] = (number, version)
+    return {prefix: version for prefix, (_, version) in max_versions.items()}
+
+
+def check_file_symbols(
+    symbols: DynamicSymbols, index: SymbolIndex, limits: Dict[str, Tuple[int, ...]]
+) -> FileSymbolsResult:
+    result = FileSymbolsResult(symbols.path, max_versions=_max_versions(symbols))
+    for symbol in symbols.imported:
+        # weak references may stay unresolved, e.g. __gmon_start__
+        if not symbol.weak and not index.provides(symbol):
+            version = f"@{symbol.version}" if symbol.version is not None else ""
+            result.unresolved.append(f"{symbol.name}{version}")
+    for prefix, version in result.max_versions.items():
+        parsed = parse_version(version)
+        if prefix in limits and parsed is not None and parsed[1] > limits[prefix]:
+            result.too_new.append(version)
+    return result
+
+
+def _read_symbols(path: Path) -> Optional[DynamicSymbols]:
+    with profiling.task("symbols", path.name):
+        try:
+            return read_dynamic_symbols(path)
+        except (OSError, ElfError) as error:
+            logger.warning(f"Failed to read symbols of {path}: {error}")
+            return None
+
+
+def check_symbols_in_files(
+    files: List[Path],
+    max_versions: Optional[List[str]] = None,
+    resolver: Optional[DependencyResolver] = None,
+    jobs: Optional[int] = None,
+) -> bool:
+    """Check that all symbols, that files import, are defined by the app or system libraries.
+
+    Symbol tables of all files and of libraries they link are read in parallel once and
+    merged into one index of exported symbols, so that every file is checked against it
+    without any external tool.
+
+    Args:
+        files (List[Path]): executables and libraries of the app
+        max_versions (Optional[List[str]]): maximal allowed versions, e.g. 'GLIBC_2.17'
+        resolver (Optional[DependencyResolver]): resolver to find linked system libraries
+        jobs (Optional[int]): number of workers, number of CPUs by default
+
+    Returns:
+        bool: True if all symbols are resolved and no file requires a too new version
+
+    Raises:
+        SymbolCheckError: maximal version has wrong format
+    """
+    limits = parse_max_versions(max_versions or [])
+    symbol_resolver = resolver if resolver is not None else DependencyResolver()
+    app_files = {os.path.realpath(file_path) for file_path in files}
+
+    def linked_system_libraries(file_path: Path) -> List[str]:
+        dependencies = symbol_resolver.dependencies(file_path)
+        if dependencies is None:
+            return []
+        libraries = [
+            os.path.realpath(library)
+            for library in dependencies.linked
+            if os.path.realpath(library) not in app_files
+        ]
+        elf_info = symbol_resolver.elf_info(os.path.normpath(file_path.absolute()))
+        if elf_info is not None and elf_info.interpreter is not None:
+            libraries.append(os.path.realpath(elf_info.interpreter))
+        return libraries
+
+    with ThreadPoolExecutor(
+        max_workers=jobs or default_jobs(), thread_name_prefix="symbols"
+    ) as executor:
+        with profiling.stage("read symbols"):
+            app_symbols = list(executor.map(_read_symbols, files))
+        with profiling.stage("find system libraries"):
+            system_libraries = sorted(
+                {
+                    library
+                    for libraries in executor.map(linked_system_libraries, files)
+                    for library in libraries
+                }
+            )
+        with profiling.stage("read symbols of system libraries"):
+            system_symbols = list(executor.map(_read_symbols, map(Path, system_libraries)))
+
+    index = SymbolIndex()
+    for symbols in app_symbols + system_symbols:
+        if symbols is not None:
+            index.add(symbols)
+    logger.debug(
+        f"Symbol index of {len(files)} app files and {len(system_libraries)} system libraries"
+    )
+
+    symbols_are_ok = True
+    max_versions_in_app: Dict[str, Tuple[Tuple[int, ...], str, Path]] = {}
+    with profiling.stage("check symbols"):
+        for symbols in app_symbols:
+            if symbols is None:
+                continue
+            result = check_file_symbols(symbols, index, limits)
+            if result.max_versions:
+                logger.debug(
+                    f"{result.file}: requires {', '.join(result.max_versions.values())}"
+                )
+            for prefix, version in result.max_versions.items():
+                parsed = parse_version(version)
+                if parsed is not None and (
+                    prefix not in max_versions_in_app
+                    or parsed[1] > max_versions_in_app[prefix][0]
+                ):
+                    max_versions_in_app[prefix] = (parsed[1], version, result.file)
+            if result.unresolved:
+                shown = ", ".join(result.unresolved[:MAX_LOGGED_SYMBOLS])
+                more = len(result.unresolved) - MAX_LOGGED_SYMBOLS
+                logger.error(
+                    f"{result.file}: {len(result.unresolved)} unresolved symbols: {shown}"
+                    + (f" and {more} more" if more > 0 else "")
+                )
+            if result.too_new:
+                logger.error(f"{result.file}: requires too new {', '.join(result.too_new)}")
+            symbols_are_ok = symbols_are_ok and result.ok
+
+    for prefix, (_, version, file_path) in sorted(max_versions_in_app.items()):
+        logger.info(f"Maximal required {prefix} version: {version} ({file_path})")
+    return symbols_are_ok
+
+
+def check_symbols(
+    bin_path: Path, max_versions: Optional[List[str]] = None, jobs: Optional[int] = None
+) -> None:
+    with profiling.stage("scan"):
+        manifest = scan_tree(bin_path)
+    try:
+        symbols_are_ok = check_symbols_in_files(
+            manifest.binaries, max_versions=max_versions, jobs=jobs
+        )
+    except SymbolCheckError as error:
+        logger.error(error)
+        exit(1)
+    if not symbols_are_ok:
+        logger.error("Symbol check failed, see logs above")
+        exit(1)
+    logger.success("All symbols are resolved")
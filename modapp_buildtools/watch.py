@@ -0,0 +1,236 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from pathlib import Path
+from platform import system
+from threading import Condition
+from typing import Any, Dict, List, Optional, Set
+
+from loguru import logger
+
+try:
+    from watchdog.observers import Observer  # type: ignore[import-not-found]
+except ImportError:  # optional backend for systems without inotify
+    Observer = None
+
+# events closer to each other are reported together, e.g. a library that is written by the
+# linker and then patched
+DEFAULT_DEBOUNCE = 0.1
+
+# from sys/inotify.h
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENT_HEADER = struct.Struct("iIII")
+_READ_SIZE = 64 * 1024
+
+
+class WatchError(Exception):
+    pass
+
+
+@dataclass
+class Changes:
+    # changed, created and removed files and directories
+    paths: Set[Path] = field(default_factory=set)
+    # events were lost, the whole tree must be rescanned
+    overflow: bool = False
+
+
+class FileWatcher(ABC):
+    """Recursive watcher of a directory tree.
+
+    Use it as a context manager and call `changes` in a loop. Events are collected until
+    there are no new ones for `debounce` seconds.
+
+    Args:
+        root (Path): watched directory
+        debounce (float): quiet time in seconds, that finishes a batch of changes
+    """
+
+    def __init__(self, root: Path, debounce: float = DEFAULT_DEBOUNCE) -> None:
+        self.root = root
+        self.debounce = debounce
+        self._pending = Changes()
+
+    def __enter__(self) -> "FileWatcher":
+        self.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.stop()
+
+    @abstractmethod
+    def start(self) -> None:
+        pass
+
+    @abstractmethod
+    def stop(self) -> None:
+        pass
+
+    @abstractmethod
+    def _poll(self, timeout: Optional[float]) -> bool:
+        # wait for events and add them to pending changes, False on timeout
+        pass
+
+    def changes(self, timeout: Optional[float] = None) -> Changes:
+        """Wait for the next batch of changes.
+
+        Args:
+            timeout (Optional[float]): maximal time to wait for the first event, forever if
+                                       it is None
+
+        Returns:
+            Changes: changes, empty on timeout
+        """
+        if self._poll(timeout):
+            while self._poll(self.debounce):
+                pass
+        changes, self._pending = self._pending, Changes()
+        return changes
+
+
+class InotifyWatcher(FileWatcher):
+    """Watcher based on Linux inotify, that is called through ctypes."""
+
+    def __init__(self, root: Path, debounce: float = DEFAULT_DEBOUNCE) -> None:
+        super().__init__(root, debounce)
+        libc = _load_libc()
+        if libc is None:
+            raise WatchError("inotify is not available")
+        self._libc: ctypes.CDLL = libc
+        self._fd = -1
+        # watch descriptor -> directory
+        self._dirs: Dict[int, Path] = {}
+
+    def start(self) -> None:
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            error = ctypes.get_errno()
+            raise WatchError(f"Failed to initialize inotify: {os.strerror(error)}")
+        self._watch_tree(self.root)
+
+    def stop(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+        self._fd = -1
+        self._dirs.clear()
+
+    def _watch_tree(self, directory: Path) -> List[Path]:
+        # watches are added to each directory, files found in new directories are returned:
+        # they could be created before the watch was added
+        files: List[Path] = []
+        for dir_path, _, file_names in os.walk(directory):
+            wd = self._libc.inotify_add_watch(
+                self._fd, os.fsencode(dir_path), WATCH_MASK | IN_ONLYDIR
+            )
+            if wd < 0:
+                error = ctypes.get_errno()
+                hint = " (see fs.inotify.max_user_watches)" if error == 28 else ""
+                logger.warning(f"Failed to watch {dir_path}: {os.strerror(error)}{hint}")
+                continue
+            self._dirs[wd] = Path(dir_path)
+            files += [Path(dir_path) / file_name for file_name in file_names]
+        return files
+
+    def _poll(self, timeout: Optional[float]) -> bool:
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return False
+        try:
+            data = os.read(self._fd, _READ_SIZE)
+        except BlockingIOError:
+            return False
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + length]
+            offset += _EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                self._pending.overflow = True
+                continue
+            directory = self._dirs.pop(wd, None) if mask & IN_IGNORED else self._dirs.get(wd)
+            if directory is None or mask & IN_IGNORED:
+                continue
+            path = directory / os.fsdecode(name.rstrip(b"\0"))
+            self._pending.paths.add(path)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self._pending.paths.update(self._watch_tree(path))
+        return True
+
+
+class WatchdogWatcher(FileWatcher):
+    """Watcher based on the optional watchdog package."""
+
+    def __init__(self, root: Path, debounce: float = DEFAULT_DEBOUNCE) -> None:
+        super().__init__(root, debounce)
+        if Observer is None:
+            raise WatchError("watchdog is not installed")
+        self._observer: Optional[Any] = None
+        self._events: Set[Path] = set()
+        self._condition = Condition()
+
+    def start(self) -> None:
+        self._observer = Observer()
+        self._observer.schedule(self, str(self.root), recursive=True)
+        self._observer.start()
+
+    def stop(self) -> None:
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+        self._observer = None
+
+    def dispatch(self, event: Any) -> None:
+        # called by the observer thread instead of an event handler
+        if event.event_type in ("opened", "closed_no_write"):
+            return
+        paths = [event.src_path] + ([event.dest_path] if getattr(event, "dest_path", "") else [])
+        with self._condition:
+            self._events.update(Path(os.fsdecode(path)) for path in paths)
+            self._condition.notify()
+
+    def _poll(self, timeout: Optional[float]) -> bool:
+        with self._condition:
+            if not self._events:
+                self._condition.wait(timeout)
+            if not self._events:
+                return False
+            self._pending.paths.update(self._events)
+            self._events.clear()
+        return True
+
+
+def _load_libc() -> Optional[ctypes.CDLL]:
+    if system() != "Linux":
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+    return libc if hasattr(libc, "inotify_init1") else None
+
+
+def create_watcher(root: Path, debounce: float = DEFAULT_DEBOUNCE) -> FileWatcher:
+    """Create watcher of the directory tree: inotify on Linux, watchdog otherwise.
+
+    Raises:
+        WatchError: neither inotify nor watchdog is available
+    """
+    if _load_libc() is not None:
+        return InotifyWatcher(root, debounce)
+    if Observer is not None:
+        return WatchdogWatcher(root, debounce)
+    raise WatchError("Watching requires Linux inotify or the watchdog package")
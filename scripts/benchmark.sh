@@ -0,0 +1,11 @@
+#!/bin/bash
+# Run benchmarks and compare them with the last saved run on this machine.
+# Tree sizes can be changed with BENCHMARK_SIZES, e.g. BENCHMARK_SIZES=100,1000
+
+poetry run python -m pytest benchmarks/ \
+    --benchmark-storage=benchmarks/baselines \
+    --benchmark-autosave \
+    --benchmark-compare \
+    --benchmark-compare-fail=mean:20% \
+    --benchmark-columns=min,mean,max,rounds \
+    "$@"
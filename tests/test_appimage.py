@@ -0,0 +1,93 @@
+import os
+
+import pytest
+
+from modapp_buildtools.appimage import (
+    AppImageError,
+    mksquashfs_command,
+    parse_size,
+    prepare_app_dir,
+    startup_files,
+    write_sort_file,
+)
+from modapp_buildtools.dependency_resolver import LoaderLookup
+from modapp_buildtools.options import Compressor
+
+
+class FakeResolver:
+    def __init__(self, lookups):
+        self._lookups = lookups
+
+    def lookups(self, path):
+        return self._lookups.get(path.name, [])
+
+
+def test__prepare_app_dir__and_startup_files(tmp_path):
+    usr = tmp_path / "usr"
+    files = [
+        "bin/app",
+        "bin/qt.conf",
+        "lib/libQt5Core.so.5",
+        "lib/libunused.so",
+        "lib/plugins/platforms/libqxcb.so",
+        "lib/libQt5XcbQpa.so.5",
+    ]
+    for relative_path in files:
+        (usr / relative_path).parent.mkdir(parents=True, exist_ok=True)
+        (usr / relative_path).write_bytes(b"")
+    (usr / "share" / "applications").mkdir(parents=True)
+    (usr / "share" / "applications" / "app.desktop").write_text(
+        "[Desktop Entry]\nExec=app %U\nIcon=app\n"
+    )
+    (tmp_path / "app.png").write_bytes(b"")
+
+    executable = prepare_app_dir(tmp_path)
+
+    assert executable == usr / "bin" / "app"
+    assert os.readlink(tmp_path / "AppRun") == "usr/bin/app"
+    assert os.readlink(tmp_path / "app.desktop") == "usr/share/applications/app.desktop"
+    assert os.readlink(tmp_path / ".DirIcon") == "app.png"
+
+    def found(relative_path):
+        return LoaderLookup("", "", str(usr / relative_path), 0)
+
+    resolver = FakeResolver(
+        {
+            "app": [found("lib/libQt5Core.so.5"), LoaderLookup("", "libc.so.6", "/lib/libc", 0)],
+            "libqxcb.so": [found("lib/libQt5XcbQpa.so.5"), found("lib/libQt5Core.so.5")],
+        }
+    )
+    order = startup_files(tmp_path, executable, resolver)
+
+    assert [file_path.as_posix() for file_path in order] == [
+        "usr/bin/app",
+        "usr/bin/qt.conf",
+        "usr/lib/libQt5Core.so.5",
+        "usr/lib/plugins/platforms/libqxcb.so",
+        "usr/lib/libQt5XcbQpa.so.5",
+    ]
+    write_sort_file(order, tmp_path / "sort")
+    assert (tmp_path / "sort").read_text().splitlines()[:2] == [
+        "usr/bin/app 32767",
+        "usr/bin/qt.conf 32766",
+    ]
+
+
+def test__mksquashfs_command(tmp_path):
+    command = mksquashfs_command(
+        tmp_path,
+        tmp_path / "image",
+        compressor=Compressor.ZSTD,
+        level=19,
+        block_size=parse_size("1M"),
+        processors=4,
+    )
+
+    assert command[command.index("-comp") + 1] == "zstd"
+    assert command[command.index("-Xcompression-level") + 1] == "19"
+    assert command[command.index("-b") + 1] == str(1024 * 1024)
+    assert command[command.index("-processors") + 1] == "4"
+    with pytest.raises(AppImageError):
+        mksquashfs_command(tmp_path, tmp_path / "image", compressor=Compressor.XZ, level=5)
+    with pytest.raises(AppImageError):
+        mksquashfs_command(tmp_path, tmp_path / "image", block_size=parse_size("3K"))
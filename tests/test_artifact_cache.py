@@ -0,0 +1,69 @@
+import os
+from pathlib import Path
+
+from modapp_buildtools import artifact_cache
+from modapp_buildtools.artifact_cache import ArtifactCache, cache_usage, evict
+
+# 64-bit little-endian ET_DYN
+ELF_HEADER = b"\x7fELF\x02\x01\x01" + b"\x00" * 9 + b"\x03\x00" + b"\x00" * 46
+
+
+def test__artifact_cache__links_stored_entries(tmp_path, monkeypatch):
+    qt_path = tmp_path / "qt"
+    (qt_path / "lib").mkdir(parents=True)
+    (qt_path / "lib" / "libQt5Core.so.5.15.2").write_bytes(ELF_HEADER + b"core")
+    plugin = qt_path / "plugins" / "platforms" / "libqxcb.so"
+    plugin.parent.mkdir(parents=True)
+    plugin.write_bytes(ELF_HEADER + b"plugin")
+    cache_dir = tmp_path / "cache"
+
+    def deploy(app_path: Path) -> ArtifactCache:
+        destination = app_path / "lib" / "plugins" / "platforms" / "libqxcb.so"
+        destination.parent.mkdir(parents=True)
+        cache = ArtifactCache(cache_dir, qt_path, app_path / "lib", jobs=1)
+        cache.copy(plugin, destination)
+        if cache.misses > 0:
+            # stands for rpath update, that happens between copying and storing
+            destination.write_bytes(ELF_HEADER + b"patched")
+        cache.store_pending()
+        return cache
+
+    first = deploy(tmp_path / "first")
+    second = deploy(tmp_path / "second")
+
+    assert (first.hits, first.misses) == (0, 1)
+    assert (second.hits, second.misses) == (1, 0)
+    second_plugin = tmp_path / "second" / "lib" / "plugins" / "platforms" / "libqxcb.so"
+    assert second_plugin.read_bytes() == ELF_HEADER + b"patched"
+    assert cache_usage(cache_dir).entries == 1
+
+
+def test__evict__removes_least_recently_used(tmp_path):
+    for index, name in enumerate(["aa1", "bb2", "cc3"]):
+        entry = tmp_path / "artifacts" / name[:2] / name
+        entry.parent.mkdir(parents=True)
+        entry.write_bytes(b"x" * 100)
+        os.utime(entry, (1000 + index, 1000 + index))
+
+    removed = evict(tmp_path, 250)
+
+    assert (removed.entries, removed.size) == (1, 100)
+    assert not (tmp_path / "artifacts" / "aa" / "aa1").exists()
+    assert evict(tmp_path, 0).entries == 2
+    assert cache_usage(tmp_path).entries == 0
+
+
+def test__evict__skips_entries_evicted_by_another_build(tmp_path, monkeypatch):
+    for name in ["aa1", "bb2"]:
+        entry = tmp_path / "artifacts" / name[:2] / name
+        entry.parent.mkdir(parents=True)
+        entry.write_bytes(b"x" * 100)
+    listed_entries = artifact_cache._entries(tmp_path)
+    # the other build removes the first entry after it is listed
+    os.unlink(listed_entries[0][0])
+    monkeypatch.setattr(artifact_cache, "_entries", lambda cache_dir: listed_entries)
+
+    removed = evict(tmp_path, 0)
+
+    assert (removed.entries, removed.size) == (1, 100)
+    assert [path for path in (tmp_path / "artifacts").rglob("*") if path.is_file()] == []
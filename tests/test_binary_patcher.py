@@ -0,0 +1,34 @@
+from modapp_buildtools.binary_patcher import EditPlan, _can_replace_string
+
+
+def test__edit_plan__add_rpaths_keeps_order_and_skips_duplicates():
+    plan = EditPlan()
+
+    plan.add_rpaths(["$ORIGIN/../lib", "/opt/lib"], ["/opt/lib", "$ORIGIN", "$ORIGIN"])
+
+    assert plan.rpath == ["$ORIGIN/../lib", "/opt/lib", "$ORIGIN"]
+
+
+def test__edit_plan__add_existing_rpath_is_empty():
+    plan = EditPlan()
+
+    plan.add_rpaths(["$ORIGIN/../lib"], ["$ORIGIN/../lib"])
+
+    assert plan.is_empty
+
+
+def test__can_replace_string__rejects_tail_merged_strings():
+    # "libfoo.so.1" is the tail of the symbol "xlibfoo.so.1", both share bytes
+    dynstr = b"\0xlibfoo.so.1\0libbar.so.2\0"
+    symbol, needed, other_needed = 1, 2, 14
+
+    assert not _can_replace_string(
+        dynstr, 0, {symbol, needed, other_needed}, needed, b"libfoo.so.1", b"libfoo.so"
+    )
+    assert not _can_replace_string(
+        dynstr, 0, {symbol, needed, other_needed}, symbol, b"xlibfoo.so.1", b"x"
+    )
+    assert _can_replace_string(
+        dynstr, 0, {symbol, needed, other_needed}, other_needed, b"libbar.so.2", b"libbar.so"
+    )
+    assert _can_replace_string(dynstr, 0, {other_needed}, needed, b"libfoo.so.1", b"libfoo.so")
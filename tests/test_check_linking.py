@@ -0,0 +1,165 @@
+import json
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+from platform import system
+
+import pytest
+
+from modapp_buildtools import check_linking
+
+from modapp_buildtools.check_linking import (
+    _parse_ldd_output,
+    check_file_linking_task,
+    check_linking_in_files,
+)
+from modapp_buildtools.dependency_resolver import DependencyResolver, LinkedLibraries
+from modapp_buildtools.library_index import AmbiguousLibraryError, LibraryIndex
+from modapp_buildtools.linking_cache import LinkingCache, linking_cache_path
+from modapp_buildtools.linking_report import AppliedFix, LinkingStatus
+
+
+@pytest.mark.skipif(
+    system() != "Linux" or shutil.which("ldd") is None, reason="ldd is required"
+)
+def test__dependency_resolver__same_as_ldd():
+    python_path = Path(sys.executable).resolve()
+    ldd_output = subprocess.run(
+        ["ldd", str(python_path)], capture_output=True, text=True, check=True
+    ).stdout
+    linked_libs, not_found_libs = _parse_ldd_output(ldd_output)
+
+    dependencies = DependencyResolver().dependencies(python_path)
+
+    assert dependencies is not None
+    assert sorted(dependencies.linked) == sorted(linked_libs)
+    assert sorted(dependencies.not_found) == sorted(not_found_libs)
+
+
+def test__library_index__finds_versioned_library_and_reports_ambiguity(tmp_path):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    qt_core = tmp_path / "a" / "libQt5Core.so.5.15.3"
+    qt_core.write_bytes(b"qt core")
+    first_gui = tmp_path / "a" / "libQt5Gui.so.5"
+    first_gui.write_bytes(b"first")
+    second_gui = tmp_path / "b" / "libQt5Gui.so.5"
+    second_gui.write_bytes(b"second")
+
+    index = LibraryIndex([qt_core, first_gui, second_gui])
+
+    assert index.find("libQt5Core.so.5") == qt_core
+    assert index.find("libQt5Widgets.so.5") is None
+    with pytest.raises(AmbiguousLibraryError):
+        index.find("libQt5Gui.so.5")
+
+
+def test__linking_cache__reuses_verdict_of_unchanged_file(tmp_path):
+    checked_file = tmp_path / "app" / "libfoo.so"
+    checked_file.parent.mkdir()
+    checked_file.write_bytes(b"foo")
+    dependency = tmp_path / "libbar.so"
+    dependency.write_bytes(b"bar")
+    cache_path = linking_cache_path(checked_file.parent)
+
+    cache = LinkingCache(cache_path, context={"fix": False})
+    cache.store(checked_file, [str(dependency)])
+    cache.save()
+
+    cache = LinkingCache(cache_path, context={"fix": False})
+    cache.load()
+    assert cache.is_unchanged(checked_file)
+
+    dependency.write_bytes(b"changed")
+    assert not cache.is_unchanged(checked_file)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    other_context_cache = LinkingCache(cache_path, context={"fix": True})
+    other_context_cache.load()
+    assert not other_context_cache.is_unchanged(checked_file)
+
+
+class SlowResolver:
+    def dependencies(self, path):
+        if path.name == "broken":
+            return LinkedLibraries(linked=[], not_found=["libmissing.so"])
+        time.sleep(0.5)
+        return LinkedLibraries(linked=["/lib/libc.so.6"], not_found=[])
+
+
+@pytest.mark.skipif(system() != "Linux", reason="dependency resolver is used only on Linux")
+def test__check_linking_in_files__reports_and_fails_fast(tmp_path):
+    files = [tmp_path / name for name in ("broken", "first", "second", "third")]
+    for file_path in files:
+        file_path.write_bytes(b"")
+    report_path = tmp_path / "report.jsonl"
+
+    linking_is_ok = check_linking_in_files(
+        files,
+        tmp_path,
+        resolver=SlowResolver(),
+        jobs=1,
+        report_path=report_path,
+        fail_fast=True,
+    )
+
+    assert not linking_is_ok
+    records = [json.loads(line) for line in report_path.read_text().splitlines()]
+    # a check, that the worker has started before the cancellation, is finished and
+    # reported, the rest is cancelled
+    assert [record["file"] for record in records] in (["broken"], ["broken", "first"])
+    assert records[0]["status"] == "failed" and records[0]["missing"] == ["libmissing.so"]
+    for record in records[1:]:
+        assert record["status"] == "ok" and record["resolved"] == ["/lib/libc.so.6"]
+
+
+@pytest.mark.skipif(system() != "Linux", reason="dependency resolver is used only on Linux")
+def test__check_file_linking_task__accepts_allowed_libs(tmp_path):
+    file_path = tmp_path / "first"
+    file_path.write_bytes(b"")
+
+    allowed = check_file_linking_task(file_path, tmp_path, ["libc.so*"], resolver=SlowResolver())
+    not_allowed = check_file_linking_task(file_path, tmp_path, [], resolver=SlowResolver())
+
+    assert allowed.status == LinkingStatus.OK
+    assert not_allowed.status == LinkingStatus.FAILED
+
+
+class FixableResolver:
+    # the file links its library only after it is fixed, if the fix works
+    def __init__(self, library, fix_works):
+        self.library, self.fix_works, self.fixed = library, fix_works, False
+
+    def dependencies(self, path):
+        if self.fixed and self.fix_works:
+            return LinkedLibraries(linked=[str(self.library)], not_found=[])
+        return LinkedLibraries(linked=[], not_found=[self.library.name])
+
+    def invalidate(self, path=None):
+        self.fixed = True
+
+
+@pytest.mark.skipif(system() != "Linux", reason="dependency resolver is used only on Linux")
+@pytest.mark.parametrize("fix_works", [True, False])
+def test__check_file_linking_task__caches_only_verified_fix(tmp_path, monkeypatch, fix_works):
+    file_path = tmp_path / "app"
+    file_path.write_bytes(b"app")
+    library = tmp_path / "lib" / "libfoo.so"
+    library.parent.mkdir()
+    library.write_bytes(b"foo")
+    monkeypatch.setattr(check_linking, "_try_fix", lambda **kwargs: (True, AppliedFix()))
+    cache = LinkingCache(tmp_path / "cache.json", context={"fix": True})
+
+    result = check_file_linking_task(
+        file_path,
+        tmp_path,
+        available_libs=LibraryIndex([library]),
+        fix=True,
+        resolver=FixableResolver(library, fix_works),
+        cache=cache,
+    )
+
+    assert result.status == (LinkingStatus.FIXED if fix_works else LinkingStatus.FAILED)
+    assert cache.is_unchanged(file_path) == fix_works
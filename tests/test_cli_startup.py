@@ -0,0 +1,84 @@
+import subprocess
+import sys
+from typing import Dict, List
+
+import pytest
+from typer.testing import CliRunner
+
+from modapp_buildtools.cli import app
+
+# import time of modules, that are not imported by typer itself, as a share of the import
+# time of typer: both are measured in the same run and scale with the speed of the machine
+IMPORT_TIME_BUDGET = 0.1
+# implementations of commands, that must not be imported if they are not executed
+HEAVY_MODULES = [
+    "modapp_buildtools.check_linking",
+    "modapp_buildtools.dependency_resolver",
+    "modapp_buildtools.deploy_qt",
+    "modapp_buildtools.predeploy",
+    "modapp_buildtools.symbol_check",
+    "modapp_buildtools.linking_watch",
+    "loguru",
+]
+
+
+def import_times(code: str, *args: str) -> Dict[str, int]:
+    # `-X importtime` writes "import time: self [us] | cumulative | imported package"
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code, *args],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times: Dict[str, int] = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, _, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(self_time)
+    return times
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ["--help"],
+        ["check-linking", "--help"],
+        ["check-symbols", "--help"],
+        ["deploy-qt", "--help"],
+        ["predeploy", "--help"],
+        ["normalize-rpath", "--help"],
+        ["appimage", "--help"],
+        ["cache", "prune", "--help"],
+        ["appimage-qt-post-deploy"],
+    ],
+)
+def test__cli_startup__is_within_budget(args: List[str], tmp_path):
+    if args == ["appimage-qt-post-deploy"]:
+        (tmp_path / "lib64").mkdir()
+        args = args + [str(tmp_path)]
+    typer_times = import_times("import typer")
+
+    times = import_times("from modapp_buildtools.cli import app; app()", *args)
+
+    assert [module for module in HEAVY_MODULES if module in times] == []
+    own_time = sum(time for module, time in times.items() if module not in typer_times)
+    assert own_time < IMPORT_TIME_BUDGET * sum(typer_times.values())
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ["check-linking", "--report", "report.json"],
+        ["check-linking", "--fail-fast"],
+        ["check-linking", "--no-cache"],
+        ["deploy-qt", "qt", "--report", "report.json"],
+        ["deploy-qt", "qt", "--fail-fast"],
+    ],
+)
+def test__watch__rejects_ignored_options(args: List[str], tmp_path):
+    command, *options = args
+    result = CliRunner().invoke(app, [command, str(tmp_path), *options, "--watch"])
+
+    assert result.exit_code == 2
+    assert "cannot be used with --watch" in result.output
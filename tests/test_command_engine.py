@@ -0,0 +1,23 @@
+import sys
+
+from modapp_buildtools.command_engine import CommandEngine
+
+
+def test__command_engine__runs_commands_concurrently():
+    engine = CommandEngine(jobs=2)
+
+    results = engine.run_many(
+        [[sys.executable, "-c", f"print({index}); exit({index})"] for index in range(3)]
+    )
+
+    assert [result.exit_code for result in results] == [0, 1, 2]
+    assert [result.output.strip() for result in results] == ["0", "1", "2"]
+
+
+def test__command_engine__kills_command_after_timeout():
+    engine = CommandEngine(jobs=1)
+
+    result = engine.run([sys.executable, "-c", "import time; time.sleep(10)"], timeout=0.2)
+
+    assert result.timed_out
+    assert not result.ok
@@ -0,0 +1,65 @@
+import os
+
+from modapp_buildtools.dedupe import LinkMode, dedupe_files
+from modapp_buildtools.dependency_resolver import LoaderLookup
+
+
+class FakeResolver:
+    def __init__(self, lookups):
+        self._lookups = lookups
+
+    def lookups(self, path):
+        return self._lookups.get(path.parent.name, [])
+
+    def invalidate(self, path=None):
+        pass
+
+
+def test__dedupe_files(tmp_path):
+    content = os.urandom(8192)
+    files = {
+        "lib/libfoo.so.5": content,
+        "lib/libfoo.so.5.15.2": content,
+        "lib/plugins/libfoo.so.5": content,
+        "lib/rpath/libfoo.so.5": content,
+        "lib/other.so": os.urandom(8192),
+        "small.txt": b"small",
+        "lib/small.txt": b"small",
+    }
+    for relative_path, file_content in files.items():
+        (tmp_path / relative_path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / relative_path).write_bytes(file_content)
+    resolver = FakeResolver(
+        {
+            # $ORIGIN-relative rpath finds another libbar.so from this directory
+            "rpath": [LoaderLookup("libfoo.so.5", "libbar.so", str(tmp_path / "libbar.so"), 0)],
+        }
+    )
+
+    result = dedupe_files([tmp_path / path for path in files], resolver=resolver)
+
+    assert {
+        duplicate.relative_to(tmp_path).as_posix(): os.readlink(duplicate)
+        for duplicate in result.replaced
+    } == {
+        "lib/libfoo.so.5.15.2": "libfoo.so.5",
+        "lib/plugins/libfoo.so.5": "../libfoo.so.5",
+    }
+    assert result.kept == [tmp_path / "lib" / "rpath" / "libfoo.so.5"]
+    assert result.bytes_saved == 2 * 8192
+    assert (tmp_path / "lib" / "plugins" / "libfoo.so.5").read_bytes() == content
+
+
+def test__dedupe_files__hardlinks(tmp_path):
+    content = os.urandom(8192)
+    original, duplicate = tmp_path / "a" / "libfoo.so", tmp_path / "b" / "libfoo.so"
+    for file_path in (original, duplicate):
+        file_path.parent.mkdir()
+        file_path.write_bytes(content)
+
+    result = dedupe_files([original, duplicate], mode=LinkMode.HARDLINK)
+
+    assert list(result.replaced) == [duplicate]
+    assert os.path.samefile(original, duplicate) and not duplicate.is_symlink()
+    # already linked files are not deduplicated again
+    assert dedupe_files([original, duplicate], mode=LinkMode.HARDLINK).replaced == {}
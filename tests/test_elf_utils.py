@@ -0,0 +1,33 @@
+import sys
+from pathlib import Path
+from platform import system
+
+import pytest
+
+from modapp_buildtools.elf_utils import ElfError, read_dynamic_symbols, read_elf
+
+
+@pytest.mark.skipif(system() != "Linux", reason="ELF files are available only on Linux")
+def test__read_elf__python_executable():
+    elf_info = read_elf(Path(sys.executable).resolve())
+
+    assert elf_info is not None
+    assert elf_info.has_dynamic
+    assert any(needed.startswith("libc.so") for needed in elf_info.needed)
+
+
+def test__read_elf__not_elf(tmp_path):
+    text_file = tmp_path / "libtext.so.1"
+    text_file.write_text("not an ELF file")
+
+    assert read_elf(text_file) is None
+
+
+def test__read_elf__truncated_header(tmp_path):
+    truncated_file = tmp_path / "libtruncated.so"
+    truncated_file.write_bytes(b"\x7fELF")
+
+    with pytest.raises(ElfError):
+        read_elf(truncated_file)
+    with pytest.raises(ElfError):
+        read_dynamic_symbols(truncated_file)
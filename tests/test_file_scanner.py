@@ -0,0 +1,37 @@
+import _ctypes
+import os
+import sys
+from pathlib import Path
+from platform import system
+from shutil import copyfile
+
+import pytest
+
+from modapp_buildtools.file_scanner import scan_tree
+
+
+@pytest.mark.skipif(system() != "Linux", reason="ELF files are available only on Linux")
+def test__scan_tree__classifies_files_by_content(tmp_path):
+    (tmp_path / "bin").mkdir()
+    (tmp_path / "lib").mkdir()
+    executable = tmp_path / "bin" / "app"
+    copyfile(Path(sys.executable).resolve(), executable)
+    executable.chmod(0o755)
+    # library without library suffix
+    library = tmp_path / "lib" / "ctypesmodule"
+    copyfile(_ctypes.__file__, library)
+    library_link = tmp_path / "lib" / "libctypes.so"
+    os.symlink(library, library_link)
+    # text file with library name
+    text_file = tmp_path / "lib" / "libtext.so.1"
+    text_file.write_text("not a library")
+    script = tmp_path / "bin" / "run"
+    script.write_text("#!/bin/sh\n")
+    script.chmod(0o755)
+    os.symlink(tmp_path / "missing", tmp_path / "lib" / "broken.so")
+
+    manifest = scan_tree(tmp_path)
+
+    assert manifest.executables == [executable]
+    assert manifest.shared_libraries == [library, library_link]
+    assert set(manifest.other_files) == {text_file, script}
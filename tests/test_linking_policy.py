@@ -0,0 +1,36 @@
+import pytest
+
+from modapp_buildtools.linking_policy import (
+    LinkingPolicy,
+    LinkingPolicyError,
+    available_profiles,
+    read_profile,
+)
+
+
+def test__linking_policy__patterns():
+    policy = LinkingPolicy(["libc", "libGL*.so*", "/opt/vendor/libfoo.so.1"])
+
+    assert policy.allows("/lib/x86_64-linux-gnu/libc.so.6")
+    assert policy.allows("/usr/lib/libcrypto.so.3")
+    assert policy.allows("/usr/lib/libGLX.so.0")
+    assert policy.allows("/opt/vendor/libfoo.so.1")
+    assert not policy.allows("/usr/lib/libfoo.so.1")
+    # glob patterns match the whole name
+    assert not policy.allows("/usr/lib/libGLX")
+    assert LinkingPolicy([]).allows("/lib/libc.so.6") is False
+
+
+def test__linking_policy__baseline_profiles():
+    assert {"appimage-excludelist", "manylinux2014"} <= set(available_profiles())
+    policy = LinkingPolicy.from_options(["libQt5"], ["manylinux2014"])
+
+    assert policy is not None
+    assert policy.allows("/lib64/ld-linux-x86-64.so.2")
+    assert policy.allows("/usr/lib/libglib-2.0.so.0")
+    assert policy.allows("/opt/qt/lib/libQt5Core.so.5")
+    assert not policy.allows("/usr/lib/libssl.so.3")
+    assert policy.digest != LinkingPolicy(read_profile("manylinux2014")).digest
+    assert LinkingPolicy.from_options() is None
+    with pytest.raises(LinkingPolicyError):
+        read_profile("unknown")
@@ -1,2 +1,64 @@
+import sys
+from pathlib import Path
+from platform import system
+from shutil import copyfile, which
+
+import pytest
+
+from modapp_buildtools.predeploy import predeploy_app
+
+
 def test__predeploy():
     assert 1 == 1
+
+
+def _tree(path: Path):
+    return {
+        str(file_path.relative_to(path)): file_path.read_bytes()
+        for file_path in sorted(path.rglob("*"))
+        if file_path.is_file()
+    }
+
+
+@pytest.mark.skipif(
+    system() != "Linux" or which("patchelf") is None, reason="patchelf is required"
+)
+def test__predeploy_app__incremental_is_the_same_as_clean(tmp_path):
+    app_path = tmp_path / "app"
+    (app_path / "data").mkdir(parents=True)
+    executable = app_path / "app"
+    copyfile(Path(sys.executable).resolve(), executable)
+    executable.chmod(0o755)
+    (app_path / "data" / "old.txt").write_text("old")
+    (app_path / "data" / "changed.txt").write_text("v1")
+
+    predeploy_app(app_path, tmp_path / "incremental", incremental=True)
+
+    (app_path / "data" / "old.txt").unlink()
+    (app_path / "data" / "changed.txt").write_text("v2")
+    (app_path / "data" / "new.txt").write_text("new")
+    # file changed in the output after predeploy is restored
+    (tmp_path / "incremental" / "AppDir" / "bin" / "app").write_bytes(b"broken")
+
+    predeploy_app(app_path, tmp_path / "incremental", incremental=True)
+    predeploy_app(app_path, tmp_path / "clean")
+
+    assert _tree(tmp_path / "incremental" / "AppDir") == _tree(tmp_path / "clean" / "AppDir")
+
+
+@pytest.mark.skipif(
+    system() != "Linux" or which("patchelf") is None or which("strip") is None,
+    reason="patchelf and strip are required",
+)
+def test__predeploy_app__incremental_after_option_change_is_the_same_as_clean(tmp_path):
+    app_path = tmp_path / "app"
+    app_path.mkdir()
+    executable = app_path / "app"
+    copyfile(Path(sys.executable).resolve(), executable)
+    executable.chmod(0o755)
+
+    predeploy_app(app_path, tmp_path / "incremental", incremental=True, strip=True)
+    predeploy_app(app_path, tmp_path / "incremental", incremental=True)
+    predeploy_app(app_path, tmp_path / "clean")
+
+    assert _tree(tmp_path / "incremental" / "AppDir") == _tree(tmp_path / "clean" / "AppDir")
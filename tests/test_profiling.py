@@ -0,0 +1,44 @@
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from modapp_buildtools import profiling
+from modapp_buildtools.command_engine import run_command
+
+
+def test__profile__writes_summary_and_trace(tmp_path):
+    summary_path = tmp_path / "profile.json"
+
+    with profiling.profile(summary_path, "command"):
+        with profiling.stage("scan"):
+            profiling.add_bytes_copied(10)
+        with profiling.stage("check"), ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="check"
+        ) as executor:
+
+            def task(index: int) -> None:
+                with profiling.task("check", str(index)):
+                    run_command([sys.executable, "-c", "pass"])
+
+            list(executor.map(task, range(4)))
+
+    summary = json.loads(summary_path.read_text())
+    assert set(summary["stages"]) == {"command", "command > scan", "command > check"}
+    assert summary["commands"][sys.executable.rsplit("/", 1)[-1]]["count"] == 4
+    assert summary["bytes_copied"] == 10
+    check_pool = summary["pools"]["check"]
+    assert check_pool["tasks"] == 4
+    assert all(0 < worker["utilization"] <= 1 for worker in check_pool["workers"].values())
+
+    trace = json.loads(profiling.trace_path(summary_path).read_text())
+    slices = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+    # 3 stages, 4 tasks and 4 commands
+    assert len(slices) == 11
+
+
+def test__profile__disabled():
+    with profiling.profile(None, "command") as profiler:
+        with profiling.stage("scan"):
+            profiling.add_bytes_copied(10)
+    assert profiler is None
+    assert profiling.get_profiler() is None
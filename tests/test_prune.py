@@ -0,0 +1,65 @@
+from modapp_buildtools.dependency_resolver import LinkedLibraries
+from modapp_buildtools.file_scanner import FileKind, FileManifest, ScannedFile
+from modapp_buildtools.prune import PruneResult, find_unused_libraries
+
+
+class FakeResolver:
+    def __init__(self, dependencies):
+        self._dependencies = dependencies
+
+    def dependencies(self, path):
+        linked, not_found = self._dependencies.get(path.name, ([], []))
+        return LinkedLibraries(linked=linked, not_found=not_found)
+
+
+def test__find_unused_libraries(tmp_path):
+    app_path = tmp_path / "app"
+    files = {
+        "bin/app": FileKind.EXECUTABLE,
+        "lib/liba.so": FileKind.SHARED_LIBRARY,
+        "lib/libb.so": FileKind.SHARED_LIBRARY,
+        "lib/libunused.so": FileKind.SHARED_LIBRARY,
+        "lib/libdlopen.so": FileKind.SHARED_LIBRARY,
+        "lib/plugins/platforms/libqxcb.so": FileKind.SHARED_LIBRARY,
+        "lib/libxcbqpa.so": FileKind.SHARED_LIBRARY,
+        "lib/_ssl.so": FileKind.SHARED_LIBRARY,
+        "share/icon.png": FileKind.OTHER,
+    }
+    manifest = FileManifest(app_path)
+    for relative_path, kind in files.items():
+        file_path = app_path / relative_path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_bytes(b"\0" * 1024)
+        manifest.entries.append(ScannedFile(file_path, kind, size=1024, mtime_ns=0, mode=0))
+    resolver = FakeResolver(
+        {
+            # libb.so is not found from the current location, it is found by name
+            "app": ([str(app_path / "lib" / "liba.so"), "/usr/lib/libc.so.6"], ["libb.so"]),
+            "libqxcb.so": ([str(app_path / "lib" / "libxcbqpa.so")], []),
+        }
+    )
+
+    result = find_unused_libraries(
+        manifest, app_path, resolver=resolver, keep_patterns=["libdlopen*"]
+    )
+
+    assert [entry.path.relative_to(app_path).as_posix() for entry in result.removed] == [
+        "lib/libunused.so"
+    ]
+    assert result.bytes_saved == 1024
+    assert len(result.kept) == len(files) - 1
+
+
+def test__prune_result__counts_symlink_chain_once(tmp_path):
+    def library(name, is_symlink):
+        return ScannedFile(tmp_path / name, FileKind.SHARED_LIBRARY, 1000, 0, 0o755, is_symlink)
+
+    result = PruneResult(
+        removed=[
+            library("libfoo.so", True),
+            library("libfoo.so.1", True),
+            library("libfoo.so.1.2.3", False),
+        ]
+    )
+
+    assert result.bytes_saved == 1000
@@ -0,0 +1,62 @@
+from modapp_buildtools.qml_scanner import QmlImportScanner, find_used_qml_modules
+
+
+def _create_module(qt_qml_dir, module_dir, qmldir, files=None):
+    (qt_qml_dir / module_dir).mkdir(parents=True)
+    (qt_qml_dir / module_dir / "qmldir").write_text(qmldir)
+    for name, content in (files or {}).items():
+        (qt_qml_dir / module_dir / name).write_text(content)
+
+
+def _create_qt_qml_dir(tmp_path):
+    qt_qml_dir = tmp_path / "qt" / "qml"
+    _create_module(qt_qml_dir, "QtQuick.2", "module QtQuick\nplugin qtquick2plugin\n")
+    _create_module(
+        qt_qml_dir,
+        "QtQuick/Controls.2",
+        "module QtQuick.Controls\nplugin qtquickcontrols2plugin\ndepends QtQuick.Templates 2.5\n",
+        {"Button.qml": "import QtQuick 2.12\nimport QtQuick.Controls.impl 2.12\n"},
+    )
+    _create_module(qt_qml_dir, "QtQuick/Templates.2", "module QtQuick.Templates\n")
+    _create_module(qt_qml_dir, "QtQuick/Controls.2/impl", "module QtQuick.Controls.impl\n")
+    _create_module(qt_qml_dir, "QtQuick/Controls.2/Material", "module QtQuick.Controls.Material\n")
+    _create_module(qt_qml_dir, "QtMultimedia", "module QtMultimedia\n")
+    return qt_qml_dir
+
+
+def test__qml_import_scanner__follows_imports_transitively(tmp_path):
+    qt_qml_dir = _create_qt_qml_dir(tmp_path)
+    qml_dir = tmp_path / "app" / "qml"
+    (qml_dir / "pages").mkdir(parents=True)
+    (qml_dir / "main.qml").write_text(
+        'import QtQuick 2.15\nimport QtQuick.Controls 2.15 as C\nimport "pages"\n'
+    )
+    (qml_dir / "pages" / "Page.qml").write_text("import App.Models 1.0\n")
+
+    modules = QmlImportScanner(qt_qml_dir).scan(qml_dir)
+
+    assert sorted(str(module) for module in modules) == [
+        "QtQuick.2",
+        "QtQuick/Controls.2",
+        "QtQuick/Controls.2/impl",
+        "QtQuick/Templates.2",
+    ]
+
+
+def test__find_used_qml_modules__uses_cache_until_sources_change(tmp_path, mocker):
+    qt_qml_dir = _create_qt_qml_dir(tmp_path)
+    qml_dir = tmp_path / "app" / "qml"
+    qml_dir.mkdir(parents=True)
+    (qml_dir / "main.qml").write_text("import QtQuick 2.15\n")
+    cache_path = tmp_path / "qml-imports.json"
+    scan = mocker.spy(QmlImportScanner, "scan")
+
+    find_used_qml_modules(qml_dir, qt_qml_dir, cache_path)
+    modules = find_used_qml_modules(qml_dir, qt_qml_dir, cache_path)
+    assert scan.call_count == 1
+    assert [str(module) for module in modules] == ["QtQuick.2"]
+
+    (qml_dir / "main.qml").write_text("import QtMultimedia 5.15\n")
+    modules = find_used_qml_modules(qml_dir, qt_qml_dir, cache_path)
+    assert scan.call_count == 2
+    assert [str(module) for module in modules] == ["QtMultimedia"]
@@ -0,0 +1,82 @@
+import _ctypes
+from pathlib import Path
+from shutil import copyfile
+
+from modapp_buildtools.dependency_resolver import LinkedLibraries
+from modapp_buildtools.qt_plugins import deploy_qt_plugins, qt_modules
+
+
+class FakeResolver:
+    def __init__(self, dependencies):
+        self._dependencies = dependencies
+
+    def dependencies(self, path):
+        return LinkedLibraries(linked=self._dependencies.get(path.name, []))
+
+
+def _create_plugins(qt_plugins_dir, plugins):
+    for plugin in plugins:
+        plugin_path = qt_plugins_dir / plugin
+        plugin_path.parent.mkdir(parents=True, exist_ok=True)
+        copyfile(_ctypes.__file__, plugin_path)
+
+
+def test__qt_modules__from_library_names():
+    assert qt_modules(
+        ["/qt/lib/libQt5Gui.so.5", "libQt6Network.so.6.5.0", "libc.so.6", "QtSql"]
+    ) == {"Gui", "Network", "Sql"}
+
+
+def test__deploy_qt_plugins__infers_categories_transitively(tmp_path):
+    qt_plugins_dir = tmp_path / "qt" / "plugins"
+    _create_plugins(
+        qt_plugins_dir,
+        [
+            "platforms/libqxcb.so",
+            "platforms/libqeglfs.so",
+            "imageformats/libqjpeg.so",
+            "imageformats/libqsvg.so",
+            "xcbglintegrations/libqxcb-glx-integration.so",
+            "sqldrivers/libqsqlite.so",
+        ],
+    )
+    resolver = FakeResolver(
+        {
+            "app": ["/qt/lib/libQt5Gui.so.5", "/qt/lib/libQt5Core.so.5"],
+            "libqxcb.so": ["/qt/lib/libQt5XcbQpa.so.5"],
+        }
+    )
+    app_plugins_dir = tmp_path / "app" / "lib" / "plugins"
+
+    copied = deploy_qt_plugins(
+        qt_plugins_dir,
+        app_plugins_dir,
+        [Path("app")],
+        resolver,
+        exclude_plugins=["imageformats/libqsvg*"],
+    )
+
+    assert sorted(str(plugin.relative_to(app_plugins_dir)) for plugin in copied) == [
+        "imageformats/libqjpeg.so",
+        "platforms/libqxcb.so",
+        "xcbglintegrations/libqxcb-glx-integration.so",
+    ]
+
+
+def test__deploy_qt_plugins__explicit_plugins(tmp_path):
+    qt_plugins_dir = tmp_path / "qt" / "plugins"
+    _create_plugins(
+        qt_plugins_dir,
+        ["platforms/libqxcb.so", "platforms/libqeglfs.so", "sqldrivers/libqsqlite.so"],
+    )
+    app_plugins_dir = tmp_path / "app" / "lib" / "plugins"
+
+    copied = deploy_qt_plugins(
+        qt_plugins_dir,
+        app_plugins_dir,
+        [Path("app")],
+        FakeResolver({"app": ["/qt/lib/libQt5Sql.so.5"]}),
+        plugins=["platforms/libqeglfs.so"],
+    )
+
+    assert copied == [app_plugins_dir / "platforms" / "libqeglfs.so"]
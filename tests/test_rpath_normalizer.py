@@ -0,0 +1,100 @@
+from pathlib import Path
+
+from modapp_buildtools import rpath_normalizer
+from modapp_buildtools.dependency_resolver import LoaderLookup
+from modapp_buildtools.elf_utils import ElfInfo
+from modapp_buildtools.library_index import LibraryIndex
+from modapp_buildtools.rpath_normalizer import minimal_rpath, normalize_rpaths
+
+
+class FakeResolver:
+    def __init__(self, elf_info, dependencies):
+        self._elf_info = elf_info
+        self._dependencies = dependencies
+
+    def elf_info(self, path):
+        return self._elf_info
+
+    def direct_dependencies(self, path):
+        return self._dependencies
+
+
+def test__minimal_rpath(tmp_path):
+    app_path = tmp_path / "app"
+    executable = app_path / "bin" / "app"
+    missing_library = app_path / "lib" / "sub" / "libmissing.so"
+    missing_library.parent.mkdir(parents=True)
+    missing_library.write_bytes(b"library")
+    elf_info = ElfInfo(
+        executable,
+        elf_class=2,
+        little_endian=True,
+        machine=62,
+        elf_type=3,
+        has_dynamic=True,
+        rpath="/opt/qt/lib:$ORIGIN/../stale:/opt/unused",
+    )
+    lib_dir = str(app_path / "lib")
+    resolver = FakeResolver(
+        elf_info,
+        [
+            ("libQt5Core.so.5", "/opt/qt/lib/libQt5Core.so.5"),
+            ("liba.so", f"{lib_dir}/liba.so"),
+            ("libb.so", f"{lib_dir}/sub/libb.so"),
+            ("libc.so.6", "/lib/x86_64-linux-gnu/libc.so.6"),
+            ("libd.so", f"{lib_dir}/libd.so"),
+            # found by name among libraries of the app
+            ("libmissing.so", None),
+        ],
+    )
+
+    rpath = minimal_rpath(executable, app_path, resolver, LibraryIndex([missing_library]))
+
+    # the most used directories first, stale and system entries are dropped
+    assert rpath == ["$ORIGIN/../lib", "$ORIGIN/../lib/sub", "/opt/qt/lib"]
+    assert minimal_rpath(Path("not-elf"), app_path, FakeResolver(None, [])) is None
+
+
+class InheritedRpathResolver:
+    # the app finds libd.so of libl.so with its DT_RPATH, until libl.so gets DT_RUNPATH
+    def __init__(self, app, library):
+        self.app, self.library = app, library
+        self.library_is_rpath = True
+
+    def elf_info(self, path):
+        rpath = "/opt/d" if path == str(self.app) else "$ORIGIN"
+        return ElfInfo(Path(path), 2, True, 62, 3, has_dynamic=True, rpath=rpath)
+
+    def lookups(self, path):
+        libd = "/opt/d/libd.so" if self.library_is_rpath else None
+        if path == self.app:
+            return [
+                LoaderLookup(str(self.app), "libl.so", str(self.library), 0),
+                LoaderLookup(str(self.library), "libd.so", libd, 0),
+            ]
+        return [LoaderLookup(str(self.library), "libd.so", None, 0)]
+
+    def invalidate(self, path=None):
+        pass
+
+
+def test__normalize_rpaths__restores_loader_of_unchanged_file(tmp_path, monkeypatch):
+    app, library = tmp_path / "bin" / "app", tmp_path / "lib" / "libl.so"
+    resolver = InheritedRpathResolver(app, library)
+
+    def minimal(file_path, app_path, resolver, libraries):
+        return ["/opt/d"] if file_path == app else ["$ORIGIN"]
+
+    def apply(file_path, rpath, is_rpath):
+        if file_path == library:
+            resolver.library_is_rpath = is_rpath
+        return True
+
+    monkeypatch.setattr(rpath_normalizer, "minimal_rpath", minimal)
+    monkeypatch.setattr(rpath_normalizer, "_apply", apply)
+
+    result = normalize_rpaths([app, library], tmp_path, resolver=resolver, jobs=1)
+
+    assert result.changed == []
+    assert result.failed == [library]
+    assert resolver.library_is_rpath
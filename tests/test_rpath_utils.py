@@ -0,0 +1,28 @@
+import _ctypes
+from platform import system
+from shutil import copyfile, which
+
+import pytest
+
+from modapp_buildtools.rpath_utils import add_relative_rpaths_if_needed, get_rpaths
+
+
+@pytest.mark.skipif(
+    system() != "Linux" or which("patchelf") is None, reason="patchelf is required"
+)
+def test__add_relative_rpaths_if_needed__adds_rpath_per_directory(tmp_path):
+    lib_path = tmp_path / "lib"
+    files = []
+    for plugin_dir in ("plugins/platforms", "qml/QtQuick"):
+        (lib_path / plugin_dir).mkdir(parents=True)
+        for name in ("libfirst.so", "libsecond.so"):
+            file_path = lib_path / plugin_dir / name
+            copyfile(_ctypes.__file__, file_path)
+            files.append(file_path)
+
+    assert add_relative_rpaths_if_needed(files, lib_path, jobs=2)
+    # already updated files are not changed again
+    assert add_relative_rpaths_if_needed(files, lib_path, jobs=2)
+
+    for file_path in files:
+        assert get_rpaths(file_path).count("$ORIGIN/../..") == 1
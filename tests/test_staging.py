@@ -0,0 +1,31 @@
+import os
+
+from modapp_buildtools.staging import CopyStrategy, FileStager, StagedFile
+
+
+def test__file_stager__copies_files_and_counts_bytes(tmp_path):
+    source_dir = tmp_path / "app"
+    source_dir.mkdir()
+    library = source_dir / "libapp.so"
+    library.write_bytes(b"\x7fELF" + b"\0" * 100)
+    library.chmod(0o755)
+    resource = source_dir / "resource.txt"
+    resource.write_text("resource")
+    output_dir = tmp_path / "AppDir"
+    stager = FileStager(jobs=2)
+
+    stager.stage(
+        [
+            StagedFile(library, output_dir / "lib" / "libapp.so", patchable=True),
+            StagedFile(resource, output_dir / "share" / "data" / "resource.txt"),
+        ]
+    )
+
+    staged_library = output_dir / "lib" / "libapp.so"
+    assert staged_library.read_bytes() == library.read_bytes()
+    assert os.access(staged_library, os.X_OK)
+    # patchable files never share data with the source
+    assert staged_library.stat().st_ino != library.stat().st_ino
+    assert (output_dir / "share" / "data" / "resource.txt").read_text() == "resource"
+    assert sum(stager.bytes_by_strategy.values()) == 104 + 8
+    assert stager.files_by_strategy[CopyStrategy.HARDLINK] <= 1
@@ -0,0 +1,38 @@
+import _ctypes
+from platform import system
+from shutil import copyfile, which
+
+import pytest
+
+from modapp_buildtools.elf_utils import is_stripped, read_elf
+from modapp_buildtools.strip import debug_file_path, strip_binaries
+
+
+@pytest.mark.skipif(
+    system() != "Linux" or which("strip") is None or which("objcopy") is None,
+    reason="binutils are required",
+)
+def test__strip_binaries__keeps_linking_and_splits_debug_info(tmp_path):
+    app_path = tmp_path / "app"
+    library = app_path / "lib" / "libctypes.so"
+    library.parent.mkdir(parents=True)
+    copyfile(_ctypes.__file__, library)
+    if is_stripped(library):
+        pytest.skip("python extension modules are already stripped")
+    elf_info = read_elf(library)
+    debug_dir = tmp_path / "debug"
+
+    result = strip_binaries([library], app_path, debug_dir=debug_dir)
+
+    assert result.stripped == 1 and result.failed == []
+    assert result.size_after < result.size_before
+    assert is_stripped(library)
+    stripped_info = read_elf(library)
+    assert stripped_info.needed == elf_info.needed
+    assert stripped_info.rpath == elf_info.rpath and stripped_info.runpath == elf_info.runpath
+    debug_file = debug_dir / "lib" / "libctypes.so.debug"
+    assert debug_file_path(library, app_path, debug_dir) == debug_file
+    assert debug_file.is_file()
+
+    # already stripped files are not touched again
+    assert strip_binaries([library], app_path).skipped == 1
@@ -0,0 +1,52 @@
+import sys
+from pathlib import Path
+from platform import system
+
+import pytest
+
+from modapp_buildtools.elf_utils import DynamicSymbols, ImportedSymbol
+from modapp_buildtools.symbol_check import (
+    SymbolCheckError,
+    SymbolIndex,
+    check_file_symbols,
+    check_symbols_in_files,
+    parse_max_versions,
+)
+
+
+def test__check_file_symbols__unresolved_and_too_new_versions():
+    index = SymbolIndex()
+    index.add(
+        DynamicSymbols(
+            Path("libc.so.6"), exported=[("memcpy", "GLIBC_2.14"), ("printf", "GLIBC_2.2.5")]
+        )
+    )
+    index.add(DynamicSymbols(Path("libfoo.so"), exported=[("foo", None)]))
+    symbols = DynamicSymbols(
+        Path("app"),
+        imported=[
+            ImportedSymbol("memcpy", "GLIBC_2.14", "libc.so.6"),
+            ImportedSymbol("printf", "GLIBC_2.34", "libc.so.6"),
+            ImportedSymbol("foo"),
+            ImportedSymbol("bar"),
+            ImportedSymbol("__gmon_start__", weak=True),
+        ],
+        required_versions={"libc.so.6": ["GLIBC_2.14", "GLIBC_2.2.5", "GLIBC_PRIVATE"]},
+    )
+
+    result = check_file_symbols(symbols, index, parse_max_versions(["GLIBC_2.12"]))
+
+    assert result.unresolved == ["printf@GLIBC_2.34", "bar"]
+    assert result.max_versions == {"GLIBC": "GLIBC_2.14"}
+    assert result.too_new == ["GLIBC_2.14"]
+    assert not result.ok
+    with pytest.raises(SymbolCheckError):
+        parse_max_versions(["2.17"])
+
+
+@pytest.mark.skipif(system() != "Linux", reason="ELF files are available only on Linux")
+def test__check_symbols_in_files__python_executable():
+    executable = Path(sys.executable).resolve()
+
+    assert check_symbols_in_files([executable], jobs=2)
+    assert not check_symbols_in_files([executable], max_versions=["GLIBC_2.0"], jobs=2)
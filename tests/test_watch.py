@@ -0,0 +1,65 @@
+import threading
+import time
+from platform import system
+
+import pytest
+
+from modapp_buildtools import linking_watch
+from modapp_buildtools.dependency_resolver import LinkedLibraries
+from modapp_buildtools.library_index import LibraryIndex
+from modapp_buildtools.linking_watch import LinkingWatch
+from modapp_buildtools.watch import Changes, InotifyWatcher
+
+
+@pytest.mark.skipif(system() != "Linux", reason="inotify is available only on Linux")
+def test__inotify_watcher__reports_batch_of_changes(tmp_path):
+    with InotifyWatcher(tmp_path, debounce=0.05) as watcher:
+
+        def build():
+            time.sleep(0.1)
+            (tmp_path / "lib").mkdir()
+            (tmp_path / "lib" / "libfoo.so").write_bytes(b"foo")
+
+        thread = threading.Thread(target=build)
+        thread.start()
+        changes = watcher.changes(timeout=5)
+        thread.join()
+
+        assert changes.paths >= {tmp_path / "lib", tmp_path / "lib" / "libfoo.so"}
+        assert watcher.changes(timeout=0.05).paths == set()
+
+
+class FakeResolver:
+    def __init__(self, linked):
+        self._linked = linked
+
+    def dependencies(self, path):
+        return LinkedLibraries(linked=[str(library) for library in self._linked.get(path, [])])
+
+    def invalidate(self, path=None):
+        pass
+
+
+def test__linking_watch__rechecks_changed_files_and_dependents(tmp_path, monkeypatch):
+    app, libfoo, libbar = tmp_path / "app", tmp_path / "libfoo.so", tmp_path / "libbar.so"
+    for file_path in (app, libfoo, libbar):
+        file_path.write_bytes(b"\x7fELF")
+    checked = []
+
+    def check_linking_in_files(files, app_path, failed_files, **kwargs):
+        checked.append(files)
+        failed_files += [file_path for file_path in files if file_path == libbar]
+        return libbar not in files
+
+    monkeypatch.setattr(linking_watch, "check_linking_in_files", check_linking_in_files)
+    resolver = FakeResolver({app: [libfoo, libbar], libfoo: [libbar]})
+    watch = LinkingWatch(tmp_path, [app, libfoo, libbar], resolver, LibraryIndex())
+    watch.check([app, libfoo, libbar])
+
+    # nothing changed since the check, e.g. fixes of the check itself
+    assert watch.files_to_recheck(Changes({libfoo, tmp_path / "README"})) == []
+    libfoo.write_bytes(b"\x7fELF changed")
+    # libbar failed before and is checked again
+    assert watch.files_to_recheck(Changes({libfoo})) == [app, libbar, libfoo]
+    libbar.unlink()
+    assert watch.files_to_recheck(Changes({libbar})) == [app, libfoo]